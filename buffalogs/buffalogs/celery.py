@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buffalogs.settings.settings")
@@ -19,6 +20,14 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # each prefork child creates its own elasticsearch client at startup, instead of at the first task
+    from impossible_travel.modules.elastic_client import get_elastic_client
+
+    get_elastic_client()
+
+
 # Dump requests
 @app.task(bind=True)
 def debug_task(self):
@@ -29,6 +29,24 @@ CERTEGO_BUFFALOGS_IGNORED_ISPS = []
 CERTEGO_BUFFALOGS_VIP_USERS = []
 CERTEGO_BUFFALOGS_DISTANCE_KM_ACCEPTED = 100
 CERTEGO_BUFFALOGS_VEL_TRAVEL_ACCEPTED = 300
+# Distances of the impossible travel checks: "geodesic" computes the exact geodesic distance only for the travels that can exceed the thresholds
+# (screened with the haversine distance), "haversine" uses the haversine distance for all of them
+CERTEGO_BUFFALOGS_DISTANCE_MODE = os.environ.get("BUFFALOGS_DISTANCE_MODE", "geodesic")
+# LRU cache of the geodesic distances of each process: max number of location pairs (0 to disable it) and decimal digits of the coordinates of the pairs
+CERTEGO_BUFFALOGS_DISTANCE_CACHE_SIZE = int(os.environ.get("BUFFALOGS_DISTANCE_CACHE_SIZE", 100000))
+CERTEGO_BUFFALOGS_DISTANCE_CACHE_PRECISION = int(os.environ.get("BUFFALOGS_DISTANCE_CACHE_PRECISION", 6))
+# Alias of the Django cache used to share the distances between the processes, empty to keep them only in the cache of each process
+CERTEGO_BUFFALOGS_DISTANCE_CACHE_SHARED_ALIAS = os.environ.get("BUFFALOGS_DISTANCE_CACHE_SHARED_ALIAS", "")
+# Skip the detectors whose alerts would be filtered anyway (types in Config.filtered_alerts_types, ignored users, ignored ips, allowed countries
+# and ignored ISPs), so those alerts are not saved at all
+CERTEGO_BUFFALOGS_SKIP_FILTERED_DETECTORS = os.environ.get("BUFFALOGS_SKIP_FILTERED_DETECTORS", "False").lower() == "true"
+# Count the calls, seconds and queries of each detector and log them for each user analyzed (debug only, it slows down the detection)
+CERTEGO_BUFFALOGS_DETECTOR_STATS = os.environ.get("BUFFALOGS_DETECTOR_STATS", "False").lower() == "true"
+# Collapse the runs of duplicate logins of a user (same index, ip, agent, country and coordinates) to their first and last login before the detection
+CERTEGO_BUFFALOGS_COMPACT_LOGINS = os.environ.get("BUFFALOGS_COMPACT_LOGINS", "False").lower() == "true"
+# Seconds the snapshot of the Config is reused by each process before checking if the Config changed (its version), 0 to check it at each read.
+# The changes made by the same process are seen immediately
+CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS = int(os.environ.get("BUFFALOGS_CONFIG_CACHE_SECONDS", 10))
 CERTEGO_BUFFALOGS_ATYPICAL_COUNTRY_DAYS = 30
 CERTEGO_BUFFALOGS_USER_MAX_DAYS = 60
 CERTEGO_BUFFALOGS_LOGIN_MAX_DAYS = 45
@@ -36,6 +54,45 @@ CERTEGO_BUFFALOGS_ALERT_MAX_DAYS = 45
 CERTEGO_BUFFALOGS_IP_MAX_DAYS = 45
 CERTEGO_BUFFALOGS_MOBILE_DEVICES = ["iOS", "Android", "Windows Phone"]
 
+# Elasticsearch client options: the client is created once per process and its connections are kept alive between the runs
+CERTEGO_BUFFALOGS_ELASTIC_CONNECTIONS_PER_NODE = int(os.environ.get("BUFFALOGS_ELASTIC_CONNECTIONS_PER_NODE", 10))
+CERTEGO_BUFFALOGS_ELASTIC_REQUEST_TIMEOUT = int(os.environ.get("BUFFALOGS_ELASTIC_REQUEST_TIMEOUT", 90))
+CERTEGO_BUFFALOGS_ELASTIC_MAX_RETRIES = int(os.environ.get("BUFFALOGS_ELASTIC_MAX_RETRIES", 3))
+CERTEGO_BUFFALOGS_ELASTIC_RETRY_ON_TIMEOUT = os.environ.get("BUFFALOGS_ELASTIC_RETRY_ON_TIMEOUT", "True").lower() == "true"
+CERTEGO_BUFFALOGS_ELASTIC_VERIFY_CERTS = os.environ.get("BUFFALOGS_ELASTIC_VERIFY_CERTS", "False").lower() == "true"
+# Discover the nodes of the elasticsearch cluster at startup and when a node fails
+CERTEGO_BUFFALOGS_ELASTIC_SNIFF = os.environ.get("BUFFALOGS_ELASTIC_SNIFF", "False").lower() == "true"
+
+# Ingestion mode: "per_user" runs a query for each user, "single_pass" scans all the logins of the time range once,
+# "async" runs the per-user queries concurrently with the async elasticsearch client, "aggregated" runs a query for each user fetching only
+# the first and the last login of each distinct (index, ip, agent, country) tuple of the user (the travels between the repeated tuples are not checked)
+CERTEGO_BUFFALOGS_INGESTION_MODE = os.environ.get("BUFFALOGS_INGESTION_MODE", "per_user")
+# Number of users fetched from elasticsearch for each composite aggregation page
+CERTEGO_BUFFALOGS_USERS_PAGE_SIZE = int(os.environ.get("BUFFALOGS_USERS_PAGE_SIZE", 1000))
+# Number of hits fetched from elasticsearch for each scroll page
+CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE = int(os.environ.get("BUFFALOGS_INGESTION_PAGE_SIZE", 1000))
+# Maximum number of logins of a user kept in memory before sending them to the detection
+CERTEGO_BUFFALOGS_INGESTION_MAX_BATCH_SIZE = int(os.environ.get("BUFFALOGS_INGESTION_MAX_BATCH_SIZE", 5000))
+# Maximum number of elasticsearch requests running at the same time in the "async" ingestion mode
+CERTEGO_BUFFALOGS_INGESTION_CONCURRENCY = int(os.environ.get("BUFFALOGS_INGESTION_CONCURRENCY", 10))
+# Maximum number of login pages waiting for the detection in the "async" ingestion mode
+CERTEGO_BUFFALOGS_INGESTION_QUEUE_SIZE = int(os.environ.get("BUFFALOGS_INGESTION_QUEUE_SIZE", 20))
+# Catch-up of the backlog: the windows are sized to take about CATCH_UP_WINDOW_SECONDS each and CATCH_UP_RUN_SECONDS in total for each run,
+# from the events counted in buckets of CATCH_UP_BUCKET_MINUTES and the measured throughput of the detection
+CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES = int(os.environ.get("BUFFALOGS_CATCH_UP_BUCKET_MINUTES", 5))
+CERTEGO_BUFFALOGS_CATCH_UP_MAX_WINDOW_MINUTES = int(os.environ.get("BUFFALOGS_CATCH_UP_MAX_WINDOW_MINUTES", 720))
+CERTEGO_BUFFALOGS_CATCH_UP_WINDOW_SECONDS = int(os.environ.get("BUFFALOGS_CATCH_UP_WINDOW_SECONDS", 300))
+CERTEGO_BUFFALOGS_CATCH_UP_RUN_SECONDS = int(os.environ.get("BUFFALOGS_CATCH_UP_RUN_SECONDS", 1800))
+# Maximum backlog recovered: older data is skipped
+CERTEGO_BUFFALOGS_MAX_BACKLOG_HOURS = int(os.environ.get("BUFFALOGS_MAX_BACKLOG_HOURS", 168))
+# Backfill of a past time range: size of the time windows and default number of parallel workers (each processing a shard of the users)
+CERTEGO_BUFFALOGS_BACKFILL_WINDOW_MINUTES = int(os.environ.get("BUFFALOGS_BACKFILL_WINDOW_MINUTES", 60))
+CERTEGO_BUFFALOGS_BACKFILL_WORKERS = int(os.environ.get("BUFFALOGS_BACKFILL_WORKERS", 4))
+# Number of shards in which the users of a time range are split, to be processed in parallel by the celery workers (0 or 1: no fan-out)
+CERTEGO_BUFFALOGS_DETECTION_SHARDS = int(os.environ.get("BUFFALOGS_DETECTION_SHARDS", 0))
+# Minutes after which the time ranges dispatched to the detection shards and not completed are dispatched again
+CERTEGO_BUFFALOGS_DETECTION_SHARDS_TIMEOUT_MINUTES = int(os.environ.get("BUFFALOGS_DETECTION_SHARDS_TIMEOUT_MINUTES", 180))
+
 if CERTEGO_BUFFALOGS_ENVIRONMENT == ENVIRONMENT_DOCKER:
     CERTEGO_ELASTICSEARCH = os.environ.get("CERTEGO_ELASTICSEARCH", "http://elasticsearch:9200")
     CERTEGO_BUFFALOGS_DB_HOSTNAME = "postgres"
@@ -58,3 +115,14 @@ elif CERTEGO_BUFFALOGS_ENVIRONMENT == ENVIRONMENT_DEBUG:
 
 else:
     raise ValueError(f"Environment not supported: {CERTEGO_BUFFALOGS_ENVIRONMENT}")
+
+# Celery result backend, needed only by the chord that joins the detection shards (BUFFALOGS_DETECTION_SHARDS > 1), empty to disable it.
+# With the shards, by default it is the postgres db, through SQLAlchemy (buffalogs[shards])
+CERTEGO_BUFFALOGS_CELERY_RESULT_BACKEND = os.environ.get(
+    "BUFFALOGS_CELERY_RESULT_BACKEND",
+    (
+        f"db+postgresql+psycopg://{CERTEGO_BUFFALOGS_POSTGRES_USER}:{CERTEGO_BUFFALOGS_POSTGRES_PASSWORD}@{CERTEGO_BUFFALOGS_DB_HOSTNAME}:{CERTEGO_BUFFALOGS_POSTGRES_PORT}/{CERTEGO_BUFFALOGS_POSTGRES_DB}"  # noqa: E231
+        if CERTEGO_BUFFALOGS_DETECTION_SHARDS > 1
+        else ""
+    ),
+)
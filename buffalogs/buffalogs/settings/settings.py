@@ -221,6 +221,9 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = None
 CELERY_BROKER_URL = CERTEGO_BUFFALOGS_RABBITMQ_URI
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = "celery.beat:PersistentScheduler"
+# the results are stored only by the tasks that need them (es. the detection shards joined by a chord), so without the shards there is no result backend.
+# Each task sets its own ignore_result
+CELERY_RESULT_BACKEND = CERTEGO_BUFFALOGS_CELERY_RESULT_BACKEND or None
 
 CELERY_BEAT_SCHEDULE = {
     "process_logs": {
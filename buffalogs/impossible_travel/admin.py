@@ -3,7 +3,7 @@ from django.contrib.admin.models import CHANGE, LogEntry
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from impossible_travel.forms import AlertAdminForm, ConfigAdminForm, UserAdminForm
-from impossible_travel.models import Alert, Config, Login, TaskSettings, User, UsersIP
+from impossible_travel.models import Alert, BackfillCheckpoint, Config, Login, TaskSettings, User, UserDetectionState, UsersIP
 
 
 @admin.register(Login)
@@ -37,7 +37,7 @@ class LoginAdmin(admin.ModelAdmin):
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     form = UserAdminForm
-    list_display = ("id", "username", "created", "updated", "get_risk_score_value")
+    list_display = ("id", "username", "created", "updated", "get_risk_score_value", "alert_count")
     search_fields = ("id", "username", "risk_score")
 
     @admin.display(description="risk_score")
@@ -78,6 +78,22 @@ class TaskSettingsAdmin(admin.ModelAdmin):
     search_fields = ("id", "task_name", "start_date")
 
 
+@admin.register(BackfillCheckpoint)
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("id", "created", "updated", "name", "shard", "shards", "start_date", "end_date", "processed_until")
+    search_fields = ("id", "name")
+
+
+@admin.register(UserDetectionState)
+class UserDetectionStateAdmin(admin.ModelAdmin):
+    list_display = ("id", "created", "updated", "get_username", "last_login_timestamp", "last_login_country")
+    search_fields = ("id", "user__username")
+
+    @admin.display(description="username")
+    def get_username(self, obj):
+        return obj.user.username
+
+
 @admin.register(Config)
 class ConfigsAdmin(admin.ModelAdmin):
     form = ConfigAdminForm
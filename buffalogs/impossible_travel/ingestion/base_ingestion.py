@@ -0,0 +1,149 @@
+import logging
+from abc import ABC, abstractmethod
+from enum import Enum
+
+from impossible_travel.modules.login_record import LoginRecord
+
+# painless script selecting the users of a shard, with the same hash of get_user_shard()
+USER_SHARD_SCRIPT = "Math.floorMod(doc['user.name'].value.hashCode(), params.shards) == params.shard"
+
+
+def get_user_shard(username, shards):
+    """Map the username to its shard with a stable hash (the builtin hash() is randomized per process),
+    so that each user is always processed by the same shard.
+    The hash is the Java String.hashCode() of the username, so the shard of the users can also be computed by elasticsearch (USER_SHARD_SCRIPT)
+
+    :param username: username to map
+    :type username: str
+    :param shards: number of shards
+    :type shards: int
+
+    :return: index of the shard
+    :rtype: int
+    """
+    code = 0
+    encoded = username.encode("utf-16-be")
+    for i in range(0, len(encoded), 2):
+        code = (31 * code + int.from_bytes(encoded[i : i + 2], "big")) & 0xFFFFFFFF
+    if code >= 0x80000000:
+        code -= 0x100000000
+    return code % shards
+
+
+class BaseIngestion(ABC):
+    """
+    Abstract base class for the ingestion sources of the logins.
+    """
+
+    class SupportedIngestionSources(Enum):
+        ELASTICSEARCH = "elasticsearch"
+        FILE = "file"
+
+    def __init__(self, ingestion_config):
+        super().__init__()
+        self.ingestion_config = ingestion_config
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    @abstractmethod
+    def iter_users_pages(self, start_date, end_date, shard=None, shards=None):
+        """
+        Get the users logged in between the time range.
+        Must be implemented by concrete classes.
+
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+        :param shard: if set, get only the users of this shard (see get_user_shard)
+        :type shard: int
+        :param shards: number of shards, required with shard
+        :type shards: int
+
+        :return: generator of lists of usernames
+        :rtype: generator
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_user_logins(self, username, start_date, end_date):
+        """
+        Get the successful logins of the user in the time range, from the oldest to the most recent one.
+        Must be implemented by concrete classes.
+
+        :param username: username of the user
+        :type username: str
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+
+        :return: generator of normalized logins
+        :rtype: generator
+        """
+        raise NotImplementedError
+
+    def iter_user_aggregated_logins(self, username, start_date, end_date):
+        """
+        Get the first and the last login of each distinct (index, ip, agent, country) tuple of the user in the time range,
+        from the oldest to the most recent one.
+        By default the aggregation isn't available, so all the logins of the user are returned
+
+        :param username: username of the user
+        :type username: str
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+
+        :return: generator of normalized logins
+        :rtype: generator
+        """
+        return self.iter_user_logins(username, start_date, end_date)
+
+    @abstractmethod
+    def iter_window_logins(self, start_date, end_date):
+        """
+        Get all the successful logins in the time range, grouped by user and, for each user, from the oldest to the most recent one.
+        Must be implemented by concrete classes.
+
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+
+        :return: generator of (username, iterable of normalized logins) tuples
+        :rtype: generator
+        """
+        raise NotImplementedError
+
+    def get_events_histogram(self, start_date, end_date):
+        """
+        Count the successful logins of the time range in buckets of CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES minutes.
+        By default no histogram is available, so the catch-up uses fixed time windows
+
+        :param start_date: start date of the histogram
+        :type start_date: datetime
+        :param end_date: end date of the histogram
+        :type end_date: datetime
+
+        :return: chronological buckets, as (bucket start, bucket end, events count) tuples
+        :rtype: list
+        """
+        return []
+
+    def normalize_hit(self, hit):
+        """Normalize a login hit into the LoginRecord used by the detection
+
+        :param hit: login hit
+        :type hit: elasticsearch_dsl.response.Hit
+
+        :return: normalized login, None if the hit has no geo info
+        :rtype: LoginRecord
+        """
+        return LoginRecord.from_source(hit.to_dict(), hit.meta["index"], hit.meta["id"])
+
+    def _normalize_hits(self, hits):
+        for hit in hits:
+            login = self.normalize_hit(hit)
+            if login:
+                yield login
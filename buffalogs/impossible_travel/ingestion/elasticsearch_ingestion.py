@@ -0,0 +1,251 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from elasticsearch_dsl import Search
+from impossible_travel.ingestion.base_ingestion import USER_SHARD_SCRIPT, BaseIngestion
+from impossible_travel.modules.elastic_client import get_elastic_client
+
+LOGIN_SOURCE_FIELDS = [
+    "user.name",
+    "@timestamp",
+    "source.geo.location.lat",
+    "source.geo.location.lon",
+    "source.geo.country_name",
+    "source.as.organization.name",
+    "user_agent.original",
+    "_index",
+    "source.ip",
+    "_id",
+    "source.intelligence_category",
+]
+
+
+class ElasticsearchIngestion(BaseIngestion):
+    """
+    Ingestion of the logins from the elasticsearch indexes of CERTEGO_BUFFALOGS_ELASTIC_INDEX.
+    """
+
+    def __init__(self, ingestion_config):
+        super().__init__(ingestion_config)
+        self.indexes = ingestion_config.get("indexes") or settings.CERTEGO_BUFFALOGS_ELASTIC_INDEX
+        # register the elasticsearch client of the process as the default elasticsearch_dsl connection
+        get_elastic_client()
+
+    def user_logins_search(self, username, start_date, end_date):
+        """Build the query of the successful logins of the user in the time range, from the oldest to the most recent one
+
+        :param username: username of the user
+        :type username: str
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+
+        :return: query of the user logins
+        :rtype: elasticsearch_dsl.Search
+        """
+        return (
+            Search(index=self.indexes)
+            .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
+            .query("match", **{"user.name": username})
+            .query("match", **{"event.outcome": "success"})
+            .query("match", **{"event.type": "start"})
+            .query("exists", field="source.ip")
+            .source(includes=LOGIN_SOURCE_FIELDS)
+            .sort("@timestamp")  # from the oldest to the most recent login
+        )
+
+    def users_page_search(self, start_date, end_date, after_key=None, shard=None, shards=None):
+        """Build the composite aggregation query of the page of users logged in between the time range that follows after_key.
+        If shard is set, the users of the other shards are excluded by the query, so each shard pages only its own users
+
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+        :param after_key: after_key of the previous page, None for the first page
+        :type after_key: dict
+        :param shard: if set, only the users of this shard
+        :type shard: int
+        :param shards: number of shards, required with shard
+        :type shards: int
+
+        :return: query of the users page
+        :rtype: elasticsearch_dsl.Search
+        """
+        s = (
+            Search(index=self.indexes)
+            .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
+            .query("match", **{"event.category": "authentication"})
+            .query("match", **{"event.outcome": "success"})
+            .query("match", **{"event.type": "start"})
+            .query("exists", field="user.name")
+            .extra(size=0)
+        )
+        if shard is not None:
+            s = s.filter("script", script={"source": USER_SHARD_SCRIPT, "params": {"shard": shard, "shards": shards}})
+        composite = {"sources": [{"username": {"terms": {"field": "user.name"}}}], "size": settings.CERTEGO_BUFFALOGS_USERS_PAGE_SIZE}
+        if after_key:
+            composite["after"] = after_key
+        s.aggs.bucket("login_user", "composite", **composite)
+        return s
+
+    def iter_users_pages(self, start_date, end_date, shard=None, shards=None):
+        """Get the users logged in between the time range, paginating them with a composite aggregation on user.name
+        in pages of CERTEGO_BUFFALOGS_USERS_PAGE_SIZE users, yielded as soon as each page is received
+        """
+        after_key = None
+        while True:
+            response = self.users_page_search(start_date, end_date, after_key, shard=shard, shards=shards).execute()
+            try:
+                buckets = response.aggregations.login_user.buckets
+            except AttributeError:
+                self.logger.info("No users login aggregation found")
+                return
+            if not buckets:
+                return
+            self.logger.info(f"Successfully got a page of {len(buckets)} users")
+            yield [bucket.key.username for bucket in buckets]
+            if "after_key" not in response.aggregations.login_user:
+                return
+            after_key = response.aggregations.login_user.after_key.to_dict()
+
+    def iter_user_logins(self, username, start_date, end_date):
+        """Stream the logins of the user with a scroll, in pages of CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE hits,
+        so there is no limit to the number of logins per user
+        """
+        s = self.user_logins_search(username, start_date, end_date).params(preserve_order=True, size=settings.CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE)
+        return self._normalize_hits(s.scan())
+
+    def user_aggregates_search(self, username, start_date, end_date, after_key=None):
+        """Build the composite aggregation query of the page of distinct (index, ip, agent, country) tuples of the user logins
+        in the time range that follows after_key, with the first and the last login of each tuple
+
+        :param username: username of the user
+        :type username: str
+        :param start_date: start date of analysis
+        :type start_date: datetime
+        :param end_date: finish date of analysis
+        :type end_date: datetime
+        :param after_key: after_key of the previous page, None for the first page
+        :type after_key: dict
+
+        :return: query of the page of the user login tuples
+        :rtype: elasticsearch_dsl.Search
+        """
+        s = self.user_logins_search(username, start_date, end_date).sort().extra(size=0)
+        composite = {
+            "sources": [
+                {"index": {"terms": {"field": "_index"}}},
+                {"ip": {"terms": {"field": "source.ip"}}},
+                {"agent": {"terms": {"field": "user_agent.original", "missing_bucket": True}}},
+                {"country": {"terms": {"field": "source.geo.country_name", "missing_bucket": True}}},
+            ],
+            "size": settings.CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE,
+        }
+        if after_key:
+            composite["after"] = after_key
+        tuples = s.aggs.bucket("login_tuple", "composite", **composite)
+        tuples.metric("first_login", "top_hits", size=1, sort=[{"@timestamp": {"order": "asc"}}], _source={"includes": LOGIN_SOURCE_FIELDS})
+        tuples.metric("last_login", "top_hits", size=1, sort=[{"@timestamp": {"order": "desc"}}], _source={"includes": LOGIN_SOURCE_FIELDS})
+        return s
+
+    def iter_user_aggregated_logins(self, username, start_date, end_date):
+        """Get only the first and the last login of each distinct (index, ip, agent, country) tuple of the user, aggregated by elasticsearch,
+        so the transferred logins are proportional to the distinct behaviour of the user instead of to its events.
+        The tuples are paginated with a composite aggregation, the logins are returned from the oldest to the most recent one
+        """
+        logins = {}
+        events_count = 0
+        after_key = None
+        while True:
+            response = self.user_aggregates_search(username, start_date, end_date, after_key).execute()
+            try:
+                buckets = response.aggregations.login_tuple.buckets
+            except AttributeError:
+                break
+            for bucket in buckets:
+                events_count += bucket.doc_count
+                # the first and the last login of a tuple with a single login are the same hit
+                for hit in [*bucket.first_login.hits, *bucket.last_login.hits]:
+                    login = self.normalize_hit(hit)
+                    if login:
+                        logins[hit.meta["id"]] = login
+            if not buckets or "after_key" not in response.aggregations.login_tuple:
+                break
+            after_key = response.aggregations.login_tuple.after_key.to_dict()
+        self.logger.info(f"Got {len(logins)} aggregated logins of {events_count} events for user {username}")
+        return iter(sorted(logins.values(), key=lambda login: login.timestamp_dt))
+
+    def iter_window_logins(self, start_date, end_date):
+        """Scan once all the successful logins in the time range, sorted by user and timestamp"""
+        s = (
+            Search(index=self.indexes)
+            .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
+            .query("match", **{"event.category": "authentication"})
+            .query("match", **{"event.outcome": "success"})
+            .query("match", **{"event.type": "start"})
+            .query("exists", field="user.name")
+            .query("exists", field="source.ip")
+            .source(includes=LOGIN_SOURCE_FIELDS)
+            .sort("user.name", "@timestamp")  # grouped by user, from the oldest to the most recent login
+            .params(preserve_order=True, size=settings.CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE)
+        )
+        for username, hits in groupby(s.scan(), key=lambda hit: hit["user"]["name"]):
+            yield username, self._normalize_hits(hits)
+
+    def events_histogram_search(self, start_date, end_date):
+        """Build the date_histogram query of the successful logins of the time range, in buckets of CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES minutes.
+        The buckets are aligned to start_date (offset) and limited to the time range (hard_bounds), so the first one doesn't start before start_date
+
+        :param start_date: start date of the histogram
+        :type start_date: datetime
+        :param end_date: end date of the histogram
+        :type end_date: datetime
+
+        :return: query of the histogram
+        :rtype: elasticsearch_dsl.Search
+        """
+        interval_seconds = settings.CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES * 60
+        s = (
+            Search(index=self.indexes)
+            .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
+            .query("match", **{"event.category": "authentication"})
+            .query("match", **{"event.outcome": "success"})
+            .query("match", **{"event.type": "start"})
+            .extra(size=0)
+        )
+        s.aggs.bucket(
+            "login_histogram",
+            "date_histogram",
+            field="@timestamp",
+            fixed_interval=f"{settings.CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES}m",
+            offset=f"{int(start_date.timestamp()) % interval_seconds}s",
+            min_doc_count=0,
+            extended_bounds={"min": start_date, "max": end_date},
+            hard_bounds={"min": start_date, "max": end_date},
+        )
+        return s
+
+    def get_events_histogram(self, start_date, end_date):
+        """Count the successful logins of the time range with a date_histogram aggregation.
+        The bucket containing end_date is excluded because still incomplete
+        """
+        interval = timedelta(minutes=settings.CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES)
+        s = self.events_histogram_search(start_date, end_date)
+        response = s.execute()
+        try:
+            buckets = response.aggregations.login_histogram.buckets
+        except AttributeError:
+            self.logger.info("No login histogram found")
+            return []
+        histogram = []
+        for bucket in buckets:
+            bucket_start = datetime.fromtimestamp(bucket.key / 1000, tz=end_date.tzinfo)
+            if bucket_start < start_date:
+                continue
+            if bucket_start + interval > end_date:
+                break
+            histogram.append((bucket_start, bucket_start + interval, bucket.doc_count))
+        return histogram
@@ -0,0 +1,156 @@
+import glob
+import json
+import mmap
+import os
+from collections import defaultdict
+from operator import attrgetter
+
+from django.conf import settings
+from django.utils import timezone
+from impossible_travel.ingestion.base_ingestion import BaseIngestion, get_user_shard
+from impossible_travel.modules.login_record import LoginRecord
+
+
+class FileIngestion(BaseIngestion):
+    """
+    Ingestion of the logins from local NDJSON or Parquet exports of the login events (ECS documents, nested or with dotted keys),
+    to replay archives offline.
+    The NDJSON files are read in chunks of `chunk_size` bytes from a memory map, the Parquet files in record batches of `batch_size` rows
+    from a memory map (it requires pyarrow).
+    The logins of a time range are loaded once, so the same instance can serve the users and then the logins of each user
+    """
+
+    NDJSON_EXTENSIONS = (".ndjson", ".jsonl", ".json")
+    PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+    def __init__(self, ingestion_config):
+        super().__init__(ingestion_config)
+        self.path = ingestion_config.get("path")
+        if not self.path:
+            raise ValueError("File ingestion path is required")
+        self.format = ingestion_config.get("format")
+        self.index = ingestion_config.get("index", "file")
+        self.chunk_size = int(ingestion_config.get("chunk_size", 16 * 1024 * 1024))
+        self.batch_size = int(ingestion_config.get("batch_size", 65536))
+        self._window = None
+        self._window_logins = {}
+
+    def iter_users_pages(self, start_date, end_date, shard=None, shards=None):
+        usernames = sorted(self._load_window(start_date, end_date))
+        if shard is not None:
+            usernames = [username for username in usernames if get_user_shard(username, shards) == shard]
+        page_size = settings.CERTEGO_BUFFALOGS_USERS_PAGE_SIZE
+        for i in range(0, len(usernames), page_size):
+            yield usernames[i : i + page_size]
+
+    def iter_user_logins(self, username, start_date, end_date):
+        return iter(self._load_window(start_date, end_date).get(username, []))
+
+    def iter_window_logins(self, start_date, end_date):
+        window_logins = self._load_window(start_date, end_date)
+        for username in sorted(window_logins):
+            yield username, iter(window_logins[username])
+
+    def _load_window(self, start_date, end_date):
+        """Read all the files once, keeping the successful logins of the time range grouped by user and sorted by timestamp"""
+        if timezone.is_naive(start_date):
+            start_date = timezone.make_aware(start_date)
+        if timezone.is_naive(end_date):
+            end_date = timezone.make_aware(end_date)
+        if self._window == (start_date, end_date):
+            return self._window_logins
+        logins = defaultdict(list)
+        for document in self._iter_documents():
+            if not self._is_login(document):
+                continue
+            if not isinstance(document["@timestamp"], str):
+                # e.g. parquet timestamp columns
+                document["@timestamp"] = document["@timestamp"].isoformat()
+            login = LoginRecord.from_source(document, document.get("_index", self.index), document.get("_id", document["event"].get("id", "")))
+            if login and start_date <= login.timestamp_dt < end_date:
+                logins[document["user"]["name"]].append(login)
+        self._window = (start_date, end_date)
+        self._window_logins = {username: sorted(user_logins, key=attrgetter("timestamp_dt")) for username, user_logins in logins.items()}
+        self.logger.info(f"Loaded the logins of {len(self._window_logins)} users from {start_date} to {end_date}")
+        return self._window_logins
+
+    def _is_login(self, document):
+        """Check if the document is a successful login with user.name and source.ip"""
+        event = document.get("event") or {}
+        if event.get("outcome") != "success" or "start" not in self._as_list(event.get("type")) or "authentication" not in self._as_list(event.get("category")):
+            return False
+        return bool((document.get("user") or {}).get("name") and (document.get("source") or {}).get("ip") and document.get("@timestamp"))
+
+    def _as_list(self, value):
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def _iter_documents(self):
+        paths = sorted(glob.glob(os.path.join(self.path, "*"))) if os.path.isdir(self.path) else sorted(glob.glob(self.path))
+        for path in paths:
+            file_format = self.format or self._get_format(path)
+            if file_format == "ndjson":
+                documents = self._iter_ndjson(path)
+            elif file_format == "parquet":
+                documents = self._iter_parquet(path)
+            else:
+                self.logger.warning(f"Skipping {path}: unsupported file format")
+                continue
+            for document in documents:
+                yield self._unflatten(document)
+
+    def _get_format(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in self.NDJSON_EXTENSIONS:
+            return "ndjson"
+        if extension in self.PARQUET_EXTENSIONS:
+            return "parquet"
+        return None
+
+    def _iter_ndjson(self, path):
+        """Read the NDJSON file from a memory map, parsing it in chunks of about chunk_size bytes split on the line boundaries"""
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = min(start + self.chunk_size, size)
+                if end < size:
+                    newline = mm.rfind(b"\n", start, end)
+                    if newline == -1:
+                        # a line longer than the chunk
+                        newline = mm.find(b"\n", end)
+                    end = size if newline == -1 else newline + 1
+                for line in mm[start:end].splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+                start = end
+
+    def _iter_parquet(self, path):
+        """Read the Parquet file from a memory map, in record batches of batch_size rows"""
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("pyarrow is required to read the Parquet files") from e
+
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=self.batch_size):
+            yield from batch.to_pylist()
+
+    def _unflatten(self, document):
+        """Convert the dotted keys (e.g. "source.ip") into nested dicts"""
+        if not any("." in key for key in document):
+            return document
+        nested = {}
+        for key, value in document.items():
+            if key.startswith("_") or "." not in key:
+                nested[key] = value
+                continue
+            current = nested
+            *parents, last = key.split(".")
+            for parent in parents:
+                current = current.setdefault(parent, {})
+            current[last] = value
+        return nested
@@ -0,0 +1,43 @@
+import json
+import os
+
+from django.conf import settings
+from impossible_travel.ingestion.base_ingestion import BaseIngestion
+from impossible_travel.ingestion.elasticsearch_ingestion import ElasticsearchIngestion
+from impossible_travel.ingestion.file_ingestion import FileIngestion
+
+
+class IngestionFactory:
+    def __init__(self) -> None:
+        config = self._read_config()
+        self.active_ingestion = BaseIngestion.SupportedIngestionSources(config["active_ingestion"])
+        self.ingestion_config = config[config["active_ingestion"]]
+
+    def _read_config(self) -> dict:
+        """
+        Read the configuration file.
+        """
+        with open(
+            os.path.join(settings.CERTEGO_BUFFALOGS_CONFIG_INGESTION_PATH, "ingestion.json"),
+            mode="r",
+            encoding="utf-8",
+        ) as f:
+            config = json.load(f)
+        if "active_ingestion" not in config:
+            raise ValueError("active_ingestion not found in ingestion.json")
+        if config["active_ingestion"] not in [e.value for e in BaseIngestion.SupportedIngestionSources]:
+            raise ValueError(f"active_ingestion {config['active_ingestion']} not supported")
+        if config.get(config["active_ingestion"]) is None:
+            raise ValueError(f"Configuration for {config['active_ingestion']} not found")
+        return config
+
+    def get_ingestion_class(self) -> BaseIngestion:
+        """Creates and return an ingestion source using the abstract factory"""
+
+        match self.active_ingestion:
+            case BaseIngestion.SupportedIngestionSources.ELASTICSEARCH:
+                return ElasticsearchIngestion(self.ingestion_config)
+            case BaseIngestion.SupportedIngestionSources.FILE:
+                return FileIngestion(self.ingestion_config)
+            case _:
+                raise ValueError(f"Unsupported ingestion source: {self.active_ingestion}")
@@ -2,7 +2,7 @@ import logging
 from datetime import datetime
 
 from django.core.management.base import BaseCommand
-from impossible_travel.tasks import exec_process_logs, process_logs
+from impossible_travel.tasks import exec_backfill, exec_process_logs, process_logs
 
 logger = logging.getLogger()
 
@@ -14,10 +14,25 @@ class Command(BaseCommand):
         # Optional arguments
         parser.add_argument("start_date", nargs="?", type=str, help="Start datetime from which begin the detection")
         parser.add_argument("end_date", nargs="?", type=str, help="End datetime for the detection")
+        parser.add_argument(
+            "--mode",
+            choices=["per_user", "single_pass", "async", "aggregated"],
+            help="Ingestion mode, by default the one set in CERTEGO_BUFFALOGS_INGESTION_MODE",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Split the time range in windows processed in parallel, saving the progress to resume an interrupted backfill",
+        )
+        parser.add_argument("--workers", type=int, help="Number of parallel backfill workers, by default CERTEGO_BUFFALOGS_BACKFILL_WORKERS")
+        parser.add_argument("--celery", action="store_true", help="Dispatch the backfill to the celery workers instead of a local pool of processes")
 
     def handle(self, *args, **options):
         """Run the detection manually with the commands: manage.py impossible_travel
         or with the start and end dates, for example: manage.py impossible_travel '2022-11-02 10:00:00' '2022-11-02 10:30:00'
+        The ingestion mode can be chosen with --mode, for example: manage.py impossible_travel --mode async
+        A long time range can be backfilled in parallel with --backfill, for example:
+        manage.py impossible_travel '2022-10-01 00:00:00' '2022-11-01 00:00:00' --backfill --workers 8
         """
         logger = logging.getLogger()
         if options["start_date"] and options["end_date"]:
@@ -27,11 +42,15 @@ class Command(BaseCommand):
             except ValueError:
                 logger.info("Time data does not match format '%Y-%m-%d %H:%M:%S'")
 
+            if options["backfill"]:
+                self.stdout.write(self.style.SUCCESS(f"Starting backfill from {start_date_obj} and {end_date_obj}"))
+                exec_backfill(start_date_obj, end_date_obj, workers=options["workers"], use_celery=options["celery"], mode=options["mode"])
+                return
             self.stdout.write(self.style.SUCCESS(f"Starting detection from {start_date_obj} and {end_date_obj}"))
-            exec_process_logs(start_date_obj, end_date_obj)
+            exec_process_logs(start_date_obj, end_date_obj, mode=options["mode"])
 
         elif options["start_date"] or options["end_date"]:
             self.stdout.write(self.style.ERROR("Error: missing one argument"))
 
         else:
-            process_logs()
+            process_logs(mode=options["mode"])
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from impossible_travel.modules.travel_distance import DistanceMode
+from impossible_travel.modules.travel_redetection import redetect_impossible_travels
+
+
+class Command(BaseCommand):
+    help = "Re-evaluate in the db the impossible travels between the saved logins of the users, e.g. after a change of Config.vel_accepted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vel-accepted", type=float, help="Max velocity in km/h that doesn't trigger the alert, by default Config.vel_accepted")
+        parser.add_argument("--distance-accepted", type=float, help="Max distance in km that doesn't trigger the alert, by default Config.distance_accepted")
+        parser.add_argument("--start-date", type=str, help="Re-evaluate only the travels arrived from this datetime, in the format '%%Y-%%m-%%d %%H:%%M:%%S'")
+        parser.add_argument("--end-date", type=str, help="Re-evaluate only the travels arrived before this datetime, in the format '%%Y-%%m-%%d %%H:%%M:%%S'")
+        parser.add_argument("--user", action="append", dest="usernames", help="Re-evaluate only the travels of this user, it can be repeated")
+        parser.add_argument(
+            "--distance-mode",
+            choices=[DistanceMode.HAVERSINE, DistanceMode.GEODESIC],
+            help="Distances of the travels, by default CERTEGO_BUFFALOGS_DISTANCE_MODE. With geodesic the travels found in the db are checked with the exact distance",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the impossible travels without an alert")
+
+    def handle(self, *args, **options):
+        """Re-evaluate the impossible travels with a single query, for example:
+        manage.py redetect_impossible_travels --vel-accepted 500 --start-date '2022-11-01 00:00:00' --dry-run
+        """
+        dates = {}
+        for option in ("start_date", "end_date"):
+            if options[option]:
+                try:
+                    dates[option] = datetime.strptime(options[option], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+                except ValueError as e:
+                    raise CommandError("Time data does not match format '%Y-%m-%d %H:%M:%S'") from e
+        alerts_count = redetect_impossible_travels(
+            distance_accepted=options["distance_accepted"],
+            vel_accepted=options["vel_accepted"],
+            usernames=options["usernames"],
+            dry_run=options["dry_run"],
+            mode=options["distance_mode"],
+            **dates,
+        )
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Found {alerts_count} impossible travels without an alert"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Created {alerts_count} impossible travel alerts"))
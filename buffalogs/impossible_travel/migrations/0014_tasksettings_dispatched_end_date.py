@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0013_remove_alert_valid_alert_name_choice_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasksettings",
+            name="dispatched_end_date",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="End of the time ranges dispatched to the detection shards, advanced to end_date when they succeed",
+                null=True,
+            ),
+        ),
+    ]
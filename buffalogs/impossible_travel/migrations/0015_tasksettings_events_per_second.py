@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0014_tasksettings_dispatched_end_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasksettings",
+            name="events_per_second",
+            field=models.FloatField(
+                blank=True,
+                help_text="Moving average of the events processed per second, used to size the time windows",
+                null=True,
+            ),
+        ),
+    ]
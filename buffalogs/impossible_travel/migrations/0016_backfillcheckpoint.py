@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("impossible_travel", "0015_tasksettings_events_per_second")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.TextField(help_text="Identifier of the backfill")),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                ("shard", models.PositiveIntegerField(help_text="Shard of the users processed by this checkpoint")),
+                ("shards", models.PositiveIntegerField(help_text="Number of shards of the backfill")),
+                ("start_date", models.DateTimeField()),
+                ("end_date", models.DateTimeField()),
+                ("processed_until", models.DateTimeField(help_text="The logins of the shard users are analyzed up to this datetime")),
+            ],
+            options={"constraints": [models.UniqueConstraint(fields=("name", "shard"), name="unique_backfill_shard")]},
+        )
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0016_backfillcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="config",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Incremented at each save, to refresh the cached copies of the Config",
+            ),
+        ),
+    ]
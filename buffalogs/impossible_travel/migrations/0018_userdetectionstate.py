@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:32
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0017_config_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDetectionState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                ("last_login_timestamp", models.DateTimeField(blank=True, null=True)),
+                ("last_login_latitude", models.FloatField(blank=True, null=True)),
+                ("last_login_longitude", models.FloatField(blank=True, null=True)),
+                ("last_login_country", models.TextField(blank=True)),
+                (
+                    "indexes",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(),
+                        blank=True,
+                        default=list,
+                        help_text="Indexes of the logins of the user",
+                        size=None,
+                    ),
+                ),
+                (
+                    "countries",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Timestamp of the last login of the user from each country",
+                    ),
+                ),
+                (
+                    "agents",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=16),
+                        blank=True,
+                        default=list,
+                        help_text="Hashes of the user agents of the user",
+                        size=None,
+                    ),
+                ),
+                (
+                    "ips",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(),
+                        blank=True,
+                        default=list,
+                        help_text="IPs of the UsersIP of the user",
+                        size=None,
+                    ),
+                ),
+                (
+                    "logins",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Ids of the Login entries of the user, by hash of their index, country and user agent",
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="detection_state",
+                        to="impossible_travel.user",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def set_alert_count(apps, schema_editor):
+    User = apps.get_model("impossible_travel", "User")
+    Alert = apps.get_model("impossible_travel", "Alert")
+    alerts_count = Alert.objects.filter(user=OuterRef("pk")).order_by().values("user").annotate(count=Count("id")).values("count")
+    User.objects.update(alert_count=Coalesce(Subquery(alerts_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("impossible_travel", "0018_userdetectionstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="alert_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of alerts of the user, kept up-to-date with F() expressions when the alerts are created or deleted",
+            ),
+        ),
+        migrations.RunPython(set_alert_count, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
+from collections import defaultdict
+
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
 from django.utils import timezone
 from impossible_travel.constants import AlertDetectionType, AlertFilterType, UserRiskScoreType
 from impossible_travel.validators import validate_ips_or_network, validate_string_or_regex
@@ -13,6 +17,9 @@ class User(models.Model):
     username = models.TextField(unique=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    alert_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of alerts of the user, kept up-to-date with F() expressions when the alerts are created or deleted"
+    )
 
     def __str__(self):
         return f"User object ({self.id}) - {self.username}"
@@ -27,7 +34,29 @@ class User(models.Model):
         ]
 
 
-class Login(models.Model):
+class UserRowsQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the rows together with the UserDetectionState of their users, so it is rebuilt from the remaining rows"""
+        with transaction.atomic():
+            UserDetectionState.objects.filter(user__in=self.order_by().values("user")).delete()
+            return super().delete()
+
+
+class UserRowsModel(models.Model):
+    """Rows of the history of a user (Login and UsersIP) tracked by its UserDetectionState"""
+
+    objects = UserRowsQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            UserDetectionState.objects.filter(user_id=self.user_id).delete()
+            return super().delete(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class Login(UserRowsModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -41,6 +70,18 @@ class Login(models.Model):
     ip = models.TextField()
 
 
+class AlertQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the alerts, decreasing the User.alert_count of their users in the same transaction (es. the admin bulk delete)"""
+        with transaction.atomic():
+            users_by_count = defaultdict(list)
+            for row in self.order_by().values("user").annotate(count=models.Count("id")):
+                users_by_count[row["count"]].append(row["user"])
+            for count, users in users_by_count.items():
+                User.objects.filter(id__in=users).update(alert_count=Greatest(models.F("alert_count") - count, 0))
+            return super().delete()
+
+
 class Alert(models.Model):
     name = models.CharField(choices=AlertDetectionType.choices, max_length=30, null=False, blank=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -57,6 +98,8 @@ class Alert(models.Model):
     )
     notified = models.BooleanField(help_text="True when the alert has been notified by alerter", default=False)
 
+    objects = AlertQuerySet.as_manager()
+
     @property
     def is_filtered(self):
         """Returns if the alert is filtered based on the filter_type field"""
@@ -68,6 +111,10 @@ class Alert(models.Model):
     def is_filtered_field_display(self):
         return self.is_filtered
 
+    def delete(self, *args, **kwargs):
+        # deleted through the queryset, so the User.alert_count is decreased only if the alert row is actually deleted
+        return Alert.objects.filter(pk=self.pk).delete()
+
     class Meta:
         constraints = [
             models.CheckConstraint(
@@ -83,19 +130,58 @@ class Alert(models.Model):
         ]
 
 
-class UsersIP(models.Model):
+class UsersIP(UserRowsModel):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     ip = models.GenericIPAddressField()
 
 
+class UserDetectionState(models.Model):
+    """Compact detection state of a user, kept up-to-date by the detection together with its Login and UsersIP rows,
+    so the detection of a batch of logins reads it with a single lookup instead of scanning the whole history of the user
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="detection_state")
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    last_login_timestamp = models.DateTimeField(null=True, blank=True)
+    last_login_latitude = models.FloatField(null=True, blank=True)
+    last_login_longitude = models.FloatField(null=True, blank=True)
+    last_login_country = models.TextField(blank=True)
+    indexes = ArrayField(models.TextField(), blank=True, default=list, help_text="Indexes of the logins of the user")
+    countries = models.JSONField(blank=True, default=dict, help_text="Timestamp of the last login of the user from each country")
+    agents = ArrayField(models.CharField(max_length=16), blank=True, default=list, help_text="Hashes of the user agents of the user")
+    ips = ArrayField(models.TextField(), blank=True, default=list, help_text="IPs of the UsersIP of the user")
+    logins = models.JSONField(blank=True, default=dict, help_text="Ids of the Login entries of the user, by hash of their index, country and user agent")
+
+
 class TaskSettings(models.Model):
     task_name = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
+    dispatched_end_date = models.DateTimeField(
+        null=True, blank=True, help_text="End of the time ranges dispatched to the detection shards, advanced to end_date when they succeed"
+    )
+    events_per_second = models.FloatField(null=True, blank=True, help_text="Moving average of the events processed per second, used to size the time windows")
+
+
+class BackfillCheckpoint(models.Model):
+    name = models.TextField(help_text="Identifier of the backfill")
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    shard = models.PositiveIntegerField(help_text="Shard of the users processed by this checkpoint")
+    shards = models.PositiveIntegerField(help_text="Number of shards of the backfill")
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField()
+    processed_until = models.DateTimeField(help_text="The logins of the shard users are analyzed up to this datetime")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "shard"], name="unique_backfill_shard"),
+        ]
 
 
 def get_default_ignored_users():
@@ -122,6 +208,20 @@ def get_default_vip_users():
     return list(settings.CERTEGO_BUFFALOGS_VIP_USERS)
 
 
+# sent when the Config is changed with a queryset update(), that doesn't send the post_save signal
+config_updated = Signal()
+
+
+class ConfigQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Update the Config, incrementing its version like Config.save() does, so the cached copies are refreshed"""
+        kwargs.setdefault("version", models.F("version") + 1)
+        kwargs.setdefault("updated", timezone.now())
+        rows = super().update(**kwargs)
+        config_updated.send(sender=self.model)
+        return rows
+
+
 class Config(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -214,6 +314,9 @@ class Config(models.Model):
         default=settings.CERTEGO_BUFFALOGS_ALERT_MAX_DAYS, help_text="Days after which the alerts will be removed from the db"
     )
     ip_max_days = models.PositiveIntegerField(default=settings.CERTEGO_BUFFALOGS_IP_MAX_DAYS, help_text="Days after which the IPs will be removed from the db")
+    version = models.PositiveIntegerField(default=0, editable=False, help_text="Incremented at each save, to refresh the cached copies of the Config")
+
+    objects = ConfigQuerySet.as_manager()
 
     def clean(self):
         if not self.pk and Config.objects.exists():
@@ -223,6 +326,9 @@ class Config(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        self.version += 1
+        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
         super().save(*args, **kwargs)
 
     class Meta:
@@ -1,53 +1,67 @@
 import logging
 import re
+from functools import lru_cache
 
 from django.conf import settings
 from impossible_travel.constants import AlertFilterType, ComparisonType, UserRiskScoreType
 from impossible_travel.models import Alert, Config, User
+from impossible_travel.modules.config_snapshot import ConfigSnapshot, as_config_snapshot
 from ua_parser import parse
 
 logger = logging.getLogger(__name__)
 
+# (snapshot, engine) of the last compiled FilterEngine
+_engine_cache = (None, None)
+# backreferences can't be combined in a single regex, because the groups are renumbered
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
 
-def match_filters(alert: Alert, app_config: Config) -> Alert:
-    db_user = alert.user
 
-    # Detection filters - users
-    alert = _update_users_filters(db_alert=alert, app_config=app_config, db_user=db_user)
+class UsernameMatcher:
+    """Check if a username is one of the values of a Config list or matches one of its regex patterns.
+    The values are kept in a frozenset and the valid patterns are combined in a single alternation regex,
+    except the ones that can't be combined (e.g. with backreferences or global inline flags), which are checked one by one
+    """
 
-    # Detection filters - location
-    if alert.login_raw_data.get("ip", "") in app_config.ignored_ips:
-        logger.debug(
-            f"Alert: {alert.id} filtered for user: {db_user.username} because the login IP: {alert.login_raw_data['ip']} is in the ignored_ips Config list"
-        )
-        alert.filter_type.append(AlertFilterType.IGNORED_IP_FILTER)  # alert filtered because the ip is in the ignored_ips list
-    if alert.login_raw_data.get("country", "") in app_config.allowed_countries:
-        logger.debug(
-            f"Alert: {alert.id} filtered for user: {db_user.username} because the login IP: {alert.login_raw_data['country']} is in the allower_countries Config list"
-        )
-        alert.filter_type.append(AlertFilterType.ALLOWED_COUNTRY_FILTER)  # alert filtered because the country is in the allowed_countries list
+    def __init__(self, patterns: tuple):
+        """
+        :param patterns: (value, compiled pattern) tuples of the Config list, see config_snapshot.compile_username_patterns
+        :type patterns: tuple
+        """
+        self.patterns = patterns
+        self.values = frozenset(value for value, _ in patterns)
+        regexes = [regexp for _, regexp in patterns if regexp is not None]
+        combinable = [regexp for regexp in regexes if not _BACKREFERENCE.search(regexp.pattern)]
+        separate = [regexp for regexp in regexes if _BACKREFERENCE.search(regexp.pattern)]
+        if len(combinable) > 1:
+            try:
+                combinable = [re.compile("|".join(f"(?:{regexp.pattern})" for regexp in combinable))]
+            except re.error:
+                pass  # e.g. global inline flags not at the start of the combined regex
+        self.regexes = tuple(combinable + separate)
 
-    # Detection filters - devices
-    if alert.login_raw_data.get("organization", "") in app_config.ignored_ISPs:
-        logger.debug(
-            f"Alert: {alert.id} filtered for user: {db_user.username} because the login ISP: {alert.login_raw_data['organization']} is in the ignored_ISPs Config list"
-        )
-        alert.filter_type.append(AlertFilterType.IGNORED_ISP_FILTER)
-    if app_config.ignore_mobile_logins and alert.login_raw_data["agent"]:
-        ua_parsed = parse(alert.login_raw_data["agent"])
-        if ua_parsed.os.family in settings.CERTEGO_BUFFALOGS_MOBILE_DEVICES:
-            logger.debug(
-                f"Alert: {alert.id} filtered for user: {db_user.username} because the login user-agent: {alert.login_raw_data['agent']} is a mobile device and Config.ignore_mobile_logins: {app_config.ignore_mobile_logins}"
-            )
-            alert.filter_type.append(AlertFilterType.IS_MOBILE_FILTER)
-
-    # Detection filters - alerts
-    if alert.name in app_config.filtered_alerts_types:
-        alert.filter_type.append(AlertFilterType.FILTERED_ALERTS)
-
-
-def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User) -> Alert:
-    """Check all the filters relative to users.
+    def match(self, word: str) -> bool:
+        if word in self.values:
+            # the word is exactly a value in the list
+            return True
+        # else, check if one of the items of the list is a regex that matches the word
+        return any(regexp.search(word) for regexp in self.regexes)
+
+    def find_match(self, word: str) -> str:
+        """Get the value or the pattern of the list matched by the word, None if it doesn't match any.
+        It checks the patterns one by one, so it is used only to explain why a word matched
+        """
+        for value, regexp in self.patterns:
+            if word == value or (regexp is not None and regexp.search(word)):
+                return value
+        return None
+
+    def __bool__(self):
+        return bool(self.values)
+
+
+class FilterEngine:
+    """Filters of the alerts compiled once for a ConfigSnapshot: the username patterns are combined in UsernameMatchers
+    the exact-match lists are the frozensets of the snapshot and the ignored IPs and networks are in a prefix index, so each alert is filtered with a few lookups.
     Rules of alert filtering, in the check order:
     1. if Config.alert_is_vip_only == True
         a. if user not in [Config.vip_users] --> IS_VIP_FILTER
@@ -56,41 +70,169 @@ def _update_users_filters(db_alert: Alert, app_config: Config, db_user: User) ->
         b. if user not in [Config.enabled_users] --> IGNORED_USER_FILTER
       3. else: if user in [Config.ignored_users] --> IGNORED_USER_FILTER
     4. if user.risk_score < Config.alert_minimum_risk_score --> ALERT_MINIMUM_RISK_SCORE_FILTER
+    5. location, devices and alerts types filters --> IGNORED_IP_FILTER, ALLOWED_COUNTRY_FILTER, IGNORED_ISP_FILTER, IS_MOBILE_FILTER, FILTERED_ALERTS
     """
-    if app_config.alert_is_vip_only:
-        # 1. if the flag Config.is_vip_only is True, check only if the user is in the config.vip_users list
-        if db_user.username not in app_config.vip_users:
-            logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} not in vip_users and enabled_users Config lists")
-            db_alert.filter_type.append(AlertFilterType.IS_VIP_FILTER)  # alert filtered because alert_is_vip_only=True but username not in vip_users list
-    else:
-        if app_config.enabled_users and not _check_username_list_regex(word=db_user.username, values_list=app_config.enabled_users):
+
+    def __init__(self, app_config: ConfigSnapshot):
+        self.app_config = app_config
+        self.enabled_users = UsernameMatcher(app_config.enabled_users_patterns)
+        self.ignored_users = UsernameMatcher(app_config.ignored_users_patterns)
+        self.filtered_alerts_types = frozenset(app_config.filtered_alerts_types or [])
+        self.mobile_devices = frozenset(settings.CERTEGO_BUFFALOGS_MOBILE_DEVICES)
+
+    def get_user_filter(self, username: str) -> str:
+        """Get the filter of the user (rules 1-3), None if the user isn't filtered"""
+        if self.app_config.alert_is_vip_only:
+            # 1. if the flag Config.is_vip_only is True, check only if the user is in the config.vip_users list
+            return AlertFilterType.IS_VIP_FILTER if username not in self.app_config.vip_users else None
+        if self.enabled_users and not self.enabled_users.match(username):
             # 2. alert filtered because the user is not in the enabled_users list
-            logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} not in the enabled_users Config list")
-            db_alert.filter_type.append(AlertFilterType.IGNORED_USER_FILTER)
-        else:
-            if _check_username_list_regex(word=db_user.username, values_list=app_config.ignored_users):
-                # 3. if the user is in the Config.ignored_users list, the user is immediately ignored
-                logger.debug(f"Alert: {db_alert.id} filtered because user: {db_user.username} is in the ignored_users Config list")
-                db_alert.filter_type.append(AlertFilterType.IGNORED_USER_FILTER)
-
-    # 4. check that if the user has a risk_score lower than the alert_minimum_risk_score threshold filter, the alert is filtered
-    if UserRiskScoreType.compare_risk(threshold=app_config.alert_minimum_risk_score, value=db_user.risk_score) == ComparisonType.LOWER:
-        logger.debug(
-            f"Alert: {db_alert.id} filtered because user: {db_user.username} has risk_score: {db_user.risk_score}, but Config.alert_minimum_risk_score is set to {app_config.alert_minimum_risk_score}"
+            return AlertFilterType.IGNORED_USER_FILTER
+        if self.ignored_users.match(username):
+            # 3. if the user is in the Config.ignored_users list, the user is immediately ignored
+            return AlertFilterType.IGNORED_USER_FILTER
+        return None
+
+    def is_login_filtered(self, login) -> bool:
+        """Check if all the alerts of the login are filtered by the location or ISP filters"""
+        return (
+            login.get("ip", "") in self.app_config.ignored_ips_index
+            or login.get("country", "") in self.app_config.allowed_countries
+            or login.get("organization", "") in self.app_config.ignored_ISPs
         )
-        db_alert.filter_type.append(AlertFilterType.ALERT_MINIMUM_RISK_SCORE_FILTER)
-    return db_alert
 
+    def get_filter_types(self, alert: Alert, user_filters: dict = None) -> list:
+        """Get the filters matched by the alert
 
-def _check_username_list_regex(word: str, values_list: list) -> bool:
-    """Function to check if a string value is inside a list of string or match a regex in the list"""
-    for item in values_list:
-        if word == item:
-            # check if the word is exacly a value in the list
-            return True
+        :param alert: alert to filter, with its user
+        :type alert: Alert
+        :param user_filters: cache of the users filters by username, shared by a batch of alerts
+        :type user_filters: dict
+
+        :return: matched filters, in the check order
+        :rtype: list
+        """
+        db_user = alert.user
+        login = alert.login_raw_data
+        filter_types = []
+        # Detection filters - users
+        if user_filters is None or db_user.username not in user_filters:
+            user_filter = self.get_user_filter(db_user.username)
+            if user_filters is not None:
+                user_filters[db_user.username] = user_filter
         else:
-            # else, check if the item in the list is a regex that matches the word
-            regexp = re.compile(item)
-            if regexp.search(word):
-                return True
-    return False
+            user_filter = user_filters[db_user.username]
+        if user_filter:
+            filter_types.append(user_filter)
+        # 4. check that if the user has a risk_score lower than the alert_minimum_risk_score threshold filter, the alert is filtered
+        if UserRiskScoreType.compare_risk(threshold=self.app_config.alert_minimum_risk_score, value=db_user.risk_score) == ComparisonType.LOWER:
+            filter_types.append(AlertFilterType.ALERT_MINIMUM_RISK_SCORE_FILTER)
+
+        # Detection filters - location
+        if login.get("ip", "") in self.app_config.ignored_ips_index:
+            filter_types.append(AlertFilterType.IGNORED_IP_FILTER)  # alert filtered because the ip is in the ignored_ips list or in one of its networks
+        if login.get("country", "") in self.app_config.allowed_countries:
+            filter_types.append(AlertFilterType.ALLOWED_COUNTRY_FILTER)  # alert filtered because the country is in the allowed_countries list
+
+        # Detection filters - devices
+        if login.get("organization", "") in self.app_config.ignored_ISPs:
+            filter_types.append(AlertFilterType.IGNORED_ISP_FILTER)
+        if self.app_config.ignore_mobile_logins and login.get("agent") and _get_os_family(login["agent"]) in self.mobile_devices:
+            filter_types.append(AlertFilterType.IS_MOBILE_FILTER)
+
+        # Detection filters - alerts
+        if alert.name in self.filtered_alerts_types:
+            filter_types.append(AlertFilterType.FILTERED_ALERTS)
+        if filter_types and logger.isEnabledFor(logging.DEBUG):
+            self._log_filters(alert, filter_types)
+        return filter_types
+
+    def _log_filters(self, alert: Alert, filter_types: list):
+        """Log the rule matched by each filter of the alert. It's the slow path, run only for the filtered alerts"""
+        username = alert.user.username
+        login = alert.login_raw_data
+        for filter_type in filter_types:
+            if filter_type == AlertFilterType.IS_VIP_FILTER:
+                logger.debug(f"Alert: {alert.id} filtered because user: {username} not in vip_users and enabled_users Config lists")
+            elif filter_type == AlertFilterType.IGNORED_USER_FILTER and self.enabled_users and not self.enabled_users.match(username):
+                logger.debug(f"Alert: {alert.id} filtered because user: {username} not in the enabled_users Config list")
+            elif filter_type == AlertFilterType.IGNORED_USER_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered because user: {username} is in the ignored_users Config list (matched by: {self.ignored_users.find_match(username)})"
+                )
+            elif filter_type == AlertFilterType.ALERT_MINIMUM_RISK_SCORE_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered because user: {username} has risk_score: {alert.user.risk_score}, but Config.alert_minimum_risk_score is set to {self.app_config.alert_minimum_risk_score}"
+                )
+            elif filter_type == AlertFilterType.IGNORED_IP_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered for user: {username} because the login IP: {login['ip']} is in the ignored_ips Config list (matched by: {self.app_config.ignored_ips_index.find_match(login['ip'])})"
+                )
+            elif filter_type == AlertFilterType.ALLOWED_COUNTRY_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered for user: {username} because the login country: {login['country']} is in the allowed_countries Config list"
+                )
+            elif filter_type == AlertFilterType.IGNORED_ISP_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered for user: {username} because the login ISP: {login['organization']} is in the ignored_ISPs Config list"
+                )
+            elif filter_type == AlertFilterType.IS_MOBILE_FILTER:
+                logger.debug(
+                    f"Alert: {alert.id} filtered for user: {username} because the login user-agent: {login['agent']} is a mobile device and Config.ignore_mobile_logins: {self.app_config.ignore_mobile_logins}"
+                )
+            elif filter_type == AlertFilterType.FILTERED_ALERTS:
+                logger.debug(f"Alert: {alert.id} filtered for user: {username} because its type: {alert.name} is in the filtered_alerts_types Config list")
+
+    def get_batch_filter_types(self, alerts: list) -> list:
+        """Get the filters matched by each alert of the batch, evaluating the users filters once per user
+
+        :param alerts: alerts to filter, with their users
+        :type alerts: list
+
+        :return: matched filters of each alert
+        :rtype: list
+        """
+        user_filters = {}
+        return [self.get_filter_types(alert, user_filters=user_filters) for alert in alerts]
+
+
+def get_filter_engine(app_config: Config) -> FilterEngine:
+    """Get the FilterEngine of the Config, compiled once for each Config version (Config.id, Config.version and Config.updated).
+    The engines of the Config not saved on db are cached only for the same snapshot
+    """
+    global _engine_cache
+    snapshot = as_config_snapshot(app_config)
+    key = (snapshot.id, snapshot.version, snapshot.updated) if snapshot.id is not None else snapshot
+    cached_key, engine = _engine_cache
+    if cached_key is not key and cached_key != key:
+        engine = FilterEngine(snapshot)
+        _engine_cache = (key, engine)
+    return engine
+
+
+def match_filters(alert: Alert, app_config: Config) -> Alert:
+    """Add to the filter_type of the alert the filters it matches"""
+    alert.filter_type.extend(get_filter_engine(app_config).get_filter_types(alert))
+    return alert
+
+
+def match_filters_batch(alerts: list, app_config: Config) -> list:
+    """Add to the filter_type of each alert the filters it matches, compiling the filters once for the whole batch"""
+    for alert, filter_types in zip(alerts, get_filter_engine(app_config).get_batch_filter_types(alerts)):
+        alert.filter_type.extend(filter_types)
+    return alerts
+
+
+def is_user_filtered(db_user: User, app_config: Config) -> bool:
+    """Check if all the alerts of the user are filtered by the users filters, regardless of its risk_score"""
+    return get_filter_engine(app_config).get_user_filter(db_user.username) is not None
+
+
+def is_login_filtered(login: dict, app_config: Config) -> bool:
+    """Check if all the alerts of the login are filtered by the location or ISP filters"""
+    return get_filter_engine(app_config).is_login_filtered(login)
+
+
+@lru_cache(maxsize=1024)
+def _get_os_family(user_agent: str) -> str:
+    return parse(user_agent).os.family
@@ -0,0 +1,118 @@
+import asyncio
+import queue
+import threading
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from elasticsearch.helpers import async_scan
+from impossible_travel.modules.elastic_client import get_async_elastic_client, get_event_loop
+
+logger = get_task_logger(__name__)
+
+_END = object()
+
+
+class AsyncIngestionEngine:
+    """Fetch the logins of the users from elasticsearch with the async client, running up to `concurrency` requests at the same time.
+    The coroutines run on the event loop of the process, in a background thread, and send the login pages to the caller through a bounded queue,
+    so the elasticsearch latency overlaps with the (synchronous, DB-bound) detection executed by the caller
+    """
+
+    def __init__(self, concurrency=None, queue_size=None, page_size=None, index=None):
+        self.concurrency = concurrency or settings.CERTEGO_BUFFALOGS_INGESTION_CONCURRENCY
+        self.queue_size = queue_size or settings.CERTEGO_BUFFALOGS_INGESTION_QUEUE_SIZE
+        self.page_size = page_size or settings.CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE
+        self.index = index or settings.CERTEGO_BUFFALOGS_ELASTIC_INDEX
+
+    def iter_logins(self, logins_query, users_query=None, usernames=None):
+        """Yield the login pages of the users, in chronological order for each user.
+        The pages of different users are interleaved
+
+        :param logins_query: function returning the elasticsearch query body of the logins of the given username
+        :type logins_query: function
+        :param users_query: function returning the composite aggregation query body of the users page after the given after_key
+        :type users_query: function
+        :param usernames: usernames to process, alternative to users_query
+        :type usernames: list
+
+        :return: generator of (username, list of raw hits) tuples
+        :rtype: generator
+        """
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        future = asyncio.run_coroutine_threadsafe(self._produce(results, stop, logins_query, users_query, usernames), get_event_loop())
+        try:
+            while True:
+                item = results.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # stop the producers, unblocking the ones waiting on the full queue
+            stop.set()
+            while not future.done():
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    async def _produce(self, results, stop, logins_query, users_query, usernames):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        client = get_async_elastic_client()
+
+        async def put(item):
+            # the blocking put is run in the default executor, so a full queue doesn't block the event loop
+            await loop.run_in_executor(None, results.put, item)
+
+        async def fetch_user(username):
+            async with semaphore:
+                page = []
+                async for hit in async_scan(client, query=logins_query(username), index=self.index, preserve_order=True, size=self.page_size):
+                    if stop.is_set():
+                        return
+                    page.append(hit)
+                    if len(page) >= self.page_size:
+                        await put((username, page))
+                        page = []
+                if page:
+                    await put((username, page))
+
+        pending = []
+        try:
+            async for page_usernames in self._iter_users_pages(client, semaphore, users_query, usernames):
+                # the next users page is requested while the users of the previous one are still being fetched
+                await asyncio.gather(*pending)
+                if stop.is_set():
+                    break
+                pending = [asyncio.create_task(fetch_user(username)) for username in page_usernames]
+            await asyncio.gather(*pending)
+        except Exception as e:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await put(e)
+        finally:
+            await put(_END)
+
+    async def _iter_users_pages(self, client, semaphore, users_query, usernames):
+        if usernames is not None:
+            yield usernames
+            return
+        after_key = None
+        while True:
+            async with semaphore:
+                response = await client.search(index=self.index, body=users_query(after_key))
+            if "aggregations" not in response or "login_user" not in response["aggregations"]:
+                logger.info("No users login aggregation found")
+                return
+            aggregation = response["aggregations"]["login_user"]
+            if not aggregation["buckets"]:
+                return
+            logger.info(f"Successfully got a page of {len(aggregation['buckets'])} users")
+            yield [bucket["key"]["username"] for bucket in aggregation["buckets"]]
+            if "after_key" not in aggregation:
+                return
+            after_key = aggregation["after_key"]
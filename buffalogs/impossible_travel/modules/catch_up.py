@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+
+# Windows used while the throughput of the detection is still unknown
+DEFAULT_WINDOW = timedelta(minutes=30)
+DEFAULT_WINDOWS_NUM = 6
+# Weight of the last measure in the moving average of the throughput
+THROUGHPUT_SMOOTHING = 0.5
+
+
+def count_events(buckets, start_date, end_date):
+    """Count the events of the histogram buckets starting in the time range
+
+    :param buckets: chronological histogram buckets, as (bucket start, bucket end, events count) tuples
+    :type buckets: list
+    :param start_date: start of the time range
+    :type start_date: datetime
+    :param end_date: end of the time range
+    :type end_date: datetime
+
+    :return: number of events
+    :rtype: int
+    """
+    return sum(count for bucket_start, _, count in buckets if start_date <= bucket_start < end_date)
+
+
+def plan_time_windows(start_date, now, buckets, events_per_second):
+    """Split the backlog from start_date to now in time windows to be processed in this run.
+    The windows are sized from the event counts of the histogram buckets and the measured throughput (events per second) of the detection,
+    so that each window takes about CERTEGO_BUFFALOGS_CATCH_UP_WINDOW_SECONDS and the whole run about CERTEGO_BUFFALOGS_CATCH_UP_RUN_SECONDS:
+    quiet periods are merged in big windows (up to CERTEGO_BUFFALOGS_CATCH_UP_MAX_WINDOW_MINUTES), bursts are split in small ones (down to a single bucket).
+    If the throughput is not known yet, up to DEFAULT_WINDOWS_NUM windows of DEFAULT_WINDOW are planned
+
+    :param start_date: start of the backlog
+    :type start_date: datetime
+    :param now: current datetime, only the windows ended before it are planned
+    :type now: datetime
+    :param buckets: chronological and complete histogram buckets of the events in the backlog, as (bucket start, bucket end, events count) tuples
+    :type buckets: list
+    :param events_per_second: measured throughput of the detection, None if unknown
+    :type events_per_second: float
+
+    :return: time windows, as (start date, end date, events count) tuples
+    :rtype: list
+    """
+    windows = []
+    if not events_per_second or not buckets:
+        for _ in range(DEFAULT_WINDOWS_NUM):
+            end_date = start_date + DEFAULT_WINDOW
+            if end_date >= now:
+                break
+            windows.append((start_date, end_date, count_events(buckets, start_date, end_date)))
+            start_date = end_date
+        return windows
+
+    window_events = events_per_second * settings.CERTEGO_BUFFALOGS_CATCH_UP_WINDOW_SECONDS
+    run_events = events_per_second * settings.CERTEGO_BUFFALOGS_CATCH_UP_RUN_SECONDS
+    max_window = timedelta(minutes=settings.CERTEGO_BUFFALOGS_CATCH_UP_MAX_WINDOW_MINUTES)
+    planned_events = 0
+    window_start, events = start_date, 0
+    for bucket_start, bucket_end, count in buckets:
+        if bucket_end <= window_start:
+            continue
+        if window_start < bucket_start and ((events and events + count > window_events) or bucket_end - window_start > max_window):
+            windows.append((window_start, bucket_start, events))
+            planned_events += events
+            if planned_events >= run_events:
+                return windows
+            window_start, events = bucket_start, 0
+        events += count
+    if window_start < buckets[-1][1]:
+        windows.append((window_start, buckets[-1][1], events))
+    return windows
+
+
+def update_events_per_second(events_per_second, events, seconds):
+    """Update the moving average of the detection throughput with the last measure
+
+    :param events_per_second: current throughput, None if unknown
+    :type events_per_second: float
+    :param events: number of events processed
+    :type events: int
+    :param seconds: time taken to process them
+    :type seconds: float
+
+    :return: updated throughput
+    :rtype: float
+    """
+    if not events or seconds <= 0:
+        return events_per_second
+    measured = events / seconds
+    if not events_per_second:
+        return measured
+    return THROUGHPUT_SMOOTHING * measured + (1 - THROUGHPUT_SMOOTHING) * events_per_second
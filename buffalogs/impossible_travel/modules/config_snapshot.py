@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from impossible_travel.models import Config, config_updated
+from impossible_travel.modules.ip_prefix_index import IpPrefixIndex
+
+# Config fields only used to check if a value is in them, stored as frozensets
+SET_FIELDS = ("vip_users", "ignored_ips", "allowed_countries", "ignored_ISPs", "filtered_alerts_types")
+# Config fields of usernames or regex patterns, stored as tuples of (value, compiled pattern)
+PATTERN_FIELDS = ("ignored_users", "enabled_users")
+
+# cached snapshot and monotonic time of its last check against the db
+_snapshot = {"config": None, "checked": 0.0}
+_lock = threading.Lock()
+
+
+class ConfigSnapshot:
+    """Read-only copy of the Config shared by the detection and the filters.
+    The lists are converted in frozensets and the username patterns are compiled once, when the snapshot is built.
+    It has the same attributes of the Config, plus the compiled patterns in `ignored_users_patterns` and `enabled_users_patterns`
+    and the index of the ignored IPs and networks in `ignored_ips_index`
+    """
+
+    def __init__(self, config: Config):
+        for field in config._meta.concrete_fields:
+            value = getattr(config, field.attname)
+            if field.name in SET_FIELDS and value is not None:
+                value = frozenset(value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, field.attname, value)
+        for field_name in PATTERN_FIELDS:
+            object.__setattr__(self, f"{field_name}_patterns", compile_username_patterns(getattr(config, field_name) or []))
+        object.__setattr__(self, "ignored_ips_index", IpPrefixIndex(config.ignored_ips or []))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("ConfigSnapshot is read-only")
+
+    def __repr__(self):
+        return f"ConfigSnapshot(version={self.version})"
+
+
+def compile_username_patterns(values: list) -> tuple:
+    """Compile the usernames or regex patterns of a Config list
+
+    :param values: usernames or regex patterns
+    :type values: list
+
+    :return: (value, compiled pattern) tuples, the pattern is None if the value is not a valid regex
+    :rtype: tuple
+    """
+    patterns = []
+    for value in values:
+        try:
+            patterns.append((value, re.compile(value)))
+        except re.error:
+            patterns.append((value, None))
+    return tuple(patterns)
+
+
+def as_config_snapshot(app_config) -> ConfigSnapshot:
+    """Get the snapshot of the given Config, or the snapshot itself.
+    The cached snapshot of get_config() is reused if it has the same version of the Config (Config.id, Config.version and Config.updated)
+    """
+    if isinstance(app_config, ConfigSnapshot):
+        return app_config
+    cached = _snapshot["config"]
+    if (
+        cached is not None
+        and app_config.pk is not None
+        and (cached.id, cached.version, cached.updated) == (app_config.pk, app_config.version, app_config.updated)
+    ):
+        return cached
+    return ConfigSnapshot(app_config)
+
+
+def get_config() -> ConfigSnapshot:
+    """Get the snapshot of the Config.
+    The snapshot is cached by the process for CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS without queries, then only the version of the Config
+    (Config.version and Config.updated) is read and the snapshot is rebuilt if it changed
+
+    :return: snapshot of the Config
+    :rtype: ConfigSnapshot
+    """
+    with _lock:
+        snapshot = _snapshot["config"]
+        now = time.monotonic()
+        if snapshot is not None and now - _snapshot["checked"] < settings.CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS:
+            return snapshot
+        if snapshot is None or Config.objects.filter(id=1).values_list("version", "updated").first() != (snapshot.version, snapshot.updated):
+            config, _ = Config.objects.get_or_create(id=1)
+            snapshot = ConfigSnapshot(config)
+            _snapshot["config"] = snapshot
+        _snapshot["checked"] = now
+        return snapshot
+
+
+def clear_config_cache(**kwargs):
+    """Drop the cached snapshot, so the next get_config() reads the Config again. Connected to the signals of the Config changes"""
+    with _lock:
+        _snapshot["config"] = None
+
+
+post_save.connect(clear_config_cache, sender=Config, dispatch_uid="config_snapshot_post_save")
+post_delete.connect(clear_config_cache, sender=Config, dispatch_uid="config_snapshot_post_delete")
+config_updated.connect(clear_config_cache, sender=Config, dispatch_uid="config_snapshot_updated")
@@ -1,31 +1,50 @@
-from datetime import datetime
-
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.db import DatabaseError, IntegrityError, transaction
-from django.utils import timezone
-from geopy.distance import geodesic
 from impossible_travel.constants import AlertDetectionType, ComparisonType, UserRiskScoreType
 from impossible_travel.models import Alert, Config, Login, User, UsersIP
-from impossible_travel.modules import alert_filter
+from impossible_travel.modules import alert_filter, travel_distance
+from impossible_travel.modules.config_snapshot import ConfigSnapshot, as_config_snapshot, get_config
+from impossible_travel.modules.detectors import DetectionPlan, Detector, register_detector
+from impossible_travel.modules.login_compaction import LoginCompactor
+from impossible_travel.modules.login_record import LoginRecord, get_login_datetime
+from impossible_travel.modules.travel_evaluator import TravelEvaluator
+from impossible_travel.modules.user_profile import UserProfile
+from impossible_travel.modules.write_buffer import WriteBuffer
 
 logger = get_task_logger(__name__)
 
 
-def update_risk_level(db_user: User, triggered_alert: Alert, app_config: Config):
+def update_risk_level(db_user: User, triggered_alert: Alert, app_config: Config, write_buffer: WriteBuffer = None):
     """Update user risk level depending on how many alerts were triggered
 
     :param db_user: user from DB
     :type db_user: User object
     :param triggered_alert: alert that has just been triggered
     :type alert: Alert object
+    :param write_buffer: buffer of the rows to save, if None they are saved immediately
+    :type write_buffer: WriteBuffer
     """
     with transaction.atomic():
         current_risk_score = db_user.risk_score
-        new_risk_level = UserRiskScoreType.get_risk_level(db_user.alert_set.count())
+        if write_buffer is not None:
+            # the alert_count of the user already includes the triggered alert, added to the buffer
+            alerts_count = db_user.alert_count
+        else:
+            # the triggered alert has been saved by the caller, so it may not be counted in the alert_count yet
+            alerts_count = db_user.alert_set.count()
+            if alerts_count != db_user.alert_count:
+                User.objects.filter(pk=db_user.pk).update(alert_count=alerts_count)
+                db_user.alert_count = alerts_count
+        new_risk_level = UserRiskScoreType.get_risk_level(alerts_count)
+        if new_risk_level == current_risk_score:
+            return False  # the user is saved only if the risk_score changes
 
-        # update the risk_score anyway in order to keep the users up-to-date each time they are seen by the system
         db_user.risk_score = new_risk_level
-        db_user.save()
+        if write_buffer is not None:
+            write_buffer.update_user()
+        else:
+            db_user.save(update_fields=["risk_score", "updated"])
 
         risk_comparison = UserRiskScoreType.compare_risk(current_risk_score, new_risk_level)
         if risk_comparison in [ComparisonType.LOWER, ComparisonType.EQUAL]:
@@ -42,112 +61,145 @@ def update_risk_level(db_user: User, triggered_alert: Alert, app_config: Config)
                 "alert_desc": f"{AlertDetectionType.USER_RISK_THRESHOLD.label} for User: {db_user.username}, "
                 f"who changed risk_score from {current_risk_score} to {new_risk_level}",
             }
-            logger.info(f"Upgraded risk level for User: {db_user.username} to level: {new_risk_level}, " f"detected {db_user.alert_set.count()} alerts")
-            set_alert(db_user=db_user, login_alert=triggered_alert.login_raw_data, alert_info=alert_info, app_config=app_config)
+            logger.info(f"Upgraded risk level for User: {db_user.username} to level: {new_risk_level}, " f"detected {alerts_count} alerts")
+            set_alert(db_user=db_user, login_alert=triggered_alert.login_raw_data, alert_info=alert_info, app_config=app_config, write_buffer=write_buffer)
 
             return True
 
 
-def set_alert(db_user: User, login_alert: dict, alert_info: dict, app_config: Config):
-    """Save the alert on db and logs it
+def set_alert(db_user: User, login_alert: dict, alert_info: dict, app_config: Config, write_buffer: WriteBuffer = None, buffalogs_info: dict = None):
+    """Save the alert on db and logs it.
+    The alert is built fully in memory (travel info, risk_score update with the USER_RISK_THRESHOLD follow-up alert, filters and is_vip)
+    and then inserted once, together with the follow-up alert
 
     :param db_user: user from db
     :type db_user: object
-    :param login_alert: dictionary login from elastic
-    :type login_alert: dict
+    :param login_alert: login from elastic
+    :type login_alert: LoginRecord or dict
     :param alert_info: dictionary with alert info
     :type alert_info: dict
+    :param write_buffer: buffer of the rows to save, if None the alert is saved immediately
+    :type write_buffer: WriteBuffer
+    :param buffalogs_info: additional info of the alert, saved in login_raw_data["buffalogs"] (e.g. the start of the impossible travel)
+    :type buffalogs_info: dict
+
+    :return: the new alert
+    :rtype: Alert
     """
     logger.info(f"ALERT {alert_info['alert_name']} for User: {db_user.username} at: {login_alert['timestamp']}")
-    alert = Alert.objects.create(user=db_user, login_raw_data=login_alert, name=alert_info["alert_name"], description=alert_info["alert_desc"])
+    app_config = as_config_snapshot(app_config)
+    # copy of the login, because the raw data of an alert can be changed until it is saved
+    login_alert = login_alert.to_dict() if isinstance(login_alert, LoginRecord) else dict(login_alert)
+    if buffalogs_info is not None:
+        login_alert["buffalogs"] = dict(buffalogs_info)
+    alert_buffer = write_buffer or WriteBuffer(db_user)
+    alert = Alert(user=db_user, login_raw_data=login_alert, name=alert_info["alert_name"], description=alert_info["alert_desc"])
+    alert.is_vip = db_user.username in app_config.vip_users
+    alert_buffer.add_alert(alert)
     # update user.risk_score if necessary
-    update_risk_level(db_user=alert.user, triggered_alert=alert, app_config=app_config)
+    update_risk_level(db_user=db_user, triggered_alert=alert, app_config=app_config, write_buffer=alert_buffer)
     # check filters
     alert_filter.match_filters(alert=alert, app_config=app_config)
-    alert.save()
+    if write_buffer is None:
+        alert_buffer.flush()
     return alert
 
 
-def check_fields(db_user: User, fields: list):
+def check_fields(db_user: User, fields: list, app_config: ConfigSnapshot = None):
     """Check different types of alerts based on login fields.
 
     :param db_user: user from DB
     :type db_user: User object
-    :param fields: list of login data of the user
-    :type fields: list
+    :param fields: time-ordered login data of the user, consumed incrementally
+    :type fields: iterable
+    :param app_config: snapshot of the Config shared by the detection run, if None it is read from the db
+    :type app_config: ConfigSnapshot
     """
 
-    db_config, _ = Config.objects.get_or_create(id=1)
+    db_config = app_config or get_config()
+    compactor = None
+    if settings.CERTEGO_BUFFALOGS_COMPACT_LOGINS:
+        # the duplicate logins are collapsed before the detection, without changing its alerts
+        compactor = LoginCompactor(db_config.atypical_country_days)
+        fields = compactor.compact(fields)
+    profile = UserProfile.load(db_user)
+    # the rows are saved together at the end of the batch
+    write_buffer = WriteBuffer(db_user)
+    # first pass: the checks of each login, evaluated against the profile updated login by login,
+    # and the travels between the consecutive logins, starting from the last login of the user
+    logins_checks = []
+    travels = TravelEvaluator(last_location=profile.last_location)
+    plan = DetectionPlan(db_user, db_config)
 
     for login in fields:
-        if login.get("intelligence_category", None) == "anonymizer":
-            # check the possible alert: ANONYMOUS_IP_LOGIN
-            alert_info = {
-                "alert_name": AlertDetectionType.ANONYMOUS_IP_LOGIN.value,
-                "alert_desc": f"{AlertDetectionType.ANONYMOUS_IP_LOGIN.label} from IP: {login['ip']} by User: {db_user.username}",
-            }
-            set_alert(db_user, login_alert=login, alert_info=alert_info, app_config=db_config)
+        login_checks = []
+        logins_checks.append((login, login_checks))
+        for detector in plan.get_detectors(login):
+            check = plan.run(detector, db_user, login, profile, travels)
+            if check is not None:
+                login_checks.append(check)
         if login["lat"] and login["lon"]:
-            if Login.objects.filter(user_id=db_user.id, index=login["index"]).exists():
-                agent_alert = False
-                country_alert = False
-                if login["agent"]:
-                    # check the possible alert: NEW_DEVICE
-                    agent_alert = check_new_device(db_user, login)
-                    if agent_alert:
-                        set_alert(db_user, login_alert=login, alert_info=agent_alert, app_config=db_config)
-
-                if login["country"]:
-                    # check the possible alerts: NEW_COUNTRY / ATYPICAL_COUNTRY
-                    country_alert = check_country(db_user, login, db_config)
-                    if country_alert:
-                        set_alert(db_user, login_alert=login, alert_info=country_alert, app_config=db_config)
-
-                if not db_user.usersip_set.filter(ip=login["ip"]).exists():
-                    last_user_login = db_user.login_set.latest("timestamp")
-                    logger.info(f"Calculating impossible travel: {login['id']}")
-                    travel_alert, travel_vel = calc_distance_impossible_travel(db_user, prev_login=last_user_login, last_login_user_fields=login)
-                    if travel_alert:
-                        new_alert = set_alert(db_user, login_alert=login, alert_info=travel_alert, app_config=db_config)
-                        new_alert.login_raw_data["buffalogs"] = {}
-                        new_alert.login_raw_data["buffalogs"]["start_country"] = last_user_login.country
-                        new_alert.login_raw_data["buffalogs"]["avg_speed"] = travel_vel
-                        new_alert.login_raw_data["buffalogs"]["start_lat"] = last_user_login.latitude
-                        new_alert.login_raw_data["buffalogs"]["start_lon"] = last_user_login.longitude
-                        new_alert.save()
+            if profile.has_index(login["index"]):
+                if not profile.has_ip(login["ip"]):
                     #   Add the new ip address from which the login comes to the db
-                    UsersIP.objects.create(user=db_user, ip=login["ip"])
+                    write_buffer.add_ip(UsersIP(user=db_user, ip=login["ip"]))
+                    profile.add_ip(login["ip"])
 
-                if Login.objects.filter(user=db_user, index=login["index"], country=login["country"], user_agent=login["agent"]).exists():
+                if profile.has_login(login):
                     logger.info(f"Updating login {login['id']} for user: {db_user.username}")
-                    update_model(db_user, login)
+                    write_buffer.update_logins(profile.update_login(login))
                 else:
                     logger.info(f"Adding new login {login['id']} for user: {db_user.username}")
-                    add_new_login(db_user, login)
+                    profile.add_login(add_new_login(db_user, login, write_buffer=write_buffer))
 
             else:
                 logger.info(f"Creating new login {login['id']} for user: {db_user.username}")
-                add_new_login(db_user, login)
-                UsersIP.objects.create(user=db_user, ip=login["ip"])
+                profile.add_login(add_new_login(db_user, login, write_buffer=write_buffer))
+                write_buffer.add_ip(UsersIP(user=db_user, ip=login["ip"]))
+                profile.add_ip(login["ip"])
+            travels.move_to(login)
         else:
             logger.info(f"No latitude or longitude for User {db_user.username}")
 
+    travels.evaluate(db_config.distance_accepted, db_config.vel_accepted)
+
+    # second pass: the alerts, in the order of the logins
+    for login, login_checks in logins_checks:
+        for check in login_checks:
+            if not isinstance(check, int):
+                set_alert(db_user, login_alert=login, alert_info=check, app_config=db_config, write_buffer=write_buffer)
+                continue
+            is_impossible_travel, travel_vel, (start_country, start_lat, start_lon) = travels.get_travel(check)
+            if is_impossible_travel:
+                travel_alert = get_impossible_travel_alert_info(db_user, login, start_country, travel_vel)
+                travel_info = {"start_country": start_country, "avg_speed": travel_vel, "start_lat": start_lat, "start_lon": start_lon}
+                set_alert(db_user, login_alert=login, alert_info=travel_alert, app_config=db_config, write_buffer=write_buffer, buffalogs_info=travel_info)
+
+    with transaction.atomic():
+        write_buffer.flush()
+        profile.save()
+    if compactor is not None and compactor.collapsed:
+        logger.info(f"Collapsed {compactor.collapsed} duplicate logins of {compactor.events} in {len(compactor.counts)} runs for user: {db_user.username}")
+    if plan.stats:
+        logger.info(f"Detectors stats for user {db_user.username}: {plan.stats}")
+
 
-def check_country(db_user: User, login_field: dict, app_config: Config) -> dict:
+def check_country(db_user: User, login_field: dict, app_config: Config, profile: UserProfile = None) -> dict:
     """
     Check Login from new Country and send alert
     """
+    if profile is None:
+        profile = UserProfile.from_rows(db_user)
     alert_info = {}
+    country_last_seen = profile.get_country_last_seen(login_field["country"])
     # check "New Country" alert
-    if db_user.login_set.filter(country=login_field["country"]).count() == 0:
+    if country_last_seen is None:
         alert_info["alert_name"] = AlertDetectionType.NEW_COUNTRY.value
         alert_info["alert_desc"] = (
             f"{AlertDetectionType.NEW_COUNTRY.label} for User: {db_user.username}, at: {login_field['timestamp']}, from: {login_field['country']}"
         )
     # check "Atypical Country" alert
-    elif (
-        datetime.fromisoformat(login_field["timestamp"]) - db_user.login_set.filter(country=login_field["country"]).last().timestamp
-    ).days >= app_config.atypical_country_days:
+    elif (get_login_datetime(login_field) - country_last_seen).days >= app_config.atypical_country_days:
         alert_info["alert_name"] = AlertDetectionType.ATYPICAL_COUNTRY.value
         alert_info["alert_desc"] = (
             f"{AlertDetectionType.ATYPICAL_COUNTRY.label} for User: {db_user.username}, at: {login_field['timestamp']}, from: {login_field['country']}"
@@ -155,29 +207,36 @@ def check_country(db_user: User, login_field: dict, app_config: Config) -> dict:
     return alert_info
 
 
-def check_new_device(db_user, login_field):
+def check_new_device(db_user, login_field, profile: UserProfile = None):
     """
     Check Login from new Device and send alert
     """
+    if profile is None:
+        profile = UserProfile.from_rows(db_user)
     alert_info = {}
-    if db_user.login_set.filter(user_agent=login_field["agent"]).count() == 0:
+    if not profile.has_agent(login_field["agent"]):
         timestamp = login_field["timestamp"]
         alert_info["alert_name"] = AlertDetectionType.NEW_DEVICE.value
         alert_info["alert_desc"] = f"{AlertDetectionType.NEW_DEVICE.label} for User: {db_user.username}, at: {timestamp}"
         return alert_info
 
 
-def add_new_login(db_user, new_login_field):
+def add_new_login(db_user, new_login_field, write_buffer: WriteBuffer = None):
     """Add new login if there isn't previous login on db relative to that user
 
     :param db_user: user from db
     :type db_user: object
-    :param new_login_field: dictionary with last login info
-    :type new_login_field: dict
+    :param new_login_field: last login info
+    :type new_login_field: LoginRecord or dict
+    :param write_buffer: buffer of the rows to save, if None the login is saved immediately
+    :type write_buffer: WriteBuffer
+
+    :return: the new login
+    :rtype: Login
     """
-    Login.objects.create(
+    login = Login(
         user_id=db_user.id,
-        timestamp=new_login_field["timestamp"],
+        timestamp=get_login_datetime(new_login_field),
         ip=new_login_field["ip"],
         latitude=new_login_field["lat"],
         longitude=new_login_field["lon"],
@@ -186,6 +245,11 @@ def add_new_login(db_user, new_login_field):
         index=new_login_field["index"],
         event_id=new_login_field["id"],
     )
+    if write_buffer is None:
+        login.save()
+    else:
+        write_buffer.add_login(login)
+    return login
 
 
 def update_model(db_user, new_login):
@@ -194,11 +258,11 @@ def update_model(db_user, new_login):
     :param db_user: user from DB
     :type db_user: User object
     :param new_login: new login info to update in to the DB
-    :type new_login: dict
+    :type new_login: LoginRecord or dict
     """
     try:
         db_user.login_set.filter(user_agent=new_login["agent"], country=new_login["country"], index=new_login["index"]).update(
-            timestamp=new_login["timestamp"],
+            timestamp=get_login_datetime(new_login),
             latitude=new_login["lat"],
             longitude=new_login["lon"],
             event_id=new_login["id"],
@@ -218,39 +282,122 @@ def update_model(db_user, new_login):
         )
 
 
-def calc_distance_impossible_travel(db_user, prev_login, last_login_user_fields):
+def calc_distance_impossible_travel(db_user, prev_login, last_login_user_fields, app_config: Config = None):
     """Compute distance and velocity to alert if impossible travel occurs
 
     :param db_user: user from db
     :type db_user: object
     :param prev_login: last login saved in db
     :type prev_login: object
-    :param last_login_user_fields: dictionary login from elastic
-    :type last_login_user_fields: dict
+    :param last_login_user_fields: login from elastic
+    :type last_login_user_fields: LoginRecord or dict
+    :param app_config: configuration of the detection, read from the db if not given
+    :type app_config: ConfigSnapshot
 
     :return: dictionary with info about the impossible travel alert
     :rtype: dict
     """
-    app_config = Config.objects.get(id=1)
+    if app_config is None:
+        app_config = get_config()
     alert_info = {}
-    vel = 0
-    distance_km = geodesic((prev_login.latitude, prev_login.longitude), (last_login_user_fields["lat"], last_login_user_fields["lon"])).km
+    diff_timestamp = get_login_datetime(last_login_user_fields) - prev_login.timestamp  # already aware in the db
+    _, velocities, travel_alerts = travel_distance.calc_travels(
+        [(prev_login.latitude, prev_login.longitude)],
+        [(last_login_user_fields["lat"], last_login_user_fields["lon"])],
+        [diff_timestamp.total_seconds() / 3600],
+        app_config.distance_accepted,
+        app_config.vel_accepted,
+    )
+    vel = int(velocities[0])
+    if travel_alerts[0]:
+        alert_info = get_impossible_travel_alert_info(db_user, last_login_user_fields, prev_login.country, vel)
+    return alert_info, vel
+
 
-    if distance_km > app_config.distance_accepted:
-        last_timestamp_datetimeObj_aware = timezone.make_aware(datetime.strptime(last_login_user_fields["timestamp"], "%Y-%m-%dT%H:%M:%S.%fZ"))
-        prev_timestamp_datetimeObj_aware = prev_login.timestamp  # already aware in the db
+def get_impossible_travel_alert_info(db_user: User, login: dict, prev_country: str, vel: int) -> dict:
+    """Build the info of the IMP_TRAVEL alert
+
+    :param db_user: user from db
+    :type db_user: User
+    :param login: login of the arrival of the travel
+    :type login: LoginRecord or dict
+    :param prev_country: country of the start of the travel
+    :type prev_country: str
+    :param vel: velocity of the travel in km/h
+    :type vel: int
+
+    :return: dictionary with info about the impossible travel alert
+    :rtype: dict
+    """
+    return {
+        "alert_name": AlertDetectionType.IMP_TRAVEL.value,
+        "alert_desc": f"{AlertDetectionType.IMP_TRAVEL.label} for User: {db_user.username}, at: {login['timestamp']}, from: {login['country']}, previous country: {prev_country}, distance covered at {vel} Km/h",
+    }
+
+
+class AnonymousIpDetector(Detector):
+    """ANONYMOUS_IP_LOGIN: login from an anonymizer ip"""
+
+    name = "anonymous_ip"
+    alert_types = (AlertDetectionType.ANONYMOUS_IP_LOGIN,)
+    inputs = ("intelligence_category",)
+    cost = 0
+
+    def check(self, db_user, login, profile, travels, app_config):
+        if login["intelligence_category"] == "anonymizer":
+            return {
+                "alert_name": AlertDetectionType.ANONYMOUS_IP_LOGIN.value,
+                "alert_desc": f"{AlertDetectionType.ANONYMOUS_IP_LOGIN.label} from IP: {login['ip']} by User: {db_user.username}",
+            }
+        return None
+
+
+class NewDeviceDetector(Detector):
+    """NEW_DEVICE: login from a user agent never seen for the user"""
+
+    name = "new_device"
+    alert_types = (AlertDetectionType.NEW_DEVICE,)
+    inputs = ("lat", "lon", "agent")
+    cost = 1
+
+    def check(self, db_user, login, profile, travels, app_config):
+        if profile.has_index(login["index"]):
+            return check_new_device(db_user, login, profile=profile) or None
+        return None
+
+
+class CountryDetector(Detector):
+    """NEW_COUNTRY / ATYPICAL_COUNTRY: login from a country never seen for the user, or not seen for Config.atypical_country_days"""
+
+    name = "country"
+    alert_types = (AlertDetectionType.NEW_COUNTRY, AlertDetectionType.ATYPICAL_COUNTRY)
+    inputs = ("lat", "lon", "country")
+    cost = 1
+
+    def check(self, db_user, login, profile, travels, app_config):
+        if profile.has_index(login["index"]):
+            return check_country(db_user, login, app_config, profile=profile) or None
+        return None
+
+
+class ImpossibleTravelDetector(Detector):
+    """IMP_TRAVEL: travel from the previous location of the user at a velocity higher than Config.vel_accepted.
+    The travel is only recorded here, all the travels of the batch are evaluated together by the TravelEvaluator
+    """
 
-        diff_timestamp = last_timestamp_datetimeObj_aware - prev_timestamp_datetimeObj_aware
-        diff_timestamp_hours = diff_timestamp.total_seconds() / 3600
+    name = "impossible_travel"
+    alert_types = (AlertDetectionType.IMP_TRAVEL,)
+    inputs = ("lat", "lon", "ip")
+    cost = 2
 
-        if diff_timestamp_hours == 0:
-            diff_timestamp_hours = 0.001
+    def check(self, db_user, login, profile, travels, app_config):
+        if profile.has_index(login["index"]) and not profile.has_ip(login["ip"]):
+            logger.info(f"Calculating impossible travel: {login['id']}")
+            return travels.add_travel(login)
+        return None
 
-        vel = distance_km / diff_timestamp_hours
 
-        if vel > app_config.vel_accepted:
-            alert_info["alert_name"] = AlertDetectionType.IMP_TRAVEL.value
-            alert_info["alert_desc"] = (
-                f"{AlertDetectionType.IMP_TRAVEL.label} for User: {db_user.username}, at: {last_login_user_fields['timestamp']}, from: {last_login_user_fields['country']}, previous country: {prev_login.country}, distance covered at {int(vel)} Km/h"
-            )
-    return alert_info, int(vel)
+register_detector(AnonymousIpDetector())
+register_detector(NewDeviceDetector())
+register_detector(CountryDetector())
+register_detector(ImpossibleTravelDetector())
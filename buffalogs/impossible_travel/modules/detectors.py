@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+from impossible_travel.modules import alert_filter
+
+# Registry of the detectors run by check_fields, by name
+_registry = {}
+
+
+class Detector:
+    """Base class of the detectors run on each login by check_fields.
+    Each detector declares the login fields it needs (`inputs`), the alert types it can trigger (`alert_types`)
+    and its relative `cost`, used by the DetectionPlan to skip it or to run the cheap detectors first.
+    check() returns the info of the alert to trigger, the index of a travel evaluated later by the TravelEvaluator, or None
+    """
+
+    name = None
+    alert_types = ()
+    inputs = ()
+    cost = 0
+
+    def is_applicable(self, login) -> bool:
+        """Check the login has all the inputs of the detector"""
+        return all(login.get(field) for field in self.inputs)
+
+    def check(self, db_user, login, profile, travels, app_config):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(name={self.name}, cost={self.cost})"
+
+
+def register_detector(detector: Detector) -> Detector:
+    """Add the detector to the registry, replacing the one with the same name"""
+    _registry[detector.name] = detector
+    return detector
+
+
+def get_detectors() -> list:
+    """Get the registered detectors, cheapest first (in registration order for the same cost)"""
+    return sorted(_registry.values(), key=lambda detector: detector.cost)
+
+
+class DetectionPlan:
+    """Detectors to run on the logins of a user in a detection run.
+    If skip_filtered is True (CERTEGO_BUFFALOGS_SKIP_FILTERED_DETECTORS by default), the detectors whose alerts would be filtered anyway
+    are skipped: the ones triggering only alert types in Config.filtered_alerts_types, all of them for the ignored users
+    and for the logins from ignored ips, allowed countries or ignored ISPs.
+    If collect_stats is True (CERTEGO_BUFFALOGS_DETECTOR_STATS by default), the calls, skipped logins, seconds and queries of each detector
+    are counted in the `stats` of the plan
+    """
+
+    def __init__(self, db_user, app_config, skip_filtered: bool = None, collect_stats: bool = None):
+        self.app_config = app_config
+        self.skip_filtered = settings.CERTEGO_BUFFALOGS_SKIP_FILTERED_DETECTORS if skip_filtered is None else skip_filtered
+        self.collect_stats = settings.CERTEGO_BUFFALOGS_DETECTOR_STATS if collect_stats is None else collect_stats
+        # detector name -> calls, skipped logins, total seconds and queries
+        self.stats = {}
+        self.all_detectors = get_detectors()
+        self.detectors = self.all_detectors
+        if self.skip_filtered:
+            if alert_filter.is_user_filtered(db_user, app_config):
+                self.detectors = []
+            else:
+                filtered_alerts_types = set(app_config.filtered_alerts_types or [])
+                self.detectors = [detector for detector in self.detectors if not set(detector.alert_types) <= filtered_alerts_types]
+
+    def get_detectors(self, login) -> list:
+        """Get the detectors to run on the login, cheapest first"""
+        if self.skip_filtered and alert_filter.is_login_filtered(login, self.app_config):
+            detectors = []
+        else:
+            detectors = [detector for detector in self.detectors if detector.is_applicable(login)]
+        if self.collect_stats and len(detectors) < len(self.all_detectors):
+            for detector in self.all_detectors:
+                if detector not in detectors:
+                    self._get_stats(detector.name)["skipped"] += 1
+        return detectors
+
+    def run(self, detector: Detector, db_user, login, profile, travels):
+        """Run the detector on the login, updating its time and queries stats if collect_stats is True"""
+        if not self.collect_stats:
+            return detector.check(db_user, login, profile, travels, self.app_config)
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            result = detector.check(db_user, login, profile, travels, self.app_config)
+        stats = self._get_stats(detector.name)
+        stats["calls"] += 1
+        stats["seconds"] += time.perf_counter() - start
+        stats["queries"] += queries[0]
+        return result
+
+    def _get_stats(self, name: str) -> dict:
+        if name not in self.stats:
+            self.stats[name] = {"calls": 0, "skipped": 0, "seconds": 0.0, "queries": 0}
+        return self.stats[name]
@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from geopy.distance import geodesic
+
+# Per-process registry of the distance cache, recreated by a forked process like the elasticsearch clients
+_registry = {"pid": None, "cache": None}
+_lock = threading.Lock()
+
+
+class DistanceCache:
+    """Bounded LRU cache of the geodesic distances between pairs of coordinates.
+    The coordinates are rounded to `precision` decimal digits, so the travels between the same locations (e.g. office to office,
+    home to VPN exit) reuse the same distance, computed on the rounded coordinates. The distance is symmetric, so the pairs are
+    stored regardless of their order.
+    If `shared_alias` is set, the distances are also shared through that Django cache (e.g. a Redis cache) between the processes
+    """
+
+    def __init__(self, maxsize: int, precision: int, shared_alias: str = None):
+        self.maxsize = maxsize
+        self.precision = precision
+        self.shared = caches[shared_alias] if shared_alias else None
+        self._distances = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(self, prev_coordinates, coordinates) -> tuple:
+        prev_point = (round(float(prev_coordinates[0]), self.precision), round(float(prev_coordinates[1]), self.precision))
+        point = (round(float(coordinates[0]), self.precision), round(float(coordinates[1]), self.precision))
+        return (prev_point, point) if prev_point <= point else (point, prev_point)
+
+    def get_distance(self, prev_coordinates, coordinates) -> float:
+        """Get the geodesic distance in km between the rounded coordinates, computing it only if it isn't cached
+
+        :param prev_coordinates: (lat, lon) of the first point
+        :type prev_coordinates: tuple
+        :param coordinates: (lat, lon) of the second point
+        :type coordinates: tuple
+
+        :return: geodesic distance in km
+        :rtype: float
+        """
+        key = self.get_key(prev_coordinates, coordinates)
+        with self._lock:
+            if key in self._distances:
+                self._distances.move_to_end(key)
+                self.hits += 1
+                return self._distances[key]
+        distance = None
+        if self.shared is not None:
+            distance = self.shared.get(self._get_shared_key(key))
+        if distance is None:
+            distance = geodesic(*key).km
+            if self.shared is not None:
+                self.shared.set(self._get_shared_key(key), distance, timeout=None)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.shared_hits += 1
+        self._store(key, distance)
+        return distance
+
+    def _store(self, key: tuple, distance: float):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._distances[key] = distance
+            self._distances.move_to_end(key)
+            while len(self._distances) > self.maxsize:
+                self._distances.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared_key(self, key: tuple) -> str:
+        (lat1, lon1), (lat2, lon2) = key
+        return f"buffalogs:distance:{lat1}:{lon1}:{lat2}:{lon2}"
+
+    def clear(self):
+        with self._lock:
+            self._distances.clear()
+
+    def stats(self) -> dict:
+        """Get the counters of the cache
+
+        :return: hits (local and shared), misses, evictions and current size
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._distances),
+                "maxsize": self.maxsize,
+            }
+
+
+def get_distance_cache() -> DistanceCache:
+    """Get the distance cache of the process, creating it at the first call from the CERTEGO_BUFFALOGS_DISTANCE_CACHE_* settings
+
+    :return: distance cache of the process
+    :rtype: DistanceCache
+    """
+    with _lock:
+        if _registry["pid"] != os.getpid() or _registry["cache"] is None:
+            _registry.update(
+                pid=os.getpid(),
+                cache=DistanceCache(
+                    maxsize=settings.CERTEGO_BUFFALOGS_DISTANCE_CACHE_SIZE,
+                    precision=settings.CERTEGO_BUFFALOGS_DISTANCE_CACHE_PRECISION,
+                    shared_alias=settings.CERTEGO_BUFFALOGS_DISTANCE_CACHE_SHARED_ALIAS,
+                ),
+            )
+        return _registry["cache"]
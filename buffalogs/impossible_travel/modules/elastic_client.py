@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from elasticsearch import VERSION as ELASTICSEARCH_VERSION
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch_dsl import connections
+
+logger = get_task_logger(__name__)
+
+# Per-process registry of the elasticsearch clients: the clients (and their connection pools) are created once
+# and reused by all the tasks and views of the process. The pid is checked so that a forked process (e.g. a celery prefork child)
+# creates its own clients instead of sharing the sockets of the parent
+_registry = {"pid": None, "client": None, "async_client": None, "loop": None}
+_lock = threading.Lock()
+
+
+def get_client_options():
+    """Build the options of the elasticsearch clients from the settings
+
+    :return: keyword arguments for the Elasticsearch and AsyncElasticsearch clients
+    :rtype: dict
+    """
+    options = {
+        "hosts": settings.CERTEGO_ELASTICSEARCH,
+        "request_timeout": settings.CERTEGO_BUFFALOGS_ELASTIC_REQUEST_TIMEOUT,
+        "verify_certs": settings.CERTEGO_BUFFALOGS_ELASTIC_VERIFY_CERTS,
+        "max_retries": settings.CERTEGO_BUFFALOGS_ELASTIC_MAX_RETRIES,
+        "retry_on_timeout": settings.CERTEGO_BUFFALOGS_ELASTIC_RETRY_ON_TIMEOUT,
+        "sniff_on_start": settings.CERTEGO_BUFFALOGS_ELASTIC_SNIFF,
+    }
+    if ELASTICSEARCH_VERSION[0] >= 8:
+        options["connections_per_node"] = settings.CERTEGO_BUFFALOGS_ELASTIC_CONNECTIONS_PER_NODE
+        options["sniff_on_node_failure"] = settings.CERTEGO_BUFFALOGS_ELASTIC_SNIFF
+    else:
+        options["maxsize"] = settings.CERTEGO_BUFFALOGS_ELASTIC_CONNECTIONS_PER_NODE
+        options["sniff_on_connection_fail"] = settings.CERTEGO_BUFFALOGS_ELASTIC_SNIFF
+        options["timeout"] = options.pop("request_timeout")
+    return options
+
+
+def _check_pid():
+    """Forget the clients inherited from the parent process"""
+    if _registry["pid"] != os.getpid():
+        _registry.update(pid=os.getpid(), client=None, async_client=None, loop=None)
+
+
+def get_elastic_client():
+    """Get the elasticsearch client of the process, creating it at the first call.
+    The client is also registered as the default elasticsearch_dsl connection, used by the Search objects
+
+    :return: elasticsearch client
+    :rtype: elasticsearch.Elasticsearch
+    """
+    with _lock:
+        _check_pid()
+        if _registry["client"] is None:
+            _registry["client"] = Elasticsearch(**get_client_options())
+            connections.add_connection("default", _registry["client"])
+            logger.info(f"Created the elasticsearch client for the process {_registry['pid']}")
+        return _registry["client"]
+
+
+def get_event_loop():
+    """Get the event loop of the process, running forever in a background thread, on which the async elasticsearch client is used
+
+    :return: event loop
+    :rtype: asyncio.AbstractEventLoop
+    """
+    with _lock:
+        _check_pid()
+        if _registry["loop"] is None:
+            _registry["loop"] = asyncio.new_event_loop()
+            threading.Thread(target=_registry["loop"].run_forever, name="elasticsearch-event-loop", daemon=True).start()
+        return _registry["loop"]
+
+
+def get_async_elastic_client():
+    """Get the async elasticsearch client of the process, creating it at the first call.
+    It must be used only by the coroutines running on the get_event_loop() loop
+
+    :return: async elasticsearch client
+    :rtype: elasticsearch.AsyncElasticsearch
+    """
+    with _lock:
+        _check_pid()
+        if _registry["async_client"] is None:
+            _registry["async_client"] = AsyncElasticsearch(**get_client_options())
+        return _registry["async_client"]
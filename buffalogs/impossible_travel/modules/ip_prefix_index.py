@@ -0,0 +1,96 @@
+from ipaddress import IPv6Address, ip_address, ip_network
+
+
+class IpPrefixIndex:
+    """Index of a list of IPs and networks (es. Config.ignored_ips), IPv4 and IPv6.
+    The networks are stored in a binary radix trie for each IP version, so an IP is checked walking at most the prefix length bits of the longest network,
+    regardless of the number of entries. The IPv4-mapped IPv6 addresses (es. ::ffff:1.2.3.4) are checked as IPv4.
+    The values that are not valid IPs or networks are only matched exactly, as strings
+    """
+
+    def __init__(self, values: list):
+        """
+        :param values: IPs or networks, es. ["127.0.0.1", "10.0.0.0/8", "2001:db8::/32"]
+        :type values: list
+        """
+        self.values = frozenset(values)
+        # a node is [child 0, child 1, is_network_end], one trie for each IP version
+        self._tries = {4: [None, None, False], 6: [None, None, False]}
+        self._depth = {4: 0, 6: 0}
+        for value in self.values:
+            network = _parse_network(value)
+            if network is None:
+                continue
+            self._insert(network.version, int(network.network_address), network.prefixlen, network.max_prefixlen)
+
+    def _insert(self, version: int, address: int, prefixlen: int, max_prefixlen: int):
+        node = self._tries[version]
+        for shift in range(max_prefixlen - 1, max_prefixlen - 1 - prefixlen, -1):
+            if node[2]:
+                # already included in a shorter network
+                return
+            bit = (address >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+        node[2] = True
+        node[0] = node[1] = None  # the longer networks are included in this one
+        self._depth[version] = max(self._depth[version], prefixlen)
+
+    def match(self, value: str) -> bool:
+        """Check if the IP is one of the values or is in one of the networks of the index"""
+        if not value:
+            return False
+        if value in self.values:
+            return True
+        try:
+            address = ip_address(value)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        node = self._tries[address.version]
+        number = int(address)
+        max_prefixlen = address.max_prefixlen
+        for shift in range(max_prefixlen - 1, max_prefixlen - 1 - self._depth[address.version], -1):
+            if node[2]:
+                return True
+            node = node[(number >> shift) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+    def find_match(self, value: str) -> str:
+        """Get the IP or the network of the index containing the IP, None if there isn't any.
+        It checks the values one by one, so it is used only to explain why an IP matched
+        """
+        if value in self.values:
+            return value
+        try:
+            address = ip_address(value)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        for item in sorted(self.values):
+            network = _parse_network(item)
+            if network is not None and address in network:
+                return item
+        return None
+
+    def __contains__(self, value: str) -> bool:
+        return self.match(value)
+
+    def __bool__(self):
+        return bool(self.values)
+
+
+def _parse_network(value: str):
+    """Parse the IP or network, with the IPv4-mapped IPv6 networks converted to IPv4. None if the value is not a valid IP or network"""
+    try:
+        network = ip_network(value, strict=False)
+    except ValueError:
+        return None
+    if isinstance(network.network_address, IPv6Address) and network.network_address.ipv4_mapped and network.prefixlen >= 96:
+        network = ip_network(f"{network.network_address.ipv4_mapped}/{network.prefixlen - 96}")
+    return network
@@ -0,0 +1,61 @@
+from impossible_travel.modules.login_record import get_login_datetime
+
+
+class LoginCompactor:
+    """Collapse the duplicate logins of a time-ordered batch of a user before the detection.
+    A run of consecutive logins with the same (index, ip, agent, country, lat, lon) is reduced to its first and last login:
+    the logins in the middle can't trigger any alert (their agent, country and ip are already known from the first one)
+    and the last one leaves the Login entry and the last location of the user as the whole run would.
+    The runs are split when they last Config.atypical_country_days, so the ATYPICAL_COUNTRY checks don't change,
+    and the logins without coordinates or from anonymizer ips (one alert each) are never collapsed
+    """
+
+    def __init__(self, atypical_country_days: int):
+        self.atypical_country_days = atypical_country_days
+        self.events = 0
+        self.kept = 0
+        # event id of the last login of each collapsed run -> number of logins it stands for (itself and the dropped ones)
+        self.counts = {}
+
+    @property
+    def collapsed(self) -> int:
+        """Number of logins removed by the compaction"""
+        return self.events - self.kept
+
+    def compact(self, logins):
+        """Yield the compacted logins, consuming the logins incrementally
+
+        :param logins: time-ordered logins of the user
+        :type logins: iterable
+
+        :return: the first and the last login of each run of duplicates, and the other logins
+        :rtype: generator
+        """
+        run_key, run_start, last, last_count = None, None, None, 0
+        for login in logins:
+            self.events += 1
+            key = self._get_key(login)
+            if key is not None and key == run_key and (get_login_datetime(login) - run_start).days < self.atypical_country_days:
+                # the previous last login of the run is dropped
+                last = login
+                last_count += 1
+                continue
+            if last is not None:
+                yield self._keep_last(last, last_count)
+                last, last_count = None, 0
+            self.kept += 1
+            yield login
+            run_key = key
+            run_start = get_login_datetime(login) if key is not None else None
+        if last is not None:
+            yield self._keep_last(last, last_count)
+
+    def _keep_last(self, login, count: int):
+        self.kept += 1
+        self.counts[login["id"]] = count
+        return login
+
+    def _get_key(self, login) -> tuple:
+        if not (login["lat"] and login["lon"]) or login.get("intelligence_category", None) == "anonymizer":
+            return None
+        return login["index"], login["ip"], login["agent"], login["country"], login["lat"], login["lon"]
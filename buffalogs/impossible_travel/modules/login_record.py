@@ -0,0 +1,129 @@
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.utils.dateparse import parse_datetime
+
+
+class LoginRecord:
+    """Compact normalized login used by the detection.
+    The fields are stored in slots, the timestamp is parsed once (timestamp_dt) and the repeated strings are interned.
+    It can be read like the login dicts (login["ip"], login.get("organization")) and converted with to_dict() for the alerts
+    """
+
+    __slots__ = ("timestamp", "id", "index", "ip", "agent", "organization", "lat", "lon", "country", "intelligence_category", "timestamp_dt")
+    # fields of the login dict, the optional ones are omitted if None
+    FIELDS = ("timestamp", "id", "index", "ip", "agent", "organization", "lat", "lon", "country", "intelligence_category")
+    OPTIONAL_FIELDS = frozenset(("organization", "intelligence_category"))
+
+    def __init__(self, timestamp, id, index, ip, agent, lat, lon, country, organization=None, intelligence_category=None):  # pylint: disable=redefined-builtin
+        self.timestamp = timestamp
+        self.timestamp_dt = parse_login_timestamp(timestamp)
+        self.id = id
+        self.index = index
+        self.ip = ip
+        self.agent = agent
+        self.organization = organization
+        self.lat = lat
+        self.lon = lon
+        self.country = country
+        self.intelligence_category = intelligence_category
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS or (key in self.OPTIONAL_FIELDS and getattr(self, key) is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in self.FIELDS if key in self]
+
+    def to_dict(self):
+        """Convert the record in the login dict saved in the Alert.login_raw_data"""
+        return {key: getattr(self, key) for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, LoginRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"LoginRecord({self.to_dict()})"
+
+    @classmethod
+    def from_source(cls, source, index, event_id):
+        """Normalize the _source of a login event
+
+        :param source: _source of the login event
+        :type source: dict
+        :param index: index of the login event
+        :type index: str
+        :param event_id: id of the login event
+        :type event_id: str
+
+        :return: normalized login, None if the login has no geo info
+        :rtype: LoginRecord
+        """
+        source_field = source.get("source")
+        if not source_field or "geo" not in source_field:
+            return None  # up to now: no geo info --> login discard
+        geo = source_field["geo"]
+        if "location" in geo and "country_name" in geo:
+            lat, lon, country = geo["location"]["lat"], geo["location"]["lon"], sys.intern(geo["country_name"])
+        else:
+            lat, lon, country = None, None, ""
+        user_agent = source.get("user_agent")
+        return cls(
+            timestamp=source["@timestamp"],
+            id=event_id,
+            index=normalize_index(index),
+            ip=source_field["ip"],
+            agent=user_agent["original"] if user_agent else "",
+            lat=lat,
+            lon=lon,
+            country=country,
+            organization=source_field["as"]["organization"]["name"] if "as" in source_field else None,
+            intelligence_category=source_field.get("intelligence_category"),
+        )
+
+
+@lru_cache(maxsize=1024)
+def normalize_index(index):
+    """Map the index of the login event to the index saved in the Login (e.g. "cloud-2023-5-3" --> "cloud")"""
+    prefix = index.split("-")[0]
+    return sys.intern("fw-proxy" if prefix == "fw" else prefix)
+
+
+def parse_login_timestamp(timestamp):
+    """Parse the ISO-8601 timestamp of a login, as an aware datetime (UTC if the timezone is missing)"""
+    if isinstance(timestamp, datetime):
+        return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(timestamp[:-1] + "+00:00" if timestamp.endswith("Z") else timestamp)
+    except ValueError:
+        # e.g. nanoseconds precision
+        parsed = parse_datetime(timestamp)
+        if parsed is None:
+            raise
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def get_login_datetime(login):
+    """Get the timestamp of a login (LoginRecord or dict) as an aware datetime, parsing it only if needed"""
+    if isinstance(login, LoginRecord):
+        return login.timestamp_dt
+    return parse_login_timestamp(login["timestamp"])
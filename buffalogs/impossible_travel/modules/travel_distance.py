@@ -0,0 +1,62 @@
+import numpy as np
+from django.conf import settings
+from impossible_travel.modules.distance_cache import get_distance_cache
+
+# mean Earth radius (IUGG)
+EARTH_RADIUS_KM = 6371.0088
+# upper bound of the relative error of the haversine distance with respect to the geodesic distance on the WGS-84 ellipsoid (about 0.56%)
+HAVERSINE_MAX_ERROR = 0.01
+
+
+class DistanceMode:
+    # haversine distances only
+    HAVERSINE = "haversine"
+    # haversine distances, replaced by the exact geodesic distances for the travels that can exceed the thresholds.
+    # The geodesic distances are cached by the DistanceCache, on the coordinates rounded to CERTEGO_BUFFALOGS_DISTANCE_CACHE_PRECISION digits
+    GEODESIC = "geodesic"
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized great-circle distance in km between the arrays of coordinates (in degrees)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=float)) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def calc_travels(prev_coordinates: list, coordinates: list, hours: list, distance_accepted: float, vel_accepted: float, mode: str = None) -> tuple:
+    """Compute in one pass the distances and the velocities of a batch of travels and which of them are impossible travels
+
+    :param prev_coordinates: (lat, lon) of the starting point of each travel
+    :type prev_coordinates: list
+    :param coordinates: (lat, lon) of the arrival point of each travel
+    :type coordinates: list
+    :param hours: duration of each travel in hours
+    :type hours: list
+    :param distance_accepted: max distance in km that doesn't trigger the alert
+    :type distance_accepted: float
+    :param vel_accepted: max velocity in km/h that doesn't trigger the alert
+    :type vel_accepted: float
+    :param mode: DistanceMode, CERTEGO_BUFFALOGS_DISTANCE_MODE by default
+    :type mode: str
+
+    :return: distances in km, velocities in km/h (0 if the distance is accepted) and impossible travels mask.
+        In GEODESIC mode the distances and the velocities are exact for the travels that can be impossible travels
+    :rtype: tuple
+    """
+    mode = mode or settings.CERTEGO_BUFFALOGS_DISTANCE_MODE
+    prev_coordinates = np.asarray(prev_coordinates, dtype=float).reshape(-1, 2)
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    hours = np.asarray(hours, dtype=float)
+    hours = np.where(hours == 0, 0.001, hours)
+    distances = haversine_km(prev_coordinates[:, 0], prev_coordinates[:, 1], coordinates[:, 0], coordinates[:, 1])
+    if mode == DistanceMode.GEODESIC:
+        max_distances = distances * (1 + HAVERSINE_MAX_ERROR)
+        candidates = (max_distances > distance_accepted) & (max_distances / hours > vel_accepted)
+        distance_cache = get_distance_cache()
+        for i in np.flatnonzero(candidates):
+            distances[i] = distance_cache.get_distance(prev_coordinates[i], coordinates[i])
+    elif mode != DistanceMode.HAVERSINE:
+        raise ValueError(f"Unsupported distance mode: {mode}")
+    velocities = np.where(distances > distance_accepted, distances / hours, 0.0)
+    alerts = (distances > distance_accepted) & (velocities > vel_accepted)
+    return distances, velocities, alerts
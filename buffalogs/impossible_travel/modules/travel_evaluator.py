@@ -0,0 +1,61 @@
+from impossible_travel.modules import travel_distance
+from impossible_travel.modules.login_record import get_login_datetime
+
+
+class TravelEvaluator:
+    """Sequence-aware evaluation of the impossible travels of the time-ordered logins of a user batch.
+    It walks the batch in memory keeping the last location of the user, starting from the last login saved for the user:
+    each travel is recorded from the last location to the new login, then the new login becomes the last location.
+    The recorded travels are evaluated together by evaluate()
+    """
+
+    def __init__(self, last_location: tuple = None):
+        # (country, lat, lon, timestamp) of the last login
+        self.last_location = last_location
+        # (country, lat, lon) of the start of each travel
+        self.starts = []
+        self._prev_coordinates = []
+        self._coordinates = []
+        self._hours = []
+        self._velocities = None
+        self._alerts = None
+
+    def add_travel(self, login) -> int:
+        """Record the travel from the last location to the login
+
+        :param login: login of the arrival of the travel
+        :type login: LoginRecord or dict
+
+        :return: index of the travel, None if there isn't a previous location
+        :rtype: int
+        """
+        if self.last_location is None:
+            return None
+        country, lat, lon, timestamp = self.last_location
+        self.starts.append((country, lat, lon))
+        self._prev_coordinates.append((lat, lon))
+        self._coordinates.append((login["lat"], login["lon"]))
+        self._hours.append((get_login_datetime(login) - timestamp).total_seconds() / 3600)
+        return len(self.starts) - 1
+
+    def move_to(self, login):
+        """Set the login as the last location of the user"""
+        self.last_location = (login["country"], login["lat"], login["lon"], get_login_datetime(login))
+
+    def evaluate(self, distance_accepted: float, vel_accepted: float):
+        """Compute at once the velocities of all the recorded travels and which of them are impossible travels"""
+        if self.starts:
+            _, self._velocities, self._alerts = travel_distance.calc_travels(
+                self._prev_coordinates, self._coordinates, self._hours, distance_accepted, vel_accepted
+            )
+
+    def get_travel(self, index: int) -> tuple:
+        """Get the result of a travel, after evaluate()
+
+        :param index: index of the travel returned by add_travel()
+        :type index: int
+
+        :return: if it is an impossible travel, its velocity in km/h and its start (country, lat, lon)
+        :rtype: tuple
+        """
+        return bool(self._alerts[index]), int(self._velocities[index]), self.starts[index]
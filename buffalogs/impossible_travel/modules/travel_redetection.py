@@ -0,0 +1,194 @@
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import connection, transaction
+from impossible_travel.constants import AlertDetectionType, UserRiskScoreType
+from impossible_travel.models import Alert, User
+from impossible_travel.modules import alert_filter
+from impossible_travel.modules.config_snapshot import get_config
+from impossible_travel.modules.travel_distance import EARTH_RADIUS_KM, HAVERSINE_MAX_ERROR, DistanceMode, calc_travels
+
+logger = get_task_logger(__name__)
+
+# Travels between the consecutive Login entries of each user, computed with LAG() over the logins of the user ordered by timestamp.
+# The distances are haversine distances, the hours of the travels at the same time are 0.001 as in travel_distance.calc_travels.
+# The travels are screened with the haversine distances increased by screen_factor: in GEODESIC mode they are candidates, checked with calc_travels
+TRAVELS_SQL = """
+WITH logins AS (
+    SELECT l."id", l."user_id", l."timestamp", l."latitude", l."longitude", l."country", l."user_agent", l."index", l."event_id", l."ip",
+        LAG(l."latitude") OVER w AS "prev_latitude",
+        LAG(l."longitude") OVER w AS "prev_longitude",
+        LAG(l."country") OVER w AS "prev_country",
+        LAG(l."timestamp") OVER w AS "prev_timestamp"
+    FROM "impossible_travel_login" l
+    WHERE l."latitude" IS NOT NULL AND l."longitude" IS NOT NULL {users_filter}
+    WINDOW w AS (PARTITION BY l."user_id" ORDER BY l."timestamp", l."id")
+),
+distances AS (
+    SELECT logins.*,
+        2 * %(earth_radius)s * ASIN(SQRT(LEAST(1,
+            POWER(SIN(RADIANS("latitude" - "prev_latitude") / 2), 2)
+            + COS(RADIANS("prev_latitude")) * COS(RADIANS("latitude")) * POWER(SIN(RADIANS("longitude" - "prev_longitude") / 2), 2)
+        ))) AS "distance",
+        COALESCE(NULLIF(EXTRACT(EPOCH FROM "timestamp" - "prev_timestamp") / 3600, 0), 0.001) AS "hours"
+    FROM logins
+    WHERE "prev_latitude" IS NOT NULL AND "prev_longitude" IS NOT NULL
+),
+travels AS (
+    SELECT distances.*, TRUNC("distance" / "hours")::integer AS "vel",
+        TO_CHAR("timestamp" AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"') AS "login_timestamp"
+    FROM distances
+    WHERE "distance" * %(screen_factor)s > %(distance_accepted)s AND "distance" * %(screen_factor)s / "hours" > %(vel_accepted)s {time_filter}
+        AND NOT EXISTS (
+            SELECT 1 FROM "impossible_travel_alert" a
+            WHERE a."user_id" = distances."user_id" AND a."name" = %(alert_name)s AND a."login_raw_data" ->> 'id' = distances."event_id"
+        )
+)
+"""
+
+# Velocities of the travels to insert: the haversine ones of all the travels, or the exact ones of the geodesic check (GEODESIC_CHECKED_SQL)
+HAVERSINE_CHECKED_SQL = """,
+checked AS (SELECT "id", "vel" FROM travels)"""
+GEODESIC_CHECKED_SQL = """,
+checked AS (SELECT * FROM UNNEST(%(checked_ids)s::bigint[], %(checked_vels)s::integer[]) AS c("id", "vel"))"""
+
+INSERT_ALERTS_SQL = """,
+inserted AS (
+    INSERT INTO "impossible_travel_alert" ("name", "user_id", "login_raw_data", "created", "updated", "description", "is_vip", "filter_type", "notified")
+    SELECT %(alert_name)s, t."user_id",
+        JSONB_BUILD_OBJECT(
+            'id', t."event_id", 'index', t."index", 'ip', t."ip", 'agent', t."user_agent", 'lat', t."latitude", 'lon', t."longitude",
+            'country', t."country", 'timestamp', t."login_timestamp",
+            'buffalogs', JSONB_BUILD_OBJECT('start_country', t."prev_country", 'avg_speed', c."vel", 'start_lat', t."prev_latitude", 'start_lon', t."prev_longitude")
+        ),
+        NOW(), NOW(),
+        FORMAT('%%s for User: %%s, at: %%s, from: %%s, previous country: %%s, distance covered at %%s Km/h',
+            %(alert_label)s, u."username", t."login_timestamp", t."country", t."prev_country", c."vel"),
+        u."username" = ANY(%(vip_users)s), '{{}}', FALSE
+    FROM travels t JOIN checked c ON c."id" = t."id" JOIN "impossible_travel_user" u ON u."id" = t."user_id"
+    ORDER BY t."user_id", t."timestamp", t."id"
+    RETURNING "id", "user_id"
+),
+counters AS (
+    UPDATE "impossible_travel_user" u SET "alert_count" = u."alert_count" + c."count"
+    FROM (SELECT "user_id", COUNT(*) AS "count" FROM inserted GROUP BY "user_id") c
+    WHERE u."id" = c."user_id"
+    RETURNING u."id"
+)
+SELECT inserted."id" FROM inserted
+"""
+
+
+def redetect_impossible_travels(
+    distance_accepted: float = None,
+    vel_accepted: float = None,
+    start_date=None,
+    end_date=None,
+    usernames: list = None,
+    dry_run: bool = False,
+    mode: str = None,
+) -> int:
+    """Re-evaluate in Postgres the impossible travels between the consecutive Login entries of the users, e.g. after a change of Config.vel_accepted.
+    The travels are computed with a window function over the logins of each user and the missing IMP_TRAVEL alerts are inserted set-wise,
+    increasing the User.alert_count in the same query. Then the filters are applied to the new alerts and the risk_score of their users is updated.
+    The Login entries keep only the last login for each index, country and user agent of the user, so only the travels between them are re-evaluated.
+    As in the detection, in GEODESIC mode the travels that can exceed the thresholds with the haversine distance are checked with the exact
+    geodesic distance by travel_distance.calc_travels before inserting their alerts
+
+    :param distance_accepted: max distance in km that doesn't trigger the alert, if None Config.distance_accepted
+    :type distance_accepted: float
+    :param vel_accepted: max velocity in km/h that doesn't trigger the alert, if None Config.vel_accepted
+    :type vel_accepted: float
+    :param start_date: re-evaluate only the travels arrived from this date
+    :type start_date: datetime
+    :param end_date: re-evaluate only the travels arrived before this date
+    :type end_date: datetime
+    :param usernames: re-evaluate only the travels of these users, all the users if None
+    :type usernames: list
+    :param dry_run: only count the impossible travels without an alert, without inserting them
+    :type dry_run: bool
+    :param mode: travel_distance.DistanceMode of the distances, CERTEGO_BUFFALOGS_DISTANCE_MODE by default
+    :type mode: str
+
+    :return: number of alerts inserted (or to insert, if dry_run)
+    :rtype: int
+    """
+    app_config = get_config()
+    mode = mode or settings.CERTEGO_BUFFALOGS_DISTANCE_MODE
+    if mode not in (DistanceMode.HAVERSINE, DistanceMode.GEODESIC):
+        raise ValueError(f"Unsupported distance mode: {mode}")
+    params = {
+        "earth_radius": EARTH_RADIUS_KM,
+        "distance_accepted": app_config.distance_accepted if distance_accepted is None else distance_accepted,
+        "vel_accepted": app_config.vel_accepted if vel_accepted is None else vel_accepted,
+        "alert_name": AlertDetectionType.IMP_TRAVEL.value,
+        "alert_label": str(AlertDetectionType.IMP_TRAVEL.label),
+        "vip_users": list(app_config.vip_users),
+        "screen_factor": 1 + HAVERSINE_MAX_ERROR if mode == DistanceMode.GEODESIC else 1,
+    }
+    users_filter, time_filter = "", ""
+    if usernames is not None:
+        users_filter = 'AND l."user_id" IN (SELECT "id" FROM "impossible_travel_user" WHERE "username" = ANY(%(usernames)s))'
+        params["usernames"] = list(usernames)
+    if start_date is not None:
+        time_filter += 'AND "timestamp" >= %(start_date)s '
+        params["start_date"] = start_date
+    if end_date is not None:
+        time_filter += 'AND "timestamp" < %(end_date)s '
+        params["end_date"] = end_date
+    travels_sql = TRAVELS_SQL.format(users_filter=users_filter, time_filter=time_filter)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if mode == DistanceMode.GEODESIC:
+            params["checked_ids"], params["checked_vels"] = _check_geodesic_travels(cursor, travels_sql, params)
+            if dry_run:
+                return len(params["checked_ids"])
+            checked_sql = GEODESIC_CHECKED_SQL
+        elif dry_run:
+            cursor.execute(travels_sql + "SELECT COUNT(*) FROM travels", params)
+            return cursor.fetchone()[0]
+        else:
+            checked_sql = HAVERSINE_CHECKED_SQL
+        cursor.execute(travels_sql + checked_sql + INSERT_ALERTS_SQL.format(), params)
+        alert_ids = [row[0] for row in cursor.fetchall()]
+        if alert_ids:
+            _update_new_alerts(alert_ids, app_config)
+    logger.info(f"Re-detection of the impossible travels: {len(alert_ids)} new alerts")
+    return len(alert_ids)
+
+
+def _check_geodesic_travels(cursor, travels_sql: str, params: dict) -> tuple:
+    """Check the candidate travels found with the haversine distances with the exact geodesic distances, as in the detection
+
+    :return: ids of the Login entries of the confirmed impossible travels and their velocities in km/h
+    :rtype: tuple
+    """
+    cursor.execute(travels_sql + 'SELECT "id", "prev_latitude", "prev_longitude", "latitude", "longitude", "hours" FROM travels', params)
+    rows = cursor.fetchall()
+    if not rows:
+        return [], []
+    _, velocities, alerts = calc_travels(
+        [(row[1], row[2]) for row in rows],
+        [(row[3], row[4]) for row in rows],
+        [float(row[5]) for row in rows],
+        params["distance_accepted"],
+        params["vel_accepted"],
+        mode=DistanceMode.GEODESIC,
+    )
+    checked = [(row[0], int(velocity)) for row, velocity, alert in zip(rows, velocities, alerts) if alert]
+    return [login_id for login_id, _ in checked], [velocity for _, velocity in checked]
+
+
+def _update_new_alerts(alert_ids: list, app_config):
+    """Update the risk_score of the users of the new alerts (without the USER_RISK_THRESHOLD alerts) and apply the filters to the alerts"""
+    users = {}
+    for db_user in User.objects.filter(alert__id__in=alert_ids).distinct():
+        new_risk_level = UserRiskScoreType.get_risk_level(db_user.alert_count)
+        if new_risk_level != db_user.risk_score:
+            db_user.risk_score = new_risk_level
+            db_user.save(update_fields=["risk_score", "updated"])
+        users[db_user.id] = db_user
+    alerts = list(Alert.objects.filter(id__in=alert_ids))
+    for alert in alerts:
+        alert.user = users[alert.user_id]
+    alert_filter.match_filters_batch(alerts, app_config)
+    Alert.objects.bulk_update([alert for alert in alerts if alert.filter_type], ["filter_type"])
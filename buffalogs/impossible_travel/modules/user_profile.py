@@ -0,0 +1,153 @@
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from impossible_travel.models import Login, User, UserDetectionState, UsersIP
+from impossible_travel.modules.login_record import get_login_datetime
+
+
+def hash_value(*values: str) -> str:
+    """Compact hash of the given strings, used to store the user agents and the login keys in the UserDetectionState"""
+    return hashlib.blake2b("\x1f".join(values).encode(), digest_size=8).hexdigest()
+
+
+class UserProfile:
+    """In-memory profile of the user used by the detection of a batch of logins: indexes, user agents, last login per country,
+    ips and Login entries of the user and its last location.
+    It is loaded with a single lookup from the UserDetectionState of the user (or from its Login and UsersIP rows, if there is no state yet
+    or if the rows of the state have been deleted in the meantime)
+    and then it is kept up-to-date in memory with the logins added or updated by the detection, so the checks of each login don't query the db.
+    save() stores it back in the UserDetectionState
+    """
+
+    def __init__(self, db_user: User):
+        self.db_user = db_user
+        self.state = None
+        self.indexes = set()
+        # hashes of the user agents
+        self.agents = set()
+        # country -> timestamp of the last login from it
+        self.countries = {}
+        # hash of (index, country, user_agent) -> Login entries updated together by the detection
+        self.logins = {}
+        self.ips = set()
+        # (country, lat, lon, timestamp) of the most recent login
+        self.last_location = None
+
+    @classmethod
+    def from_rows(cls, db_user: User):
+        """Build the profile from the Login and UsersIP rows of the user, with two queries"""
+        profile = cls(db_user)
+        for login in db_user.login_set.order_by("id"):
+            profile._add(login)
+        profile.ips = set(db_user.usersip_set.values_list("ip", flat=True))
+        return profile
+
+    @classmethod
+    def load(cls, db_user: User):
+        """Load the profile from the UserDetectionState of the user, with a single query if the state exists.
+        The state is checked against the number of Login and UsersIP rows of the user: if they don't match (es. the rows have been deleted
+        out of the detection), the profile is rebuilt from the rows
+        """
+        state = (
+            UserDetectionState.objects.filter(user=db_user)
+            .annotate(login_count=_count_user_rows(Login, "id"), ip_count=_count_user_rows(UsersIP, "ip"))
+            .first()
+        )
+        if state is None or not _is_state_consistent(state):
+            profile = cls.from_rows(db_user)
+            profile.state = state or UserDetectionState(user=db_user)
+            return profile
+        profile = cls(db_user)
+        profile.state = state
+        profile.indexes = set(state.indexes)
+        profile.agents = set(state.agents)
+        profile.countries = {country: datetime.fromisoformat(timestamp) for country, timestamp in state.countries.items()}
+        # the Login entries are updated by id, so only their ids are needed
+        profile.logins = {key: [Login(pk=pk, user_id=db_user.id) for pk in pks] for key, pks in state.logins.items()}
+        profile.ips = set(state.ips)
+        if state.last_login_timestamp is not None:
+            profile.last_location = (state.last_login_country, state.last_login_latitude, state.last_login_longitude, state.last_login_timestamp)
+        return profile
+
+    def save(self):
+        """Save the profile in the UserDetectionState of the user. The new Login entries must be already saved"""
+        state = self.state or UserDetectionState(user=self.db_user)
+        state.indexes = sorted(self.indexes)
+        state.agents = sorted(self.agents)
+        state.countries = {country: timestamp.isoformat() for country, timestamp in self.countries.items()}
+        state.logins = {key: [entry.pk for entry in entries] for key, entries in self.logins.items()}
+        state.ips = sorted(self.ips)
+        if self.last_location is not None:
+            state.last_login_country, state.last_login_latitude, state.last_login_longitude, state.last_login_timestamp = self.last_location
+        state.save()
+        self.state = state
+
+    def _add(self, login: Login):
+        self.indexes.add(login.index)
+        self.agents.add(hash_value(login.user_agent))
+        self.logins.setdefault(hash_value(login.index, login.country, login.user_agent), []).append(login)
+        self._see(login.country, login.latitude, login.longitude, login.timestamp)
+
+    def _see(self, country: str, lat: float, lon: float, timestamp: datetime):
+        if country not in self.countries or timestamp > self.countries[country]:
+            self.countries[country] = timestamp
+        if self.last_location is None or timestamp >= self.last_location[3]:
+            self.last_location = (country, lat, lon, timestamp)
+
+    def has_index(self, index: str) -> bool:
+        return index in self.indexes
+
+    def has_agent(self, agent: str) -> bool:
+        return hash_value(agent) in self.agents
+
+    def get_country_last_seen(self, country: str) -> datetime:
+        """Get the timestamp of the last login from the country, None if the user has never logged in from it"""
+        return self.countries.get(country)
+
+    def has_ip(self, ip: str) -> bool:
+        return self._prep_ip(ip) in self.ips
+
+    def add_ip(self, ip: str):
+        """Track an ip just added to the UsersIP of the user"""
+        self.ips.add(self._prep_ip(ip))
+
+    def has_login(self, login) -> bool:
+        return hash_value(login["index"], login["country"], login["agent"]) in self.logins
+
+    def add_login(self, login: Login):
+        """Track a Login just added for the user"""
+        self._add(login)
+
+    def update_login(self, new_login):
+        """Apply the update_model() of the new login to the entries with the same index, country and user_agent
+
+        :return: the updated Login entries, to be saved
+        :rtype: list
+        """
+        timestamp = get_login_datetime(new_login)
+        entries = self.logins.get(hash_value(new_login["index"], new_login["country"], new_login["agent"]), [])
+        for entry in entries:
+            entry.timestamp = timestamp
+            entry.latitude = new_login["lat"]
+            entry.longitude = new_login["lon"]
+            entry.event_id = new_login["id"]
+            entry.ip = new_login["ip"]
+        self._see(new_login["country"], new_login["lat"], new_login["lon"], timestamp)
+        return entries
+
+    def _prep_ip(self, ip: str) -> str:
+        # the ips are compared as saved in the db (e.g. the IPv6 addresses are normalized)
+        return UsersIP._meta.get_field("ip").get_prep_value(ip)
+
+
+def _count_user_rows(model, field: str) -> Coalesce:
+    """Subquery counting the distinct values of the field in the rows of the model of the state user"""
+    rows = model.objects.filter(user_id=OuterRef("user_id")).order_by().values("user_id").annotate(count=Count(field, distinct=True)).values("count")
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def _is_state_consistent(state: UserDetectionState) -> bool:
+    """Check that the Login and UsersIP rows of the state still exist"""
+    return state.login_count == sum(len(pks) for pks in state.logins.values()) and state.ip_count == len(state.ips)
@@ -0,0 +1,76 @@
+from celery.utils.log import get_task_logger
+from django.db import transaction
+from django.db.models import F
+from impossible_travel.models import Alert, Login, User, UsersIP
+
+logger = get_task_logger(__name__)
+
+
+class WriteBuffer:
+    """Collect the rows written by the detection of a batch of logins of a user and save them together with flush(),
+    with bulk_create/bulk_update in a single transaction instead of a round trip for each row
+    """
+
+    # fields changed by the update of a login (same as detection.update_model)
+    LOGIN_UPDATE_FIELDS = ["timestamp", "latitude", "longitude", "event_id", "ip"]
+
+    def __init__(self, db_user: User):
+        self.db_user = db_user
+        self.new_logins = []
+        # id() of the Login -> Login, to update each entry once
+        self.updated_logins = {}
+        self.new_ips = []
+        self.new_alerts = []
+        self.user_changed = False
+
+    def add_login(self, login: Login):
+        self.new_logins.append(login)
+
+    def update_logins(self, logins: list):
+        """Save the changes of the given Login entries, the ones not yet created are saved with the new logins"""
+        for login in logins:
+            if login.pk is not None:
+                self.updated_logins[id(login)] = login
+
+    def add_ip(self, users_ip: UsersIP):
+        self.new_ips.append(users_ip)
+
+    def add_alert(self, alert: Alert):
+        """Add a fully built alert. It can still be changed in place until the flush.
+        The alert_count of the user is increased in memory immediately, and on db by the flush
+        """
+        self.new_alerts.append(alert)
+        self.db_user.alert_count += 1
+
+    def update_user(self):
+        """Save the changes of the risk_score of the user"""
+        self.user_changed = True
+
+    def __len__(self):
+        return len(self.new_logins) + len(self.updated_logins) + len(self.new_ips) + len(self.new_alerts) + int(self.user_changed)
+
+    def flush(self):
+        """Save all the collected rows in a single transaction and empty the buffer"""
+        if not len(self):
+            return
+        with transaction.atomic():
+            if self.user_changed:
+                self.db_user.save(update_fields=["risk_score", "updated"])
+            if self.new_logins:
+                Login.objects.bulk_create(self.new_logins)
+            if self.updated_logins:
+                Login.objects.bulk_update(list(self.updated_logins.values()), self.LOGIN_UPDATE_FIELDS)
+            if self.new_ips:
+                UsersIP.objects.bulk_create(self.new_ips)
+            if self.new_alerts:
+                Alert.objects.bulk_create(self.new_alerts)
+                User.objects.filter(pk=self.db_user.pk).update(alert_count=F("alert_count") + len(self.new_alerts))
+        logger.info(
+            f"Saved for user {self.db_user.username}: {len(self.new_logins)} new logins, {len(self.updated_logins)} updated logins, "
+            f"{len(self.new_ips)} new ips and {len(self.new_alerts)} alerts"
+        )
+        self.new_logins = []
+        self.updated_logins = {}
+        self.new_ips = []
+        self.new_alerts = []
+        self.user_changed = False
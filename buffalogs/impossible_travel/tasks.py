@@ -1,18 +1,27 @@
-from datetime import timedelta
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 
-from celery import shared_task
+from celery import chain, chord, group, shared_task
 from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.db import connections, transaction
 from django.utils import timezone
-from elasticsearch_dsl import Search, connections
 from impossible_travel.alerting.alert_factory import AlertFactory
-from impossible_travel.models import Alert, Config, Login, TaskSettings, User, UsersIP
-from impossible_travel.modules import detection
+from impossible_travel.ingestion.base_ingestion import get_user_shard
+from impossible_travel.ingestion.elasticsearch_ingestion import ElasticsearchIngestion
+from impossible_travel.ingestion.ingestion_factory import IngestionFactory
+from impossible_travel.models import Alert, BackfillCheckpoint, Config, Login, TaskSettings, User, UsersIP
+from impossible_travel.modules import catch_up, detection
+from impossible_travel.modules.async_ingestion import AsyncIngestionEngine
+from impossible_travel.modules.config_snapshot import get_config
+from impossible_travel.modules.distance_cache import get_distance_cache
+from impossible_travel.modules.login_record import LoginRecord
 
 logger = get_task_logger(__name__)
 
 
-@shared_task(name="BuffalogsCleanModelsPeriodicallyTask")
+@shared_task(name="BuffalogsCleanModelsPeriodicallyTask", ignore_result=True)
 def clean_models_periodically():
     """Delete old data in the models"""
     app_config = Config.objects.get(id=1)
@@ -21,17 +30,50 @@ def clean_models_periodically():
     User.objects.filter(updated__lte=delete_user_time).delete()
 
     delete_login_time = now - timedelta(days=app_config.login_max_days)
+    delete_ip_time = now - timedelta(days=app_config.ip_max_days)
+    # the detection states of the users losing logins or ips are removed by the deletes, so they are rebuilt from the remaining rows
     Login.objects.filter(updated__lte=delete_login_time).delete()
 
     delete_alert_time = now - timedelta(days=app_config.alert_max_days)
     Alert.objects.filter(updated__lte=delete_alert_time).delete()
 
-    delete_ip_time = now - timedelta(days=app_config.ip_max_days)
     UsersIP.objects.filter(updated__lte=delete_ip_time).delete()
 
 
-def process_user(db_user, start_date, end_date):
-    """Get info for each user login and normalization
+def _get_db_user(username):
+    """Get or create the user from db, touching it to update the updated field"""
+    db_user, created = User.objects.get_or_create(username=username)
+    if not created:
+        # Saving user to update updated_at field, without overwriting the alert_count
+        db_user.save(update_fields=["updated"])
+    return db_user
+
+
+def _iter_login_batches(logins, batch_size):
+    """Yield the streamed logins in batches of at most batch_size logins
+
+    :param logins: time-ordered normalized logins
+    :type logins: iterable
+    :param batch_size: maximum number of logins in each batch
+    :type batch_size: int
+
+    :return: generator of lists of normalized logins
+    :rtype: generator
+    """
+    batch = []
+    for login in logins:
+        batch.append(login)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def process_user(db_user, start_date, end_date, source=None, app_config=None, mode=None):
+    """Get info for each user login and normalization.
+    The logins are streamed from the ingestion source and analyzed page by page, so there is no limit to the number of logins per user.
+    In "aggregated" mode only the first and the last login of each distinct (index, ip, agent, country) tuple of the user are fetched
 
     :param db_user: user from db
     :type db_user: object
@@ -39,124 +81,424 @@ def process_user(db_user, start_date, end_date):
     :type start_date: timezone
     :param end_date: finish date of analysis
     :type end_date: timezone
+    :param source: ingestion source, if None the active one in ingestion.json
+    :type source: impossible_travel.ingestion.base_ingestion.BaseIngestion
+    :param app_config: snapshot of the Config shared by the detection run, if None it is read from the db
+    :type app_config: impossible_travel.modules.config_snapshot.ConfigSnapshot
+    :param mode: ingestion mode, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
     """
-    fields = []
-    s = (
-        Search(index=settings.CERTEGO_BUFFALOGS_ELASTIC_INDEX)
-        .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
-        .query("match", **{"user.name": db_user.username})
-        .query("match", **{"event.outcome": "success"})
-        .query("match", **{"event.type": "start"})
-        .query("exists", field="source.ip")
-        .source(
-            includes=[
-                "user.name",
-                "@timestamp",
-                "source.geo.location.lat",
-                "source.geo.location.lon",
-                "source.geo.country_name",
-                "source.as.organization.name",
-                "user_agent.original",
-                "_index",
-                "source.ip",
-                "_id",
-                "source.intelligence_category",
-            ]
-        )
-        .sort("@timestamp")  # from the oldest to the most recent login
-        .extra(size=10000)
-    )
-    response = s.execute()
-    logger.info(f"Got {len(response)} logins for user {db_user.username}")
-    for hit in response:
-        if "source" in hit:
-            tmp = {"timestamp": hit["@timestamp"]}
-            tmp["id"] = hit.meta["id"]
-            if hit.meta["index"].split("-")[0] == "fw":
-                tmp["index"] = "fw-proxy"
-            else:
-                tmp["index"] = hit.meta["index"].split("-")[0]
-            tmp["ip"] = hit["source"]["ip"]
-            if "user_agent" in hit:
-                tmp["agent"] = hit["user_agent"]["original"]
-            else:
-                tmp["agent"] = ""
-            if "as" in hit.source:
-                tmp["organization"] = hit["source"]["as"]["organization"]["name"]
-            if "geo" in hit.source:
-                if "location" in hit.source.geo and "country_name" in hit.source.geo:
-                    tmp["lat"] = hit["source"]["geo"]["location"]["lat"]
-                    tmp["lon"] = hit["source"]["geo"]["location"]["lon"]
-                    tmp["country"] = hit["source"]["geo"]["country_name"]
-                else:
-                    tmp["lat"] = None
-                    tmp["lon"] = None
-                    tmp["country"] = ""
-                fields.append(tmp)  # up to now: no geo info --> login discard
-    detection.check_fields(db_user, fields)
-
-
-@shared_task(name="BuffalogsProcessLogsTask")
-def process_logs():
-    """Find all user logged in between that time range"""
+    source = source or IngestionFactory().get_ingestion_class()
+    app_config = app_config or get_config()
+    if (mode or settings.CERTEGO_BUFFALOGS_INGESTION_MODE) == "aggregated":
+        logins = source.iter_user_aggregated_logins(db_user.username, start_date, end_date)
+    else:
+        logins = source.iter_user_logins(db_user.username, start_date, end_date)
+    logins_count = 0
+    for fields in _iter_login_batches(logins, settings.CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE):
+        logins_count += len(fields)
+        detection.check_fields(db_user, fields, app_config=app_config)
+    logger.info(f"Got {logins_count} logins for user {db_user.username}")
+
+
+def iter_users_pages(start_date, end_date, source=None, shard=None, shards=None):
+    """Get the users logged in between the time range, in pages of CERTEGO_BUFFALOGS_USERS_PAGE_SIZE users
+
+    :param start_date: start date of analysis
+    :type start_date: timezone
+    :param end_date: finish date of analysis
+    :type end_date: timezone
+    :param source: ingestion source, if None the active one in ingestion.json
+    :type source: impossible_travel.ingestion.base_ingestion.BaseIngestion
+    :param shard: if set, get only the users of this shard, filtered by the ingestion source
+    :type shard: int
+    :param shards: number of shards, required with shard
+    :type shards: int
+
+    :return: generator of lists of usernames, yielded as soon as each page is received
+    :rtype: generator
+    """
+    source = source or IngestionFactory().get_ingestion_class()
+    return source.iter_users_pages(start_date, end_date, shard=shard, shards=shards)
+
+
+def process_window(start_date, end_date, source=None, app_config=None):
+    """Single-pass ingestion: read once all the successful logins in the time range, grouped by user and sorted by timestamp,
+    and send them to the detection in batches of at most CERTEGO_BUFFALOGS_INGESTION_MAX_BATCH_SIZE logins
+
+    :param start_date: start date of analysis
+    :type start_date: timezone
+    :param end_date: finish date of analysis
+    :type end_date: timezone
+    :param source: ingestion source, if None the active one in ingestion.json
+    :type source: impossible_travel.ingestion.base_ingestion.BaseIngestion
+    :param app_config: snapshot of the Config shared by the detection run, if None it is read from the db
+    :type app_config: impossible_travel.modules.config_snapshot.ConfigSnapshot
+
+    :return: number of users processed
+    :rtype: int
+    """
+    source = source or IngestionFactory().get_ingestion_class()
+    app_config = app_config or get_config()
+    users_count = 0
+    for username, logins in source.iter_window_logins(start_date, end_date):
+        db_user = _get_db_user(username)
+        users_count += 1
+        # the logins are time-ordered, so a user exceeding the memory bound can be analyzed in consecutive batches
+        for fields in _iter_login_batches(logins, settings.CERTEGO_BUFFALOGS_INGESTION_MAX_BATCH_SIZE):
+            detection.check_fields(db_user, fields, app_config=app_config)
+    logger.info(f"Successfully processed {users_count} users in a single pass")
+    return users_count
+
+
+def process_users_async(start_date, end_date, usernames=None, app_config=None):
+    """Async ingestion: fetch the logins of the users concurrently with the AsyncIngestionEngine
+    and run the detection on each page of logins as soon as it is received
+
+    :param start_date: start date of analysis
+    :type start_date: timezone
+    :param end_date: finish date of analysis
+    :type end_date: timezone
+    :param usernames: usernames to process, if None all the users logged in between the time range
+    :type usernames: list
+    :param app_config: snapshot of the Config shared by the detection run, if None it is read from the db
+    :type app_config: impossible_travel.modules.config_snapshot.ConfigSnapshot
+
+    :return: number of users processed
+    :rtype: int
+    """
+    source = IngestionFactory().get_ingestion_class()
+    if not isinstance(source, ElasticsearchIngestion):
+        raise ValueError("The async ingestion mode requires the elasticsearch ingestion source")
+    app_config = app_config or get_config()
+    db_users = {}
+    engine = AsyncIngestionEngine(index=source.indexes)
+    for username, hits in engine.iter_logins(
+        lambda username: source.user_logins_search(username, start_date, end_date).to_dict(),
+        users_query=lambda after_key: source.users_page_search(start_date, end_date, after_key).to_dict(),
+        usernames=usernames,
+    ):
+        if username not in db_users:
+            db_users[username] = _get_db_user(username)
+        fields = [login for login in (LoginRecord.from_source(hit["_source"], hit["_index"], hit["_id"]) for hit in hits) if login]
+        if fields:
+            detection.check_fields(db_users[username], fields, app_config=app_config)
+    logger.info(f"Successfully processed {len(db_users)} users asynchronously")
+    return len(db_users)
+
+
+@shared_task(name="BuffalogsProcessLogsTask", ignore_result=True)
+def process_logs(mode=None):
+    """Find all user logged in between that time range.
+    The time range is split in the catch-up windows, processed by the detection shards if CERTEGO_BUFFALOGS_DETECTION_SHARDS > 1,
+    otherwise serially by this task, completing each window before the next one
+
+    :param mode: ingestion mode, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+    """
+    mode = mode or settings.CERTEGO_BUFFALOGS_INGESTION_MODE
     now = timezone.now()
     process_task, _ = TaskSettings.objects.get_or_create(
         task_name=process_logs.__name__, defaults={"end_date": timezone.now() - timedelta(minutes=1), "start_date": timezone.now() - timedelta(minutes=30)}
     )
-    if (now - process_task.end_date).days < 1:
-        # Recovering old data avoiding task time limit
-        for _ in range(6):
-            start_date = process_task.end_date
-            end_date = start_date + timedelta(minutes=30)
-            if end_date < now:
-                process_task.start_date = start_date
-                process_task.end_date = end_date
-                process_task.save()
-                exec_process_logs(start_date, end_date)
+    sharded = settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS > 1 and mode != "single_pass"
+    if (
+        sharded
+        and process_task.dispatched_end_date
+        and process_task.dispatched_end_date > process_task.end_date
+        and now - process_task.updated < timedelta(minutes=settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS_TIMEOUT_MINUTES)
+    ):
+        logger.info(f"Detection shards still running up to {process_task.dispatched_end_date}")
+        return
+
+    start_date = process_task.end_date
+    max_backlog = timedelta(hours=settings.CERTEGO_BUFFALOGS_MAX_BACKLOG_HOURS)
+    if now - start_date > max_backlog:
+        logger.info(f"Data lost from {start_date} to {now - max_backlog}")
+        start_date = now - max_backlog
+    time_windows = catch_up.plan_time_windows(start_date, now, get_events_histogram(start_date, now), process_task.events_per_second)
+    if not time_windows:
+        return
+    logger.info(f"Planned {len(time_windows)} time windows from {time_windows[0][0]} to {time_windows[-1][1]}")
 
+    if sharded:
+        shards_chord = build_windows_shards_chord(time_windows, task_name=process_logs.__name__, mode=mode)
+        TaskSettings.objects.filter(id=process_task.id).update(dispatched_end_date=time_windows[-1][1], updated=timezone.now())
+        shards_chord.apply_async()
     else:
-        logger.info(f"Data lost from {process_task.end_date} to now")
-        end_date = timezone.now() - timedelta(minutes=1)
-        start_date = end_date - timedelta(minutes=30)
-        process_task.start_date = start_date
-        process_task.end_date = end_date
-        process_task.save()
-        exec_process_logs(start_date, end_date)
+        # without shards the windows are processed in this task, in chronological order: a user can log in in many windows,
+        # and running them as a celery group would analyze the logins of the same user concurrently and out of order.
+        # The windows are parallelized by the shards, where each user is always in the same chain of windows
+        for start_date, end_date, events in time_windows:
+            started = timezone.now()
+            exec_process_logs(start_date, end_date, mode=mode)
+            _complete_task_time_range(process_logs.__name__, start_date, end_date, events=events, seconds=(timezone.now() - started).total_seconds())
 
 
-@shared_task(name="NotifyAlertsTask")
+@shared_task(name="NotifyAlertsTask", ignore_result=True)
 def notify_alerts():
     alert = AlertFactory().get_alert_class()
     alert.notify_alerts()
 
 
-def exec_process_logs(start_date, end_date):
-    """Starting the execution for the given time range
+@shared_task(name="BuffalogsProcessUsersShardTask", ignore_result=False)
+def process_users_shard(usernames, start_date, end_date, mode=None):
+    """Run the detection for a shard of the users logged in between the time range
+
+    :param usernames: usernames of the shard
+    :type usernames: list
+    :param start_date: start date of analysis, in isoformat
+    :type start_date: str
+    :param end_date: finish date of analysis, in isoformat
+    :type end_date: str
+    :param mode: ingestion mode, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+
+    :return: number of users processed
+    :rtype: int
+    """
+    start_date, end_date = datetime.fromisoformat(start_date), datetime.fromisoformat(end_date)
+    app_config = get_config()
+    if (mode or settings.CERTEGO_BUFFALOGS_INGESTION_MODE) == "async":
+        process_users_async(start_date, end_date, usernames=usernames, app_config=app_config)
+        return len(usernames)
+    source = IngestionFactory().get_ingestion_class()
+    for username in usernames:
+        db_user = _get_db_user(username)
+        process_user(db_user, start_date, end_date, source=source, app_config=app_config, mode=mode)
+    logger.info(f"Distance cache stats: {get_distance_cache().stats()}")
+    return len(usernames)
+
+
+@shared_task(name="BuffalogsCompleteShardsTask", ignore_result=True)
+def complete_shards(users_counts, start_date, end_date, task_name=None, events=0, dispatched=None):
+    """Chord callback, executed only after all the detection shards of the time windows have succeeded
+
+    :param users_counts: number of users processed by each shard
+    :type users_counts: list
+    :param start_date: start date of analysis, in isoformat
+    :type start_date: str
+    :param end_date: finish date of analysis, in isoformat
+    :type end_date: str
+    :param task_name: name of the TaskSettings to advance, if any
+    :type task_name: str
+    :param events: number of events in the time windows
+    :type events: int
+    :param dispatched: dispatch datetime of the shards, in isoformat
+    :type dispatched: str
+    """
+    logger.info(f"Successfully processed {len(users_counts)} shards up to {end_date}")
+    if task_name:
+        seconds = (timezone.now() - datetime.fromisoformat(dispatched)).total_seconds() if dispatched else 0
+        _complete_task_time_range(task_name, datetime.fromisoformat(start_date), datetime.fromisoformat(end_date), events=events, seconds=seconds)
+
+
+@shared_task(name="BuffalogsBackfillShardTask", ignore_result=True)
+def backfill_shard(name, shard, mode=None):
+    """Run the backfill for a shard of the users, in time windows of CERTEGO_BUFFALOGS_BACKFILL_WINDOW_MINUTES minutes.
+    The windows are processed in chronological order starting from the checkpoint of the shard, which is advanced after each window,
+    so an interrupted backfill resumes from the last completed window
+
+    :param name: identifier of the backfill
+    :type name: str
+    :param shard: index of the shard
+    :type shard: int
+    :param mode: ingestion mode, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+
+    :return: index of the shard
+    :rtype: int
+    """
+    checkpoint = BackfillCheckpoint.objects.get(name=name, shard=shard)
+    window = timedelta(minutes=settings.CERTEGO_BUFFALOGS_BACKFILL_WINDOW_MINUTES)
+    while checkpoint.processed_until < checkpoint.end_date:
+        start_date = checkpoint.processed_until
+        end_date = min(start_date + window, checkpoint.end_date)
+        # the users of the other shards are excluded by the ingestion query, so each window is aggregated only for the users of the shard
+        usernames = [username for page in iter_users_pages(start_date, end_date, shard=shard, shards=checkpoint.shards) for username in page]
+        if usernames:
+            process_users_shard(usernames, start_date.isoformat(), end_date.isoformat(), mode=mode)
+        checkpoint.processed_until = end_date
+        checkpoint.save(update_fields=["processed_until", "updated"])
+        logger.info(f"Backfill {name} shard {shard}: processed {len(usernames)} users up to {end_date}")
+    return shard
+
+
+def build_shards_chord(start_date, end_date, task_name=None, mode=None):
+    """Split the users logged in between the time range in CERTEGO_BUFFALOGS_DETECTION_SHARDS shards, hashing their usernames.
+    The shards are processed in parallel by a celery group and the callback completes the time range after all of them have succeeded
 
     :param start_date: Start datetime
     :type start_date: datetime
     :param end_date: End datetime
     :type end_date: datetime
+    :param task_name: name of the TaskSettings to advance at the end, if any
+    :type task_name: str
+    :param mode: ingestion mode of the shards, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+
+    :return: chord of the shards
+    :rtype: celery.chord
     """
-    logger.info(f"Starting at: {start_date} Finishing at: {end_date}")
-    connections.create_connection(hosts=settings.CERTEGO_ELASTICSEARCH, timeout=90, verify_certs=False)
-    s = (
-        Search(index=settings.CERTEGO_BUFFALOGS_ELASTIC_INDEX)
-        .filter("range", **{"@timestamp": {"gte": start_date, "lt": end_date}})
-        .query("match", **{"event.category": "authentication"})
-        .query("match", **{"event.outcome": "success"})
-        .query("match", **{"event.type": "start"})
-        .query("exists", field="user.name")
+    return build_windows_shards_chord([(start_date, end_date, 0)], task_name=task_name, mode=mode)
+
+
+def build_windows_shards_chord(time_windows, task_name=None, mode=None):
+    """Split the users logged in between each time window in CERTEGO_BUFFALOGS_DETECTION_SHARDS shards, hashing their usernames.
+    Each user is always in the same shard, so the windows of a shard are chained to analyze its users in chronological order,
+    while the shards run in parallel: a shard can process its next windows without waiting for the others.
+    The callback completes the time windows after all the shards have succeeded
+
+    :param time_windows: chronological time windows, as (start date, end date, events count) tuples
+    :type time_windows: list
+    :param task_name: name of the TaskSettings to advance at the end, if any
+    :type task_name: str
+    :param mode: ingestion mode of the shards, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+
+    :return: chord of the shards
+    :rtype: celery.chord
+    """
+    shards = [[] for _ in range(settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS)]
+    for start_date, end_date, _ in time_windows:
+        window_shards = [[] for _ in shards]
+        for usernames in iter_users_pages(start_date, end_date):
+            for username in usernames:
+                window_shards[get_user_shard(username, len(shards))].append(username)
+        for shard, usernames in zip(shards, window_shards):
+            if usernames:
+                shard.append(process_users_shard.si(usernames, start_date.isoformat(), end_date.isoformat(), mode=mode))
+        logger.info(f"Split {sum(len(usernames) for usernames in window_shards)} users in {len(shards)} shards from {start_date} to {end_date}")
+    header = [chain(*shard) for shard in shards if shard]
+    last_start_date, last_end_date, _ = time_windows[-1]
+    return chord(
+        header,
+        complete_shards.s(
+            last_start_date.isoformat(),
+            last_end_date.isoformat(),
+            task_name=task_name,
+            events=sum(events for _, _, events in time_windows),
+            dispatched=timezone.now().isoformat(),
+        ),
     )
-    s.aggs.bucket("login_user", "terms", field="user.name", size=10000)
-    response = s.execute()
-    try:
-        logger.info(f"Successfully got {len(response.aggregations.login_user.buckets)} users")
-        for user in response.aggregations.login_user.buckets:
-            db_user, created = User.objects.get_or_create(username=user.key)
-            if not created:
-                # Saving user to update updated_at field
-                db_user.save()
-            process_user(db_user, start_date, end_date)
-    except AttributeError:
-        logger.info("No users login aggregation found")
+
+
+def create_backfill(start_date, end_date, shards):
+    """Create the checkpoints of the backfill, one for each shard. If they already exist, the backfill is resumed from them
+
+    :param start_date: Start datetime
+    :type start_date: datetime
+    :param end_date: End datetime
+    :type end_date: datetime
+    :param shards: number of shards
+    :type shards: int
+
+    :return: identifier of the backfill
+    :rtype: str
+    """
+    name = f"{start_date.isoformat()}_{end_date.isoformat()}"
+    previous_shards = BackfillCheckpoint.objects.filter(name=name).values_list("shards", flat=True).first()
+    if previous_shards and previous_shards != shards:
+        raise ValueError(f"Backfill {name} already started with {previous_shards} shards, it must be resumed with the same number of shards")
+    for shard in range(shards):
+        BackfillCheckpoint.objects.get_or_create(
+            name=name, shard=shard, defaults={"shards": shards, "start_date": start_date, "end_date": end_date, "processed_until": start_date}
+        )
+    return name
+
+
+def exec_backfill(start_date, end_date, workers=None, use_celery=False, mode=None):
+    """Re-run the detection over a long time range, splitting the users in shards processed in parallel
+    by a pool of processes or, if use_celery, by the celery workers.
+    Each user always belongs to the same shard, so its logins are still analyzed in chronological order
+
+    :param start_date: Start datetime
+    :type start_date: datetime
+    :param end_date: End datetime
+    :type end_date: datetime
+    :param workers: number of shards processed in parallel, if None CERTEGO_BUFFALOGS_BACKFILL_WORKERS
+    :type workers: int
+    :param use_celery: dispatch the shards to the celery workers instead of a local pool of processes
+    :type use_celery: bool
+    :param mode: ingestion mode, if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+
+    :return: identifier of the backfill
+    :rtype: str
+    """
+    workers = workers or settings.CERTEGO_BUFFALOGS_BACKFILL_WORKERS
+    if timezone.is_naive(start_date):
+        start_date = timezone.make_aware(start_date)
+    if timezone.is_naive(end_date):
+        end_date = timezone.make_aware(end_date)
+    name = create_backfill(start_date, end_date, workers)
+    logger.info(f"Starting backfill {name} with {workers} shards")
+    if use_celery:
+        group(backfill_shard.si(name, shard, mode=mode) for shard in range(workers)).apply_async()
+        return name
+    # the forked processes must not share the db connections of the parent
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        for shard in executor.map(backfill_shard, [name] * workers, range(workers), [mode] * workers):
+            logger.info(f"Backfill {name} shard {shard} completed")
+    return name
+
+
+def get_events_histogram(start_date, end_date):
+    """Count the successful logins of the time range in buckets of CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES minutes
+
+    :param start_date: start date of the histogram
+    :type start_date: datetime
+    :param end_date: end date of the histogram, the bucket containing it is excluded because still incomplete
+    :type end_date: datetime
+
+    :return: chronological buckets, as (bucket start, bucket end, events count) tuples, empty if the ingestion source doesn't support it
+    :rtype: list
+    """
+    return IngestionFactory().get_ingestion_class().get_events_histogram(start_date, end_date)
+
+
+def _complete_task_time_range(task_name, start_date, end_date, events=0, seconds=0):
+    """Advance the TaskSettings of the task to the time range just completed, updating the measured throughput with the events processed in seconds"""
+    process_task = TaskSettings.objects.filter(task_name=task_name).first()
+    if not process_task:
+        return
+    process_task.start_date = start_date
+    process_task.end_date = end_date
+    process_task.events_per_second = catch_up.update_events_per_second(process_task.events_per_second, events, seconds)
+    process_task.save(update_fields=["start_date", "end_date", "events_per_second", "updated"])
+
+
+def exec_process_logs(start_date, end_date, mode=None):
+    """Starting the execution for the given time range.
+    If CERTEGO_BUFFALOGS_DETECTION_SHARDS > 1, the users are split in shards processed in parallel by the celery workers
+
+    :param start_date: Start datetime
+    :type start_date: datetime
+    :param end_date: End datetime
+    :type end_date: datetime
+    :param mode: ingestion mode ("per_user", "single_pass", "async" or "aggregated"), if None CERTEGO_BUFFALOGS_INGESTION_MODE
+    :type mode: str
+    """
+    mode = mode or settings.CERTEGO_BUFFALOGS_INGESTION_MODE
+    logger.info(f"Starting at: {start_date} Finishing at: {end_date}")
+    source = IngestionFactory().get_ingestion_class()
+    # the Config is read once for the whole run
+    app_config = get_config()
+    if mode == "single_pass":
+        process_window(start_date, end_date, source=source, app_config=app_config)
+        return
+    if settings.CERTEGO_BUFFALOGS_DETECTION_SHARDS > 1:
+        build_shards_chord(start_date, end_date, mode=mode).apply_async()
+        return
+    if mode == "async":
+        process_users_async(start_date, end_date, app_config=app_config)
+        return
+    users_count = 0
+    for usernames in iter_users_pages(start_date, end_date, source=source):
+        for username in usernames:
+            db_user = _get_db_user(username)
+            process_user(db_user, start_date, end_date, source=source, app_config=app_config, mode=mode)
+        users_count += len(usernames)
+    logger.info(f"Successfully processed {users_count} users")
+    logger.info(f"Distance cache stats: {get_distance_cache().stats()}")
@@ -1,8 +1,9 @@
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from impossible_travel.constants import AlertDetectionType, AlertFilterType, UserRiskScoreType
 from impossible_travel.models import Alert, Config, User
 from impossible_travel.modules import alert_filter
+from impossible_travel.modules.config_snapshot import ConfigSnapshot, compile_username_patterns
 
 
 class TestAlertFilter(TestCase):
@@ -256,6 +257,18 @@ class TestAlertFilter(TestCase):
         self.assertFalse(db_alert.is_filtered)
         self.assertListEqual([], db_alert.filter_type)
 
+    def test_match_filters_location_ignored_networks(self):
+        # test filter with: ignored_ips = ["1.2.3.0/24", "2001:db8::/32"]
+        db_config = Config.objects.create(id=1, ignored_ips=["1.2.3.0/24", "2001:db8::/32"])
+        # alert filtered because IP in an ignored network
+        db_alert = Alert.objects.get(user__username="Lorena Goldoni")
+        alert_filter.match_filters(alert=db_alert, app_config=db_config)
+        self.assertListEqual(["ignored_ips filter"], db_alert.filter_type)
+        db_alert = Alert.objects.get(user__username="Lorygold")
+        db_alert.login_raw_data["ip"] = "2001:db8::5"
+        alert_filter.match_filters(alert=db_alert, app_config=db_config)
+        self.assertListEqual(["ignored_ips filter"], db_alert.filter_type)
+
     def test_match_filters_location_allowed_countries(self):
         # test filter with: allowed_countries = ["Italy"]
         db_config = Config.objects.create(id=1, allowed_countries=["Italy"])
@@ -361,3 +374,60 @@ class TestAlertFilter(TestCase):
             ],
             db_alert.filter_type,
         )
+
+
+class TestFilterEngine(SimpleTestCase):
+    def build_alert(self, username, name=AlertDetectionType.NEW_DEVICE, **login):
+        return Alert(user=User(username=username, risk_score=UserRiskScoreType.HIGH), name=name, login_raw_data={"agent": "", **login})
+
+    def test_username_matcher(self):
+        """Testing the username patterns are combined in a single regex, except the ones that can't be combined"""
+        matcher = alert_filter.UsernameMatcher(compile_username_patterns(["Lorena Goldoni", r"^sys-.*", r".*@stores\.company\.com$", r"^(\w)\1$", "[invalid"]))
+        self.assertEqual(2, len(matcher.regexes))
+        for username in ["Lorena Goldoni", "sys-backup", "h.hesse@stores.company.com", "aa", "[invalid"]:
+            self.assertTrue(matcher.match(username), username)
+        for username in ["Lorygold", "ab", "hermann@company.com"]:
+            self.assertFalse(matcher.match(username), username)
+        matcher = alert_filter.UsernameMatcher(compile_username_patterns([r"^sys-.*", r"(?i)^admin$"]))
+        self.assertTrue(matcher.match("ADMIN"))
+        self.assertTrue(matcher.match("sys-backup"))
+        self.assertFalse(matcher.match("SYS-backup"))
+
+    def test_engine_compiled_once(self):
+        """Testing the engine is compiled once for each ConfigSnapshot"""
+        snapshot = ConfigSnapshot(Config(ignored_users=[r"^sys-.*"]))
+        engine = alert_filter.get_filter_engine(snapshot)
+        self.assertIs(engine, alert_filter.get_filter_engine(snapshot))
+        self.assertIsNot(engine, alert_filter.get_filter_engine(ConfigSnapshot(Config(ignored_users=[r"^sys-.*"]))))
+
+    def test_batch_filter_types(self):
+        """Testing a batch of alerts is filtered in a single call, with the same filters of match_filters"""
+        snapshot = ConfigSnapshot(
+            Config(ignored_users=[r"^sys-.*"], ignored_ips=["1.2.3.4"], allowed_countries=["Italy"], filtered_alerts_types=[AlertDetectionType.NEW_COUNTRY])
+        )
+        alerts = [
+            self.build_alert("sys-backup", ip="5.6.7.8", country="Japan"),
+            self.build_alert("Lorena Goldoni", ip="1.2.3.4", country="Italy"),
+            self.build_alert("Lorena Goldoni", name=AlertDetectionType.NEW_COUNTRY, ip="5.6.7.8", country="Japan"),
+            self.build_alert("Lorygold", ip="5.6.7.8", country="Japan"),
+        ]
+        expected = [
+            [AlertFilterType.IGNORED_USER_FILTER],
+            [AlertFilterType.IGNORED_IP_FILTER, AlertFilterType.ALLOWED_COUNTRY_FILTER],
+            [AlertFilterType.FILTERED_ALERTS],
+            [],
+        ]
+        self.assertEqual(expected, alert_filter.get_filter_engine(snapshot).get_batch_filter_types(alerts))
+        for alert, filter_types in zip(alerts, expected):
+            alert_filter.match_filters(alert, snapshot)
+            self.assertEqual(filter_types, alert.filter_type)
+
+    def test_filters_logged(self):
+        """Testing the rule matched by each filter of a filtered alert is logged"""
+        snapshot = ConfigSnapshot(Config(ignored_users=["admin", r"^sys-.*"], ignored_ips=["10.0.0.0/8"], allowed_countries=["Italy"]))
+        with self.assertLogs("impossible_travel.modules.alert_filter", level="DEBUG") as logs:
+            alert_filter.match_filters(self.build_alert("sys-backup", ip="10.1.2.3", country="Italy"), snapshot)
+        self.assertEqual(3, len(logs.output))
+        self.assertIn("user: sys-backup is in the ignored_users Config list (matched by: ^sys-.*)", logs.output[0])
+        self.assertIn("login IP: 10.1.2.3 is in the ignored_ips Config list (matched by: 10.0.0.0/8)", logs.output[1])
+        self.assertIn("login country: Italy is in the allowed_countries Config list", logs.output[2])
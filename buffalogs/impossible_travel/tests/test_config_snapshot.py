@@ -0,0 +1,77 @@
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from impossible_travel.constants import AlertFilterType
+from impossible_travel.models import Alert, Config, User
+from impossible_travel.modules import alert_filter
+from impossible_travel.modules.config_snapshot import ConfigSnapshot, as_config_snapshot, get_config
+
+
+class TestConfigSnapshot(TestCase):
+    def setUp(self):
+        Config.objects.all().delete()
+        self.config = Config.objects.create(ignored_users=["Not Available", "^sys-.*"], ignored_ips=["127.0.0.1"], distance_accepted=200)
+
+    def test_get_config(self):
+        """Testing the snapshot is reused without queries until the Config changes"""
+        snapshot = get_config()
+        self.assertEqual(200, snapshot.distance_accepted)
+        self.assertEqual(frozenset(["127.0.0.1"]), snapshot.ignored_ips)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIs(snapshot, get_config())
+        self.assertEqual(0, len(ctx.captured_queries))
+        self.config.distance_accepted = 300
+        self.config.save()
+        new_snapshot = get_config()
+        self.assertIsNot(snapshot, new_snapshot)
+        self.assertEqual(300, new_snapshot.distance_accepted)
+        self.assertEqual(snapshot.version + 1, new_snapshot.version)
+
+    def test_get_config_update(self):
+        """Testing the queryset update() increments the version of the Config and refreshes the snapshot"""
+        snapshot = get_config()
+        Config.objects.filter(id=1).update(distance_accepted=300)
+        new_snapshot = get_config()
+        self.assertEqual(300, new_snapshot.distance_accepted)
+        self.assertEqual(snapshot.version + 1, new_snapshot.version)
+        self.assertEqual(new_snapshot.version, Config.objects.get(id=1).version)
+
+    def test_get_config_other_process(self):
+        """Testing the changes made by another process (without signals) are seen after CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS, reading only the version"""
+        snapshot = get_config()
+        QuerySet.update(Config.objects.filter(id=1), distance_accepted=300, version=F("version") + 1)
+        self.assertIs(snapshot, get_config())
+        with self.settings(CERTEGO_BUFFALOGS_CONFIG_CACHE_SECONDS=0):
+            new_snapshot = get_config()
+            self.assertEqual(300, new_snapshot.distance_accepted)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertIs(new_snapshot, get_config())
+        self.assertEqual(1, len(ctx.captured_queries))
+
+    def test_filter_engine_cached_by_version(self):
+        """Testing the Config instances of the same version share the snapshot of get_config() and the FilterEngine"""
+        snapshot = get_config()
+        config = Config.objects.get(id=1)
+        self.assertIs(snapshot, as_config_snapshot(config))
+        engine = alert_filter.get_filter_engine(config)
+        self.assertIs(engine, alert_filter.get_filter_engine(Config.objects.get(id=1)))
+        config.save()
+        self.assertIsNot(engine, alert_filter.get_filter_engine(config))
+
+    def test_read_only(self):
+        snapshot = get_config()
+        with self.assertRaises(AttributeError):
+            snapshot.distance_accepted = 1
+
+    def test_username_patterns(self):
+        """Testing the filters use the precompiled username patterns"""
+        snapshot = ConfigSnapshot(self.config)
+        self.assertEqual("^sys-.*", snapshot.ignored_users_patterns[1][0])
+        db_user = User.objects.create(username="sys-backup")
+        alert = Alert(user=db_user, name="Imp Travel", login_raw_data={"ip": "1.2.3.4", "country": "Italy", "agent": ""}, description="")
+        alert_filter.match_filters(alert, snapshot)
+        self.assertIn(AlertFilterType.IGNORED_USER_FILTER, alert.filter_type)
+        other_alert = Alert(user=User.objects.create(username="Lorena"), name="Imp Travel", login_raw_data={"ip": "1.2.3.4", "agent": ""}, description="")
+        alert_filter.match_filters(other_alert, snapshot)
+        self.assertNotIn(AlertFilterType.IGNORED_USER_FILTER, other_alert.filter_type)
@@ -2,12 +2,15 @@ import datetime
 import json
 import os
 
+from django.db import connection
 from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from impossible_travel.constants import AlertDetectionType, AlertFilterType
+from impossible_travel.constants import AlertDetectionType, AlertFilterType, UserRiskScoreType
 from impossible_travel.models import Alert, Config, Login, User, UsersIP
 from impossible_travel.modules import detection
+from impossible_travel.modules.write_buffer import WriteBuffer
 
 
 def load_test_data(name):
@@ -346,6 +349,19 @@ class DetectionTestCase(TestCase):
         self.assertEqual(10, db_user.alert_set.count())
         self.assertEqual(AlertDetectionType.IMP_TRAVEL, alerts_user[9].name)
 
+    def test_update_risk_level_unchanged(self):
+        """Testing the risk level of the buffered alerts is computed from the User.alert_count and the user is saved only if it changes"""
+        db_config = Config.objects.get(id=1)
+        db_user = User.objects.get(username="Lorena Goldoni")
+        db_user.risk_score = UserRiskScoreType.LOW
+        db_user.alert_count = 2
+        db_user.save()
+        alert = Alert(user=db_user, name=AlertDetectionType.IMP_TRAVEL, login_raw_data=self.raw_data_IMP_TRAVEL, description="Test_Description")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(detection.update_risk_level(db_user, triggered_alert=alert, app_config=db_config, write_buffer=WriteBuffer(db_user)))
+        self.assertEqual([], [query["sql"] for query in ctx.captured_queries if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))])
+        self.assertEqual("Low", User.objects.get(username="Lorena Goldoni").risk_score)
+
     def test_set_alert(self):
         db_config = Config.objects.get(id=1)
         # Add an alert and check if it is correctly inserted in the Alert Model
@@ -367,6 +383,24 @@ class DetectionTestCase(TestCase):
         self.assertTrue(db_alert.is_filtered)
         self.assertListEqual([AlertFilterType.ALLOWED_COUNTRY_FILTER], db_alert.filter_type)
 
+    def test_set_alert_single_insert(self):
+        """Testing the alert and its USER_RISK_THRESHOLD follow-up alert are built in memory and inserted together, without updates"""
+        db_config = Config.objects.get(id=1)
+        db_config.vip_users = ["Lorena Goldoni"]
+        db_config.save()
+        db_user = User.objects.get(username="Lorena Goldoni")
+        alert_info = {"alert_name": AlertDetectionType.IMP_TRAVEL, "alert_desc": "Test_Description"}
+        with CaptureQueriesContext(connection) as ctx:
+            alert = detection.set_alert(db_user, self.raw_data_IMP_TRAVEL, alert_info, db_config, buffalogs_info={"start_country": "Italy"})
+        alert_queries = [query["sql"] for query in ctx.captured_queries if '"impossible_travel_alert"' in query["sql"]]
+        self.assertEqual(1, len(alert_queries))
+        self.assertTrue(alert_queries[0].startswith('INSERT INTO "impossible_travel_alert"'))
+        db_alert = Alert.objects.get(id=alert.id)
+        self.assertTrue(db_alert.is_vip)
+        self.assertEqual({"start_country": "Italy"}, db_alert.login_raw_data["buffalogs"])
+        self.assertEqual(1, Alert.objects.filter(user=db_user, name=AlertDetectionType.USER_RISK_THRESHOLD).count())
+        self.assertEqual(2, User.objects.get(id=db_user.id).alert_count)
+
     def test_set_alert_vip_user(self):
         db_config = Config.objects.get(id=1)
         db_config.alert_is_vip_only = True
@@ -622,3 +656,31 @@ class DetectionTestCase(TestCase):
         # Third part: no new alerts because all the ips have already been used
         detection.check_fields(db_user, fields3)
         self.assertEqual(0, Alert.objects.filter(user=db_user, login_raw_data__timestamp__gt=datetime.datetime(2023, 5, 4, 0, 0, 0).isoformat()).count())
+
+    def test_check_fields_user_profile_queries(self):
+        """Testing the detection state of the user is read with a single lookup per batch of logins, without reading its Login and UsersIP"""
+        db_user = User.objects.get(username="Aisha Delgado")
+        detection.check_fields(db_user, load_test_data("test_check_fields_part1"))
+        fields2 = load_test_data("test_check_fields_part2")
+        with CaptureQueriesContext(connection) as ctx:
+            detection.check_fields(db_user, fields2)
+        selects = [query["sql"] for query in ctx.captured_queries if query["sql"].startswith("SELECT")]
+        state_selects = [sql for sql in selects if 'FROM "impossible_travel_userdetectionstate"' in sql]
+        self.assertEqual(1, len(state_selects))
+        # the Login and UsersIP rows are only counted in the lookup of the state, to check it
+        self.assertEqual(0, len([sql for sql in selects if 'FROM "impossible_travel_login"' in sql and sql not in state_selects]))
+        self.assertEqual(0, len([sql for sql in selects if 'FROM "impossible_travel_usersip"' in sql and sql not in state_selects]))
+        self.assertEqual(6, Login.objects.filter(user=db_user, index="cloud-test_data-2023-5-3").count())
+        self.assertEqual(7, UsersIP.objects.filter(user=db_user).count())
+
+    def test_check_fields_bulk_writes(self):
+        """Testing the rows of a batch of logins are saved together at the end of the batch"""
+        db_user = User.objects.get(username="Aisha Delgado")
+        with CaptureQueriesContext(connection) as ctx:
+            detection.check_fields(db_user, load_test_data("test_check_fields_part1"))
+        inserts = [query["sql"] for query in ctx.captured_queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(1, len([sql for sql in inserts if 'INTO "impossible_travel_login"' in sql]))
+        self.assertEqual(1, len([sql for sql in inserts if 'INTO "impossible_travel_usersip"' in sql]))
+        self.assertLessEqual(len([sql for sql in inserts if 'INTO "impossible_travel_alert"' in sql]), 1)
+        self.assertEqual(3, Login.objects.filter(user=db_user, index="cloud-test_data-2023-5-3").count())
+        self.assertEqual(4, UsersIP.objects.filter(user=db_user).count())
@@ -0,0 +1,69 @@
+from django.test import TestCase, override_settings
+from impossible_travel.constants import AlertDetectionType
+from impossible_travel.models import Alert, Config, Login, User
+from impossible_travel.modules import detection
+from impossible_travel.modules.config_snapshot import get_config
+from impossible_travel.modules.detectors import DetectionPlan, get_detectors
+from impossible_travel.modules.travel_evaluator import TravelEvaluator
+from impossible_travel.modules.user_profile import UserProfile
+
+
+class TestDetectionPlan(TestCase):
+    def setUp(self):
+        Config.objects.all().delete()
+        self.config = Config.objects.create(id=1, filtered_alerts_types=[AlertDetectionType.NEW_DEVICE], ignored_ips=["9.9.9.0/24"], ignored_users=["^sys-.*"])
+        self.db_user = User.objects.create(username="Lorena")
+        base_login = {"index": "cloud", "agent": "agent", "organization": "ISP", "country": "Italy", "lat": 45.4642, "lon": 9.19}
+        self.fields = [
+            {**base_login, "id": "event_1", "ip": "1.1.1.1", "timestamp": "2023-05-03T06:00:00.000Z"},
+            {**base_login, "id": "event_2", "ip": "2.2.2.2", "agent": "new agent", "timestamp": "2023-05-03T07:00:00.000Z"},
+            {**base_login, "id": "event_3", "ip": "9.9.9.9", "agent": "other agent", "timestamp": "2023-05-03T08:00:00.000Z"},
+        ]
+
+    def test_detectors_order(self):
+        """Testing the detectors are ordered by cost"""
+        costs = [detector.cost for detector in get_detectors()]
+        self.assertEqual(sorted(costs), costs)
+        self.assertEqual(["anonymous_ip", "new_device", "country", "impossible_travel"], [detector.name for detector in get_detectors()])
+
+    def test_plan_skip_filtered(self):
+        """Testing the plan skips the detectors of the filtered alerts types, the ignored users and the ignored ips"""
+        plan = DetectionPlan(self.db_user, get_config(), skip_filtered=True)
+        self.assertNotIn("new_device", [detector.name for detector in plan.detectors])
+        self.assertEqual(["country", "impossible_travel"], [detector.name for detector in plan.get_detectors(self.fields[0])])
+        self.assertEqual([], plan.get_detectors(self.fields[2]))
+        ignored_plan = DetectionPlan(User.objects.create(username="sys-backup"), get_config(), skip_filtered=True)
+        self.assertEqual([], ignored_plan.detectors)
+        # without skip_filtered, all the detectors applicable to the login are run
+        plan = DetectionPlan(self.db_user, get_config(), skip_filtered=False)
+        self.assertEqual(["new_device", "country", "impossible_travel"], [detector.name for detector in plan.get_detectors(self.fields[2])])
+
+    @override_settings(CERTEGO_BUFFALOGS_SKIP_FILTERED_DETECTORS=True)
+    def test_check_fields_skip_filtered(self):
+        """Testing the filtered detectors don't trigger alerts, while the logins are still saved"""
+        detection.check_fields(self.db_user, self.fields)
+        self.assertEqual(0, Alert.objects.filter(user=self.db_user, name=AlertDetectionType.NEW_DEVICE).count())
+        self.assertEqual(3, Login.objects.filter(user=self.db_user).count())
+
+    def test_plan_stats(self):
+        """Testing the stats of the detectors are counted by the plan only if collect_stats is True"""
+        profile = UserProfile.load(self.db_user)
+        plans = [DetectionPlan(self.db_user, get_config(), skip_filtered=True, collect_stats=collect_stats) for collect_stats in [False, True]]
+        for plan in plans:
+            travels = TravelEvaluator(last_location=profile.last_location)
+            for login in self.fields:
+                for detector in plan.get_detectors(login):
+                    plan.run(detector, self.db_user, login, profile, travels)
+        self.assertEqual({}, plans[0].stats)
+        plan = plans[1]
+        self.assertEqual(0, plan.stats["new_device"]["calls"])
+        self.assertEqual(3, plan.stats["new_device"]["skipped"])
+        self.assertEqual(2, plan.stats["country"]["calls"])
+        self.assertEqual(0, plan.stats["country"]["queries"])
+
+    def test_check_fields_filtered_alerts_saved(self):
+        """Testing by default the filtered alerts are still saved, with their filter_type"""
+        detection.check_fields(self.db_user, self.fields)
+        new_device_alerts = Alert.objects.filter(user=self.db_user, name=AlertDetectionType.NEW_DEVICE)
+        self.assertEqual(2, new_device_alerts.count())
+        self.assertTrue(all(alert.is_filtered for alert in new_device_alerts))
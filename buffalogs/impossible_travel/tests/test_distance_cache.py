@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase, override_settings
+from geopy.distance import geodesic
+from impossible_travel.modules import distance_cache
+from impossible_travel.modules.distance_cache import DistanceCache
+
+
+class TestDistanceCache(SimpleTestCase):
+    def test_get_distance(self):
+        """Testing the distance is computed once for the same pair of locations, in both directions"""
+        cache = DistanceCache(maxsize=10, precision=4)
+        distance = cache.get_distance((45.4642, 9.19), (41.9028, 12.4964))
+        self.assertEqual(geodesic((45.4642, 9.19), (41.9028, 12.4964)).km, distance)
+        self.assertEqual(distance, cache.get_distance((45.46421, 9.19002), (41.9028, 12.4964)))
+        self.assertEqual(distance, cache.get_distance(("41.9028", "12.4964"), (45.4642, 9.19)))
+        self.assertDictEqual({"hits": 2, "shared_hits": 0, "misses": 1, "evictions": 0, "size": 1, "maxsize": 10}, cache.stats())
+
+    def test_eviction(self):
+        """Testing the least recently used pairs are evicted"""
+        cache = DistanceCache(maxsize=2, precision=4)
+        cache.get_distance((45.4642, 9.19), (41.9028, 12.4964))
+        cache.get_distance((40.7128, -74.006), (51.5074, -0.1278))
+        cache.get_distance((45.4642, 9.19), (41.9028, 12.4964))
+        cache.get_distance((35.6762, 139.6503), (51.5074, -0.1278))
+        self.assertEqual(1, cache.stats()["evictions"])
+        self.assertEqual(2, cache.stats()["size"])
+        # the first pair was used more recently than the second one
+        cache.get_distance((45.4642, 9.19), (41.9028, 12.4964))
+        self.assertEqual(2, cache.stats()["hits"])
+        cache.get_distance((40.7128, -74.006), (51.5074, -0.1278))
+        self.assertEqual(4, cache.stats()["misses"])
+
+    @override_settings(CACHES={"distances": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-distances"}})
+    def test_shared(self):
+        """Testing the distances are shared between the caches with the same Django cache"""
+        cache = DistanceCache(maxsize=10, precision=4, shared_alias="distances")
+        other_cache = DistanceCache(maxsize=10, precision=4, shared_alias="distances")
+        distance = cache.get_distance((45.4642, 9.19), (41.9028, 12.4964))
+        self.assertEqual(distance, other_cache.get_distance((45.4642, 9.19), (41.9028, 12.4964)))
+        self.assertEqual(1, other_cache.stats()["shared_hits"])
+        self.assertEqual(0, other_cache.stats()["misses"])
+
+    def test_get_distance_cache(self):
+        """Testing the cache is created once per process"""
+        self.assertIs(distance_cache.get_distance_cache(), distance_cache.get_distance_cache())
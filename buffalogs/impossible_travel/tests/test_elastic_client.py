@@ -0,0 +1,30 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from elasticsearch_dsl import connections
+from impossible_travel.modules import elastic_client
+
+
+class TestElasticClient(SimpleTestCase):
+    @override_settings(CERTEGO_BUFFALOGS_ELASTIC_CONNECTIONS_PER_NODE=25, CERTEGO_BUFFALOGS_ELASTIC_MAX_RETRIES=5, CERTEGO_BUFFALOGS_ELASTIC_SNIFF=True)
+    def test_get_client_options(self):
+        """Testing the client options are read from the settings"""
+        options = elastic_client.get_client_options()
+        self.assertEqual(25, options["connections_per_node"])
+        self.assertEqual(5, options["max_retries"])
+        self.assertTrue(options["sniff_on_start"])
+        self.assertTrue(options["sniff_on_node_failure"])
+
+    def test_get_elastic_client_reused(self):
+        """Testing the client is created once per process and registered as the default elasticsearch_dsl connection"""
+        client = elastic_client.get_elastic_client()
+        self.assertIs(client, elastic_client.get_elastic_client())
+        self.assertIs(client, connections.get_connection("default"))
+
+    def test_get_elastic_client_forked(self):
+        """Testing a forked process doesn't reuse the client of the parent"""
+        client = elastic_client.get_elastic_client()
+        with patch("impossible_travel.modules.elastic_client.os.getpid", return_value=-1):
+            forked_client = elastic_client.get_elastic_client()
+        self.assertIsNot(client, forked_client)
+        self.assertIs(forked_client, connections.get_connection("default"))
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase, override_settings
+from impossible_travel.ingestion.base_ingestion import BaseIngestion, get_user_shard
+from impossible_travel.ingestion.file_ingestion import FileIngestion
+from impossible_travel.ingestion.ingestion_factory import IngestionFactory
+
+
+def build_document(username, event_id, timestamp, ip, country, lat, lon, outcome="success"):
+    return {
+        "_id": event_id,
+        "@timestamp": timestamp,
+        "user": {"name": username},
+        "event": {"category": ["authentication"], "type": ["start"], "outcome": outcome},
+        "source": {"ip": ip, "geo": {"country_name": country, "location": {"lat": lat, "lon": lon}}},
+        "user_agent": {"original": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"},
+    }
+
+
+class TestFileIngestion(SimpleTestCase):
+    start_date = datetime(2023, 5, 3, 6, 0, tzinfo=timezone.utc)
+    end_date = datetime(2023, 5, 3, 8, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        documents = [
+            build_document("Aisha Delgado", "id_2", "2023-05-03T06:55:31.768Z", "203.0.113.17", "United States", 38.8217, -77.1814),
+            build_document("Lorena Goldoni", "id_3", "2023-05-03T07:10:23.154Z", "203.0.113.11", "Italy", 45.4758, 9.2275),
+            build_document("Aisha Delgado", "id_1", "2023-05-03T06:50:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773),
+            # discarded: failed login and login out of the time range
+            build_document("Aisha Delgado", "id_4", "2023-05-03T06:51:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773, outcome="failure"),
+            build_document("Lorena Goldoni", "id_5", "2023-05-03T09:10:23.154Z", "203.0.113.11", "Italy", 45.4758, 9.2275),
+        ]
+        # login exported with dotted keys
+        documents.append(
+            {
+                "_id": "id_6",
+                "_index": "fw-proxy-2023-5-3",
+                "@timestamp": "2023-05-03T06:57:27.768Z",
+                "user.name": "Aisha Delgado",
+                "event.category": "authentication",
+                "event.type": "start",
+                "event.outcome": "success",
+                "source.ip": "203.0.113.20",
+                "source.geo.country_name": "Japan",
+                "source.geo.location.lat": 36.2462,
+                "source.geo.location.lon": 139.0721,
+            }
+        )
+        with open(os.path.join(self.tmp_dir.name, "logins.ndjson"), "w", encoding="utf-8") as f:
+            for document in documents:
+                f.write(json.dumps(document) + "\n")
+
+    def test_iter_window_logins(self):
+        """Testing the NDJSON logins are filtered, grouped by user and sorted by timestamp, also reading the file in chunks smaller than a line"""
+        for chunk_size in [16 * 1024 * 1024, 100]:
+            source = FileIngestion({"path": self.tmp_dir.name, "chunk_size": chunk_size})
+            window_logins = {username: list(logins) for username, logins in source.iter_window_logins(self.start_date, self.end_date)}
+            self.assertListEqual(["Aisha Delgado", "Lorena Goldoni"], list(window_logins))
+            self.assertListEqual(["id_1", "id_2", "id_6"], [login["id"] for login in window_logins["Aisha Delgado"]])
+            self.assertListEqual(["id_3"], [login["id"] for login in window_logins["Lorena Goldoni"]])
+            self.assertEqual("file", window_logins["Aisha Delgado"][0]["index"])
+            self.assertEqual("fw-proxy", window_logins["Aisha Delgado"][2]["index"])
+            self.assertEqual("Japan", window_logins["Aisha Delgado"][2]["country"])
+
+    def test_iter_users_and_user_logins(self):
+        """Testing the users and then their logins are served by a single read of the files"""
+        source = FileIngestion({"path": os.path.join(self.tmp_dir.name, "*.ndjson")})
+        self.assertListEqual([["Aisha Delgado", "Lorena Goldoni"]], list(source.iter_users_pages(self.start_date, self.end_date)))
+        for shard in range(2):
+            self.assertListEqual(
+                [[username for username in ["Aisha Delgado", "Lorena Goldoni"] if get_user_shard(username, 2) == shard]],
+                list(source.iter_users_pages(self.start_date, self.end_date, shard=shard, shards=2)),
+            )
+        with self.assertNoLogs(source.logger, level="INFO"):
+            logins = list(source.iter_user_logins("Aisha Delgado", self.start_date, self.end_date))
+        self.assertListEqual(["id_1", "id_2", "id_6"], [login["id"] for login in logins])
+        self.assertListEqual([], list(source.iter_user_logins("Zoey Ramirez", self.start_date, self.end_date)))
+
+    def test_ingestion_factory(self):
+        """Testing the IngestionFactory returns the active ingestion source of ingestion.json"""
+        with open(os.path.join(self.tmp_dir.name, "ingestion.json"), "w", encoding="utf-8") as f:
+            json.dump({"active_ingestion": "file", "elasticsearch": {}, "file": {"path": self.tmp_dir.name}}, f)
+        with override_settings(CERTEGO_BUFFALOGS_CONFIG_INGESTION_PATH=self.tmp_dir.name):
+            factory = IngestionFactory()
+            self.assertEqual(BaseIngestion.SupportedIngestionSources.FILE, factory.active_ingestion)
+            self.assertIsInstance(factory.get_ingestion_class(), FileIngestion)
@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase
+from impossible_travel.modules.ip_prefix_index import IpPrefixIndex
+
+
+class TestIpPrefixIndex(SimpleTestCase):
+    def test_match_ipv4(self):
+        """Testing the IPv4 addresses are matched exactly or by the networks of the index"""
+        index = IpPrefixIndex(["127.0.0.1", "10.0.0.0/8", "192.168.1.0/24", "192.168.1.128/25"])
+        for ip in ["127.0.0.1", "10.0.0.1", "10.255.255.255", "192.168.1.1", "192.168.1.200", "::ffff:10.1.2.3"]:
+            self.assertIn(ip, index)
+        for ip in ["127.0.0.2", "11.0.0.1", "192.168.2.1", "", None, "not an ip", "2001:db8::1"]:
+            self.assertNotIn(ip, index)
+
+    def test_match_ipv6(self):
+        """Testing the IPv6 addresses are matched exactly or by the networks of the index, also if written in another form"""
+        index = IpPrefixIndex(["2001:db8::/32", "fe80::1", "::ffff:172.16.0.0/108"])
+        for ip in ["2001:db8::1", "2001:0db8:ffff::abcd", "fe80::1", "fe80:0:0:0:0:0:0:1", "172.16.1.1"]:
+            self.assertIn(ip, index)
+        for ip in ["2001:db9::1", "fe80::2", "172.32.0.1", "10.0.0.1"]:
+            self.assertNotIn(ip, index)
+        self.assertEqual("2001:db8::/32", index.find_match("2001:0db8:ffff::abcd"))
+        self.assertEqual("::ffff:172.16.0.0/108", index.find_match("172.16.1.1"))
+        self.assertIsNone(index.find_match("10.0.0.1"))
+
+    def test_match_invalid_values(self):
+        """Testing the values that are not valid IPs or networks are only matched exactly and the catch-all networks match all the IPs"""
+        index = IpPrefixIndex(["Not Available", "0.0.0.0/0"])
+        self.assertIn("Not Available", index)
+        self.assertIn("203.0.113.5", index)
+        self.assertNotIn("2001:db8::1", index)
+        self.assertFalse(IpPrefixIndex([]))
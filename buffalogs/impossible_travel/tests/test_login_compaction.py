@@ -0,0 +1,113 @@
+import datetime
+import random
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from impossible_travel.models import Alert, Config, Login, User
+from impossible_travel.modules import detection
+from impossible_travel.modules.login_compaction import LoginCompactor
+
+LOCATIONS = [
+    ("Italy", 45.4642, 9.19, "1.1.1.1"),
+    ("Italy", 41.9028, 12.4964, "2.2.2.2"),
+    ("France", 48.8566, 2.3522, "3.3.3.3"),
+    ("United States", 40.7128, -74.006, "4.4.4.4"),
+]
+
+
+def build_login(number, timestamp, location, agent="agent", **kwargs):
+    country, lat, lon, ip = location
+    login = {
+        "id": f"event_{number}",
+        "index": "cloud",
+        "ip": ip,
+        "agent": agent,
+        "organization": "ISP",
+        "lat": lat,
+        "lon": lon,
+        "country": country,
+        "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+    }
+    login.update(kwargs)
+    return login
+
+
+class TestLoginCompactor(SimpleTestCase):
+    def setUp(self):
+        self.start = datetime.datetime(2023, 5, 3, 6, 0, tzinfo=datetime.timezone.utc)
+
+    def test_compact_runs(self):
+        """Testing each run of duplicates is reduced to its first and last login"""
+        logins = [build_login(i, self.start + datetime.timedelta(minutes=i), LOCATIONS[0]) for i in range(5)]
+        logins += [build_login(5, self.start + datetime.timedelta(minutes=5), LOCATIONS[2])]
+        logins += [build_login(i, self.start + datetime.timedelta(minutes=i), LOCATIONS[0]) for i in range(6, 9)]
+        compactor = LoginCompactor(atypical_country_days=30)
+        compacted = list(compactor.compact(logins))
+        self.assertEqual(["event_0", "event_4", "event_5", "event_6", "event_8"], [login["id"] for login in compacted])
+        self.assertEqual(9, compactor.events)
+        self.assertEqual(4, compactor.collapsed)
+        self.assertEqual({"event_4": 4, "event_8": 2}, compactor.counts)
+
+    def test_compact_coordinates(self):
+        """Testing the logins with the same ip and country but different coordinates are not collapsed"""
+        moved = ("Italy", 45.0703, 7.6869, "1.1.1.1")
+        logins = [build_login(i, self.start + datetime.timedelta(minutes=i), LOCATIONS[0] if i % 2 else moved) for i in range(4)]
+        compactor = LoginCompactor(atypical_country_days=30)
+        self.assertEqual(["event_0", "event_1", "event_2", "event_3"], [login["id"] for login in compactor.compact(logins)])
+        self.assertEqual(0, compactor.collapsed)
+        self.assertEqual({}, compactor.counts)
+
+    def test_compact_keeps_alerting_logins(self):
+        """Testing the anonymizer logins and the logins without coordinates are kept and the runs are split after atypical_country_days"""
+        logins = [
+            build_login(0, self.start, LOCATIONS[0]),
+            build_login(1, self.start + datetime.timedelta(minutes=1), LOCATIONS[0], intelligence_category="anonymizer"),
+            build_login(2, self.start + datetime.timedelta(minutes=2), LOCATIONS[0], intelligence_category="anonymizer"),
+            build_login(3, self.start + datetime.timedelta(minutes=3), ("", None, None, "1.1.1.1")),
+            build_login(4, self.start + datetime.timedelta(minutes=4), ("", None, None, "1.1.1.1")),
+            build_login(5, self.start + datetime.timedelta(days=1), LOCATIONS[0]),
+            build_login(6, self.start + datetime.timedelta(days=2), LOCATIONS[0]),
+            build_login(7, self.start + datetime.timedelta(days=3), LOCATIONS[0]),
+            build_login(8, self.start + datetime.timedelta(days=4), LOCATIONS[0]),
+        ]
+        compacted = list(LoginCompactor(atypical_country_days=2).compact(logins))
+        self.assertEqual(
+            ["event_0", "event_1", "event_2", "event_3", "event_4", "event_5", "event_6", "event_7", "event_8"], [login["id"] for login in compacted]
+        )
+        compacted = list(LoginCompactor(atypical_country_days=3).compact(logins))
+        self.assertEqual(["event_0", "event_1", "event_2", "event_3", "event_4", "event_5", "event_7", "event_8"], [login["id"] for login in compacted])
+
+
+class TestCompactedDetection(TestCase):
+    def setUp(self):
+        Config.objects.all().delete()
+        Config.objects.create(id=1, atypical_country_days=2)
+
+    def get_detection_result(self, username, fields):
+        db_user = User.objects.create(username=username)
+        for i in range(0, len(fields), 50):
+            detection.check_fields(db_user, fields[i : i + 50])
+        alerts = [
+            (alert.name, alert.description.replace(username, "user"), alert.login_raw_data, alert.filter_type)
+            for alert in Alert.objects.filter(user=db_user).order_by("id")
+        ]
+        logins = sorted(
+            Login.objects.filter(user=db_user).values_list("index", "country", "user_agent", "ip", "event_id", "timestamp", "latitude", "longitude")
+        )
+        return alerts, logins, User.objects.get(id=db_user.id).risk_score
+
+    def test_check_fields_same_alerts(self):
+        """Testing the detection of the compacted logins triggers the same alerts and saves the same logins"""
+        rand = random.Random(42)
+        timestamp = datetime.datetime(2023, 5, 3, 6, 0, tzinfo=datetime.timezone.utc)
+        fields = []
+        for i in range(300):
+            timestamp += datetime.timedelta(minutes=rand.choice([1, 5, 30, 600, 2000]))
+            extra = {"intelligence_category": "anonymizer"} if rand.random() < 0.05 else {}
+            location = rand.choice(LOCATIONS) if rand.random() < 0.15 else LOCATIONS[i // 40 % len(LOCATIONS)]
+            fields.append(build_login(i, timestamp, location, agent=rand.choice(["agent", "agent", "agent", "other agent"]), **extra))
+        with override_settings(CERTEGO_BUFFALOGS_COMPACT_LOGINS=False):
+            expected = self.get_detection_result("Lorena", fields)
+        with override_settings(CERTEGO_BUFFALOGS_COMPACT_LOGINS=True):
+            result = self.get_detection_result("Lorena Goldoni", fields)
+        self.assertTrue(expected[0])
+        self.assertEqual(expected, result)
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+from impossible_travel.modules.login_record import LoginRecord, normalize_index, parse_login_timestamp
+
+
+class TestLoginRecord(SimpleTestCase):
+    source = {
+        "@timestamp": "2023-05-03T06:50:03.768Z",
+        "user": {"name": "Lorena Goldoni"},
+        "source": {
+            "ip": "1.2.3.4",
+            "geo": {"location": {"lat": 45.4758, "lon": 9.2275}, "country_name": "Italy"},
+            "as": {"organization": {"name": "Fastweb"}},
+        },
+        "user_agent": {"original": "Mozilla/5.0"},
+    }
+
+    def test_from_source(self):
+        """Testing the _source of a login is normalized like the previous login dicts"""
+        login = LoginRecord.from_source(self.source, "cloud-2023-5-3", "event_1")
+        self.assertDictEqual(
+            {
+                "timestamp": "2023-05-03T06:50:03.768Z",
+                "id": "event_1",
+                "index": "cloud",
+                "ip": "1.2.3.4",
+                "agent": "Mozilla/5.0",
+                "organization": "Fastweb",
+                "lat": 45.4758,
+                "lon": 9.2275,
+                "country": "Italy",
+            },
+            login.to_dict(),
+        )
+        self.assertEqual(datetime(2023, 5, 3, 6, 50, 3, 768000, tzinfo=timezone.utc), login.timestamp_dt)
+        self.assertEqual("Italy", login["country"])
+        self.assertNotIn("intelligence_category", login)
+        self.assertIsNone(login.get("intelligence_category"))
+        with self.assertRaises(KeyError):
+            login["intelligence_category"]
+
+    def test_from_source_without_geo(self):
+        """Testing the logins without geo info are discarded"""
+        self.assertIsNone(LoginRecord.from_source({"@timestamp": "2023-05-03T06:50:03.768Z", "source": {"ip": "1.2.3.4"}}, "cloud", "event_1"))
+
+    def test_normalize_index(self):
+        self.assertEqual("fw-proxy", normalize_index("fw-2023-5-3"))
+        self.assertEqual("weblog", normalize_index("weblog-2023-5-3"))
+
+    def test_parse_login_timestamp(self):
+        expected = datetime(2023, 5, 3, 6, 50, 3, tzinfo=timezone.utc)
+        self.assertEqual(expected, parse_login_timestamp("2023-05-03T06:50:03Z"))
+        self.assertEqual(expected, parse_login_timestamp("2023-05-03T06:50:03"))
+        self.assertEqual(expected, parse_login_timestamp(datetime(2023, 5, 3, 6, 50, 3)))
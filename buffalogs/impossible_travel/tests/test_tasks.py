@@ -1,13 +1,22 @@
 import json
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
 
+from buffalogs.celery import app as celery_app
+from django.conf import settings
+from django.contrib import admin
 from django.db import connection
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from django.utils import timezone
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.response import Hit, Response
 from impossible_travel import tasks
+from impossible_travel.admin import AlertAdmin
 from impossible_travel.constants import AlertDetectionType
-from impossible_travel.models import Alert, Login, User, UsersIP
+from impossible_travel.ingestion.base_ingestion import USER_SHARD_SCRIPT
+from impossible_travel.ingestion.elasticsearch_ingestion import ElasticsearchIngestion
+from impossible_travel.models import Alert, BackfillCheckpoint, Login, TaskSettings, User, UsersIP
 
 
 def load_test_data(name):
@@ -17,6 +26,23 @@ def load_test_data(name):
     return data
 
 
+def build_raw_hit(username, event_id, timestamp, ip, country, lat, lon, index="cloud-test_data-2023-5-3"):
+    return {
+        "_index": index,
+        "_id": event_id,
+        "_source": {
+            "user": {"name": username},
+            "@timestamp": timestamp,
+            "source": {"ip": ip, "geo": {"country_name": country, "location": {"lat": lat, "lon": lon}}},
+            "user_agent": {"original": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"},
+        },
+    }
+
+
+def build_hit(username, event_id, timestamp, ip, country, lat, lon, index="cloud-test_data-2023-5-3"):
+    return Hit(build_raw_hit(username, event_id, timestamp, ip, country, lat, lon, index=index))
+
+
 class TestTasks(TestCase):
     fixtures = ["tests-fixture"]
     raw_data_NEW_COUNTRY = {
@@ -73,3 +99,323 @@ class TestTasks(TestCase):
             Alert.objects.get(user__username="Lorena")
         with self.assertRaises(UsersIP.DoesNotExist):
             UsersIP.objects.get(user__username="Lorena")
+
+    def test_clear_models_periodically_alert_count(self):
+        """Testing the cleaning of the old alerts decreases the alert_count of their users"""
+        user_obj = User.objects.create(username="Lorena", alert_count=3)
+        for _ in range(3):
+            Alert.objects.create(user=user_obj, name=AlertDetectionType.NEW_COUNTRY.value, login_raw_data=self.raw_data_NEW_COUNTRY)
+        Alert.objects.filter(id__in=Alert.objects.filter(user=user_obj).values("id")[:2]).update(updated=timezone.now() + timedelta(days=-100))
+        tasks.clean_models_periodically()
+        self.assertEqual(1, User.objects.get(username="Lorena").alert_count)
+        self.assertEqual(1, Alert.objects.filter(user=user_obj).count())
+
+    def test_admin_delete_alerts_alert_count(self):
+        """Testing the bulk delete of the alerts from the admin decreases the alert_count of their users"""
+        users = [User.objects.create(username="Lorena", alert_count=3), User.objects.create(username="Lorygold", alert_count=2)]
+        for user_obj, alerts_num in zip(users, [3, 2]):
+            for _ in range(alerts_num):
+                Alert.objects.create(user=user_obj, name=AlertDetectionType.NEW_COUNTRY.value, login_raw_data=self.raw_data_NEW_COUNTRY)
+        request = RequestFactory().post("/admin/impossible_travel/alert/")
+        queryset = Alert.objects.filter(id__in=Alert.objects.filter(user=users[0]).values("id")[:2]) | Alert.objects.filter(user=users[1])
+        AlertAdmin(Alert, admin.site).delete_queryset(request, queryset)
+        self.assertEqual(1, User.objects.get(username="Lorena").alert_count)
+        self.assertEqual(0, User.objects.get(username="Lorygold").alert_count)
+        self.assertEqual(1, Alert.objects.filter(user__in=users).count())
+
+    def test_delete_alert_alert_count(self):
+        """Testing the alert_count is decreased only for the alerts actually deleted, and never below 0 (es. alerts loaded from fixtures)"""
+        user_obj = User.objects.create(username="Lorena", alert_count=1)
+        alert = Alert.objects.create(user=user_obj, name=AlertDetectionType.NEW_COUNTRY.value, login_raw_data=self.raw_data_NEW_COUNTRY)
+        Alert.objects.create(user=user_obj, name=AlertDetectionType.NEW_DEVICE.value, login_raw_data=self.raw_data_NEW_COUNTRY)
+        alert.delete()
+        self.assertEqual(0, User.objects.get(username="Lorena").alert_count)
+        alert.delete()
+        self.assertEqual(0, User.objects.get(username="Lorena").alert_count)
+        Alert.objects.filter(user=user_obj).delete()
+        self.assertEqual(0, User.objects.get(username="Lorena").alert_count)
+        self.assertFalse(Alert.objects.filter(user=user_obj).exists())
+
+    @override_settings(CERTEGO_BUFFALOGS_INGESTION_MAX_BATCH_SIZE=2)
+    @patch("impossible_travel.tasks.detection.check_fields")
+    @patch("impossible_travel.ingestion.elasticsearch_ingestion.Search.scan")
+    def test_process_window(self, mock_scan, mock_check_fields):
+        """Testing process_window() groups the scanned logins by user, in batches of at most CERTEGO_BUFFALOGS_INGESTION_MAX_BATCH_SIZE logins"""
+        mock_scan.return_value = iter(
+            [
+                build_hit("Aisha Delgado", "id_1", "2023-05-03T06:50:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773),
+                build_hit("Aisha Delgado", "id_2", "2023-05-03T06:55:31.768Z", "203.0.113.17", "United States", 38.8217, -77.1814),
+                build_hit("Aisha Delgado", "id_3", "2023-05-03T06:57:27.768Z", "203.0.113.20", "Japan", 36.2462, 139.0721, index="fw-proxy-2023-5-3"),
+                build_hit("Lorena Goldoni", "id_4", "2023-05-03T07:10:23.154Z", "203.0.113.11", "Italy", 45.4758, 9.2275),
+            ]
+        )
+        end_date = timezone.now()
+        self.assertEqual(2, tasks.process_window(end_date - timedelta(minutes=30), end_date))
+        self.assertEqual(3, mock_check_fields.call_count)
+        first_user, first_batch = mock_check_fields.call_args_list[0].args
+        self.assertEqual("Aisha Delgado", first_user.username)
+        self.assertListEqual(["id_1", "id_2"], [login["id"] for login in first_batch])
+        second_user, second_batch = mock_check_fields.call_args_list[1].args
+        self.assertEqual("Aisha Delgado", second_user.username)
+        self.assertEqual("fw-proxy", second_batch[0]["index"])
+        self.assertEqual("Japan", second_batch[0]["country"])
+        third_user, third_batch = mock_check_fields.call_args_list[2].args
+        self.assertEqual("Lorena Goldoni", third_user.username)
+        self.assertListEqual(["id_4"], [login["id"] for login in third_batch])
+
+    @override_settings(CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE=2)
+    @patch("impossible_travel.tasks.detection.check_fields")
+    @patch("impossible_travel.ingestion.elasticsearch_ingestion.Search.scan")
+    def test_process_user_pages(self, mock_scan, mock_check_fields):
+        """Testing process_user() streams all the user logins page by page, without any limit on the number of hits"""
+        mock_scan.return_value = iter(
+            [build_hit("Aisha Delgado", f"id_{i}", f"2023-05-03T06:5{i}:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773) for i in range(5)]
+        )
+        db_user = User.objects.get(username="Aisha Delgado")
+        end_date = timezone.now()
+        tasks.process_user(db_user, end_date - timedelta(minutes=30), end_date)
+        self.assertEqual(3, mock_check_fields.call_count)
+        self.assertListEqual([2, 2, 1], [len(call.args[1]) for call in mock_check_fields.call_args_list])
+        self.assertListEqual([f"id_{i}" for i in range(5)], [login["id"] for call in mock_check_fields.call_args_list for login in call.args[1]])
+
+    @patch("impossible_travel.tasks.detection.check_fields")
+    @patch.object(Search, "execute", autospec=True)
+    def test_process_user_aggregated(self, mock_execute, mock_check_fields):
+        """Testing process_user() in aggregated mode gets only the first and the last login of each tuple, paginated by the composite aggregation"""
+
+        def build_tuple_bucket(doc_count, first_hit, last_hit):
+            return {
+                "key": {"index": first_hit["_index"], "ip": first_hit["_source"]["source"]["ip"]},
+                "doc_count": doc_count,
+                "first_login": {"hits": {"hits": [first_hit]}},
+                "last_login": {"hits": {"hits": [last_hit]}},
+            }
+
+        india = [build_raw_hit("Aisha Delgado", f"id_{i}", f"2023-05-03T06:5{i}:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773) for i in (0, 7)]
+        japan = build_raw_hit("Aisha Delgado", "id_5", "2023-05-03T06:55:03.768Z", "203.0.113.20", "Japan", 36.2462, 139.0721)
+        pages = [
+            {"aggregations": {"login_tuple": {"after_key": {"ip": "203.0.113.20"}, "buckets": [build_tuple_bucket(1, japan, japan)]}}},
+            {"aggregations": {"login_tuple": {"after_key": {"ip": "203.0.113.37"}, "buckets": [build_tuple_bucket(6, india[0], india[1])]}}},
+            {"aggregations": {"login_tuple": {"buckets": []}}},
+        ]
+        searches = []
+
+        def execute(search, *args, **kwargs):
+            searches.append(search.to_dict())
+            return Response(search, pages[len(searches) - 1])
+
+        mock_execute.side_effect = execute
+        db_user = User.objects.get(username="Aisha Delgado")
+        end_date = timezone.now()
+        tasks.process_user(db_user, end_date - timedelta(minutes=30), end_date, mode="aggregated")
+        self.assertEqual(3, len(searches))
+        self.assertEqual(0, searches[0]["size"])
+        self.assertIn("first_login", searches[0]["aggs"]["login_tuple"]["aggs"])
+        self.assertDictEqual({"ip": "203.0.113.20"}, searches[1]["aggs"]["login_tuple"]["composite"]["after"])
+        self.assertEqual(1, mock_check_fields.call_count)
+        self.assertListEqual(["id_0", "id_5", "id_7"], [login["id"] for login in mock_check_fields.call_args.args[1]])
+
+    @override_settings(CERTEGO_BUFFALOGS_INGESTION_PAGE_SIZE=2, CERTEGO_BUFFALOGS_INGESTION_CONCURRENCY=2)
+    @patch("impossible_travel.tasks.detection.check_fields")
+    @patch("impossible_travel.modules.async_ingestion.async_scan")
+    @patch("impossible_travel.modules.async_ingestion.get_async_elastic_client")
+    def test_process_users_async(self, mock_get_async_elastic_client, mock_async_scan, mock_check_fields):
+        """Testing process_users_async() fetches the users pages and their logins with the async client, keeping the logins of each user in order"""
+        logins = {
+            "Aisha Delgado": [
+                build_raw_hit("Aisha Delgado", f"id_{i}", f"2023-05-03T06:5{i}:03.768Z", "203.0.113.37", "India", 26.9411, 75.8773) for i in range(3)
+            ],
+            "Lorena Goldoni": [build_raw_hit("Lorena Goldoni", "id_3", "2023-05-03T07:10:23.154Z", "203.0.113.11", "Italy", 45.4758, 9.2275)],
+        }
+
+        async def fake_async_scan(client, query, **kwargs):
+            for hit in logins[query["query"]["bool"]["must"][0]["match"]["user.name"]]:
+                yield hit
+
+        mock_async_scan.side_effect = fake_async_scan
+        mock_client = mock_get_async_elastic_client.return_value
+        mock_client.search = AsyncMock(
+            side_effect=[
+                {"aggregations": {"login_user": {"buckets": [{"key": {"username": "Aisha Delgado"}}], "after_key": {"username": "Aisha Delgado"}}}},
+                {"aggregations": {"login_user": {"buckets": [{"key": {"username": "Lorena Goldoni"}}], "after_key": {"username": "Lorena Goldoni"}}}},
+                {"aggregations": {"login_user": {"buckets": []}}},
+            ]
+        )
+        end_date = timezone.now()
+        self.assertEqual(2, tasks.process_users_async(end_date - timedelta(minutes=30), end_date))
+        self.assertEqual(3, mock_client.search.call_count)
+        self.assertEqual({"username": "Aisha Delgado"}, mock_client.search.call_args_list[1].kwargs["body"]["aggs"]["login_user"]["composite"]["after"])
+        self.assertEqual(3, mock_check_fields.call_count)
+        calls = {}
+        for call in mock_check_fields.call_args_list:
+            calls.setdefault(call.args[0].username, []).append([login["id"] for login in call.args[1]])
+        self.assertDictEqual({"Aisha Delgado": [["id_0", "id_1"], ["id_2"]], "Lorena Goldoni": [["id_3"]]}, calls)
+
+    @patch("impossible_travel.modules.async_ingestion.async_scan")
+    @patch("impossible_travel.modules.async_ingestion.get_async_elastic_client")
+    def test_process_users_async_error(self, mock_get_async_elastic_client, mock_async_scan):
+        """Testing the errors of the async ingestion are raised to the caller"""
+
+        async def fake_async_scan(client, query, **kwargs):
+            raise ConnectionError("elasticsearch unreachable")
+            yield
+
+        mock_async_scan.side_effect = fake_async_scan
+        end_date = timezone.now()
+        with self.assertRaises(ConnectionError):
+            tasks.process_users_async(end_date - timedelta(minutes=30), end_date, usernames=["Aisha Delgado"])
+
+    @patch("impossible_travel.tasks.process_user")
+    @patch.object(Search, "execute", autospec=True)
+    def test_exec_process_logs_users_pages(self, mock_execute, mock_process_user):
+        """Testing exec_process_logs() processes all the users paginated by the composite aggregation"""
+        pages = [
+            {
+                "aggregations": {
+                    "login_user": {
+                        "after_key": {"username": "Aisha Delgado"},
+                        "buckets": [{"key": {"username": "Lorena Goldoni"}, "doc_count": 3}, {"key": {"username": "Aisha Delgado"}, "doc_count": 1}],
+                    }
+                }
+            },
+            {"aggregations": {"login_user": {"after_key": {"username": "Zoey Ramirez"}, "buckets": [{"key": {"username": "Zoey Ramirez"}, "doc_count": 2}]}}},
+            {"aggregations": {"login_user": {"buckets": []}}},
+        ]
+        searches = []
+
+        def execute(search, *args, **kwargs):
+            searches.append(search.to_dict())
+            return Response(search, pages[len(searches) - 1])
+
+        mock_execute.side_effect = execute
+        end_date = timezone.now()
+        tasks.exec_process_logs(end_date - timedelta(minutes=30), end_date)
+        self.assertListEqual(["Lorena Goldoni", "Aisha Delgado", "Zoey Ramirez"], [call.args[0].username for call in mock_process_user.call_args_list])
+        self.assertTrue(User.objects.filter(username="Zoey Ramirez").exists())
+        self.assertEqual(3, len(searches))
+        self.assertNotIn("after", searches[0]["aggs"]["login_user"]["composite"])
+        self.assertDictEqual({"username": "Aisha Delgado"}, searches[1]["aggs"]["login_user"]["composite"]["after"])
+        self.assertDictEqual({"username": "Zoey Ramirez"}, searches[2]["aggs"]["login_user"]["composite"]["after"])
+
+    def test_get_user_shard(self):
+        """Testing get_user_shard() maps each username to the same shard"""
+        shards = {username: tasks.get_user_shard(username, 4) for username in ["Lorena Goldoni", "Aisha Delgado", "Zoey Ramirez"]}
+        for username, shard in shards.items():
+            self.assertIn(shard, range(4))
+            self.assertEqual(shard, tasks.get_user_shard(username, 4))
+        self.assertEqual(0, tasks.get_user_shard("Lorena Goldoni", 1))
+        # the hash is the Java String.hashCode() computed by the elasticsearch script
+        self.assertEqual(99162322 % 7, tasks.get_user_shard("hello", 7))
+        self.assertEqual(-(2**31) % 3, tasks.get_user_shard("polygenelubricants", 3))
+        self.assertEqual(ord("é") % 5, tasks.get_user_shard("é", 5))
+
+    @override_settings(CERTEGO_BUFFALOGS_CATCH_UP_BUCKET_MINUTES=5)
+    def test_events_histogram_search_bounds(self):
+        """Testing the buckets of the events histogram start from start_date, even if it isn't aligned to the interval"""
+        start_date = timezone.make_aware(datetime(2023, 5, 3, 6, 7, 30))
+        end_date = start_date + timedelta(hours=1)
+        histogram = ElasticsearchIngestion({}).events_histogram_search(start_date, end_date).to_dict()["aggs"]["login_histogram"]["date_histogram"]
+        self.assertEqual("150s", histogram["offset"])
+        self.assertEqual({"min": start_date, "max": end_date}, histogram["hard_bounds"])
+
+    def test_users_page_search_shard(self):
+        """Testing the users page query of a shard excludes the users of the other shards with a script"""
+        query = ElasticsearchIngestion({}).users_page_search(timezone.now(), timezone.now(), shard=1, shards=3).to_dict()
+        scripts = [clause["script"]["script"] for clause in query["query"]["bool"]["filter"] if "script" in clause]
+        self.assertEqual([{"source": USER_SHARD_SCRIPT, "params": {"shard": 1, "shards": 3}}], scripts)
+
+    @override_settings(CERTEGO_BUFFALOGS_DETECTION_SHARDS=3)
+    @patch("impossible_travel.tasks.get_events_histogram", return_value=[])
+    @patch("impossible_travel.tasks.process_user")
+    @patch("impossible_travel.tasks.iter_users_pages")
+    def test_process_logs_shards(self, mock_iter_users_pages, mock_process_user, mock_get_events_histogram):
+        """Testing process_logs() with the users split in shards: the TaskSettings is advanced after all the shards of each time range"""
+        mock_iter_users_pages.side_effect = lambda start_date, end_date: iter([["Lorena Goldoni", "Aisha Delgado"], ["Zoey Ramirez"]])
+        end_date = timezone.now() - timedelta(minutes=65)
+        TaskSettings.objects.create(task_name="process_logs", start_date=end_date - timedelta(minutes=30), end_date=end_date)
+        # run the celery chord synchronously
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True, CELERY_RESULT_BACKEND="cache+memory://")
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=settings.CELERY_RESULT_BACKEND)
+        tasks.process_logs()
+        # 2 time ranges of 30 minutes, 3 users each
+        self.assertEqual(6, mock_process_user.call_count)
+        self.assertListEqual(
+            [end_date, end_date, end_date, end_date + timedelta(minutes=30), end_date + timedelta(minutes=30), end_date + timedelta(minutes=30)],
+            sorted(call.args[1] for call in mock_process_user.call_args_list),
+        )
+        process_task = TaskSettings.objects.get(task_name="process_logs")
+        self.assertEqual(end_date + timedelta(minutes=30), process_task.start_date)
+        self.assertEqual(end_date + timedelta(minutes=60), process_task.end_date)
+        self.assertEqual(process_task.end_date, process_task.dispatched_end_date)
+
+    def test_tasks_ignore_result(self):
+        """Testing only the detection shards, joined by the chord, store their results"""
+        self.assertFalse(tasks.process_users_shard.ignore_result)
+        for task in [tasks.clean_models_periodically, tasks.process_logs, tasks.notify_alerts, tasks.complete_shards, tasks.backfill_shard]:
+            self.assertTrue(task.ignore_result, task.name)
+
+    @patch("impossible_travel.tasks.exec_process_logs")
+    @patch("impossible_travel.tasks.get_events_histogram")
+    def test_process_logs_adaptive_windows(self, mock_get_events_histogram, mock_exec_process_logs):
+        """Testing process_logs() sizes the time windows from the events histogram and the measured throughput, without skipping the backlog"""
+        start_date = (timezone.now() - timedelta(days=3)).replace(second=0, microsecond=0)
+        # a quiet day followed by a burst: 5-minutes buckets with 10 events, then 3 buckets with 3000 events
+        buckets = [(start_date + timedelta(minutes=5 * i), start_date + timedelta(minutes=5 * (i + 1)), 10) for i in range(288)]
+        buckets += [(start_date + timedelta(minutes=5 * i), start_date + timedelta(minutes=5 * (i + 1)), 3000) for i in range(288, 291)]
+        mock_get_events_histogram.return_value = buckets
+        TaskSettings.objects.create(task_name="process_logs", start_date=start_date - timedelta(minutes=30), end_date=start_date, events_per_second=10)
+        tasks.process_logs()
+        windows = [(call.args[0], call.args[1]) for call in mock_exec_process_logs.call_args_list]
+        # the windows are contiguous from the last end_date: the quiet day in windows of at most 12 hours, one window for each bucket of the burst
+        self.assertEqual(start_date, windows[0][0])
+        for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+            self.assertEqual(previous_end, next_start)
+        self.assertListEqual(
+            [timedelta(hours=12), timedelta(hours=12), timedelta(minutes=5), timedelta(minutes=5), timedelta(minutes=5)],
+            [end - start for start, end in windows],
+        )
+        process_task = TaskSettings.objects.get(task_name="process_logs")
+        self.assertEqual(windows[-1][1], process_task.end_date)
+        self.assertNotEqual(10, process_task.events_per_second)
+
+    @override_settings(CERTEGO_BUFFALOGS_BACKFILL_WINDOW_MINUTES=60)
+    @patch("impossible_travel.tasks.process_user")
+    @patch("impossible_travel.tasks.iter_users_pages")
+    def test_backfill_shard_resume(self, mock_iter_users_pages, mock_process_user):
+        """Testing backfill_shard() resumes from its checkpoint and processes only the users of its shard"""
+        usernames = ["Lorena Goldoni", "Aisha Delgado", "Zoey Ramirez"]
+        mock_iter_users_pages.side_effect = lambda start_date, end_date, shard, shards: iter(
+            [[username for username in usernames if tasks.get_user_shard(username, shards) == shard]]
+        )
+        start_date = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        end_date = start_date + timedelta(hours=4)
+        name = tasks.create_backfill(start_date, end_date, 2)
+        # the first window was already processed by an interrupted backfill
+        BackfillCheckpoint.objects.filter(name=name, shard=1).update(processed_until=start_date + timedelta(hours=1))
+        tasks.backfill_shard(name, 1)
+        shard_usernames = [username for username in usernames if tasks.get_user_shard(username, 2) == 1]
+        self.assertEqual(3 * len(shard_usernames), mock_process_user.call_count)
+        for call in mock_process_user.call_args_list:
+            self.assertIn(call.args[0].username, shard_usernames)
+        self.assertListEqual(
+            [start_date + timedelta(hours=hours) for hours in range(1, 4) for _ in shard_usernames], [call.args[1] for call in mock_process_user.call_args_list]
+        )
+        self.assertEqual(end_date, BackfillCheckpoint.objects.get(name=name, shard=1).processed_until)
+        self.assertEqual(start_date, BackfillCheckpoint.objects.get(name=name, shard=0).processed_until)
+        # the same backfill can't be resumed with a different number of shards
+        with self.assertRaises(ValueError):
+            tasks.create_backfill(start_date, end_date, 3)
+
+    @patch("impossible_travel.tasks.process_user")
+    @patch("impossible_travel.tasks.iter_users_pages")
+    def test_exec_backfill_celery(self, mock_iter_users_pages, mock_process_user):
+        """Testing exec_backfill() dispatches a celery task for each shard, completing all the checkpoints"""
+        mock_iter_users_pages.side_effect = lambda start_date, end_date, shard, shards: iter(
+            [[username for username in ["Lorena Goldoni", "Aisha Delgado", "Zoey Ramirez"] if tasks.get_user_shard(username, shards) == shard]]
+        )
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True, CELERY_RESULT_BACKEND="cache+memory://")
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=settings.CELERY_RESULT_BACKEND)
+        end_date = timezone.now().replace(minute=0, second=0, microsecond=0)
+        name = tasks.exec_backfill(end_date - timedelta(hours=3), end_date, workers=3, use_celery=True)
+        self.assertEqual(9, mock_process_user.call_count)
+        self.assertListEqual([end_date] * 3, [checkpoint.processed_until for checkpoint in BackfillCheckpoint.objects.filter(name=name)])
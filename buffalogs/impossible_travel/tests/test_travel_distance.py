@@ -0,0 +1,54 @@
+import random
+
+from django.test import SimpleTestCase
+from geopy.distance import geodesic
+from impossible_travel.modules import travel_distance
+from impossible_travel.modules.travel_distance import DistanceMode
+
+
+class TestTravelDistance(SimpleTestCase):
+    def test_haversine_km(self):
+        """Testing the haversine distance is close to the geodesic one"""
+        distances = travel_distance.haversine_km([45.4642, 40.7128], [9.19, -74.006], [41.9028, 51.5074], [12.4964, -0.1278])
+        self.assertAlmostEqual(geodesic((45.4642, 9.19), (41.9028, 12.4964)).km, distances[0], delta=geodesic((45.4642, 9.19), (41.9028, 12.4964)).km * 0.01)
+        self.assertAlmostEqual(
+            geodesic((40.7128, -74.006), (51.5074, -0.1278)).km, distances[1], delta=geodesic((40.7128, -74.006), (51.5074, -0.1278)).km * 0.01
+        )
+
+    def test_calc_travels_geodesic(self):
+        """Testing the impossible travels and their velocities are the same of the geodesic distances"""
+        prev_coordinates = [(45.748, 4.85), (45.4642, 9.19), (45.4642, 9.19), (40.364, -79.8605)]
+        coordinates = [(43.3178, -5.4125), (45.4654, 9.1859), (41.9028, 12.4964), ("15.9876", "32.5674")]
+        hours = [1, 0, 10, 0.5]
+        distances, velocities, alerts = travel_distance.calc_travels(prev_coordinates, coordinates, hours, 100, 300, mode=DistanceMode.GEODESIC)
+        self.assertListEqual([True, False, False, True], alerts.tolist())
+        self.assertEqual(geodesic(prev_coordinates[0], coordinates[0]).km, distances[0])
+        self.assertEqual(int(geodesic(prev_coordinates[0], coordinates[0]).km), int(velocities[0]))
+        self.assertEqual(int(geodesic(prev_coordinates[3], coordinates[3]).km / 0.5), int(velocities[3]))
+        # accepted distance --> no velocity
+        self.assertEqual(0, velocities[1])
+
+    def test_calc_travels_same_alerts(self):
+        """Testing the GEODESIC mode finds the same impossible travels of the geodesic distance of all the travels"""
+        rnd = random.Random(42)
+        # geoip coordinates, with 4 decimal digits
+        prev_coordinates = [(round(rnd.uniform(-80, 80), 4), round(rnd.uniform(-180, 180), 4)) for _ in range(300)]
+        coordinates = [(round(lat + rnd.uniform(-5, 5), 4), round(lon + rnd.uniform(-5, 5), 4)) for lat, lon in prev_coordinates]
+        hours = [rnd.uniform(-1, 3) for _ in range(300)]
+        _, velocities, alerts = travel_distance.calc_travels(prev_coordinates, coordinates, hours, 100, 300, mode=DistanceMode.GEODESIC)
+        for i in range(300):
+            distance = geodesic(prev_coordinates[i], coordinates[i]).km
+            vel = distance / hours[i]
+            expected = distance > 100 and vel > 300
+            self.assertEqual(expected, alerts[i])
+            if expected:
+                self.assertEqual(int(vel), int(velocities[i]))
+
+    def test_calc_travels_haversine(self):
+        distances, velocities, alerts = travel_distance.calc_travels([(45.748, 4.85)], [(43.3178, -5.4125)], [1], 100, 300, mode=DistanceMode.HAVERSINE)
+        self.assertTrue(alerts[0])
+        self.assertEqual(distances[0], velocities[0])
+
+    def test_calc_travels_unsupported_mode(self):
+        with self.assertRaises(ValueError):
+            travel_distance.calc_travels([(45.748, 4.85)], [(43.3178, -5.4125)], [1], 100, 300, mode="vincenty")
@@ -0,0 +1,70 @@
+import datetime
+
+from django.test import SimpleTestCase, TestCase
+from impossible_travel.constants import AlertDetectionType
+from impossible_travel.models import Alert, Login, User, UsersIP
+from impossible_travel.modules import detection
+from impossible_travel.modules.travel_evaluator import TravelEvaluator
+
+
+class TestTravelEvaluator(SimpleTestCase):
+    def test_sequential_travels(self):
+        """Testing each travel starts from the previous location of the user"""
+        travels = TravelEvaluator(last_location=("Italy", 45.4642, 9.19, datetime.datetime(2023, 5, 3, 6, 0, tzinfo=datetime.timezone.utc)))
+        rome = {"lat": 41.9028, "lon": 12.4964, "country": "Italy", "timestamp": "2023-05-03T07:00:00Z"}
+        new_york = {"lat": 40.7128, "lon": -74.006, "country": "United States", "timestamp": "2023-05-03T08:00:00Z"}
+        first = travels.add_travel(rome)
+        travels.move_to(rome)
+        second = travels.add_travel(new_york)
+        travels.move_to(new_york)
+        travels.evaluate(100, 300)
+        self.assertEqual((True, 477, ("Italy", 45.4642, 9.19)), travels.get_travel(first))
+        is_impossible_travel, _, start = travels.get_travel(second)
+        self.assertTrue(is_impossible_travel)
+        self.assertEqual(("Italy", 41.9028, 12.4964), start)
+        self.assertEqual("United States", travels.last_location[0])
+
+    def test_no_last_login(self):
+        travels = TravelEvaluator()
+        self.assertIsNone(travels.add_travel({"lat": 41.9028, "lon": 12.4964, "country": "Italy", "timestamp": "2023-05-03T07:00:00Z"}))
+        travels.evaluate(100, 300)
+
+
+class TestSequentialDetection(TestCase):
+    def test_check_fields_intra_batch_travels(self):
+        """Testing each login of the batch is compared with the previous login of the batch, not only with the last saved one"""
+        db_user = User.objects.create(username="Traveller")
+        Login.objects.create(
+            user=db_user,
+            event_id="event_0",
+            index="cloud",
+            ip="1.1.1.1",
+            timestamp=datetime.datetime(2023, 5, 3, 6, 0, 0, tzinfo=datetime.timezone.utc),
+            latitude=45.4642,
+            longitude=9.19,
+            country="Italy",
+            user_agent="agent",
+        )
+        UsersIP.objects.create(user=db_user, ip="1.1.1.1")
+        base_login = {"index": "cloud", "agent": "agent", "organization": "ISP"}
+        fields = [
+            # Milan --> Rome in 3 hours: accepted
+            {**base_login, "id": "event_1", "ip": "2.2.2.2", "lat": 41.9028, "lon": 12.4964, "country": "Italy", "timestamp": "2023-05-03T09:00:00.000Z"},
+            # Rome --> New York in 1 hour: impossible travel from Rome
+            {
+                **base_login,
+                "id": "event_2",
+                "ip": "3.3.3.3",
+                "lat": 40.7128,
+                "lon": -74.006,
+                "country": "United States",
+                "timestamp": "2023-05-03T10:00:00.000Z",
+            },
+        ]
+        detection.check_fields(db_user, fields)
+        travel_alerts = Alert.objects.filter(user=db_user, name=AlertDetectionType.IMP_TRAVEL)
+        self.assertEqual(1, travel_alerts.count())
+        self.assertEqual("event_2", travel_alerts[0].login_raw_data["id"])
+        self.assertEqual("Italy", travel_alerts[0].login_raw_data["buffalogs"]["start_country"])
+        self.assertEqual(41.9028, travel_alerts[0].login_raw_data["buffalogs"]["start_lat"])
+        self.assertEqual(12.4964, travel_alerts[0].login_raw_data["buffalogs"]["start_lon"])
@@ -0,0 +1,92 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from impossible_travel.constants import AlertDetectionType, AlertFilterType, UserRiskScoreType
+from impossible_travel.models import Alert, Config, User
+from impossible_travel.modules import detection
+from impossible_travel.modules.travel_distance import DistanceMode
+from impossible_travel.modules.travel_redetection import redetect_impossible_travels
+
+LOGINS = [
+    ("2023-05-03T06:00:00.000Z", "Italy", 45.4642, 9.19),
+    ("2023-05-03T07:00:00.000Z", "France", 48.8566, 2.3522),
+    ("2023-05-03T09:30:00.000Z", "Germany", 52.52, 13.405),
+    ("2023-05-03T11:00:00.000Z", "United States", 40.7128, -74.006),
+    ("2023-05-04T09:00:00.000Z", "Japan", 35.6762, 139.6503),
+]
+
+
+class TestTravelRedetection(TestCase):
+    def setUp(self):
+        Config.objects.all().delete()
+        self.config = Config.objects.create(id=1, distance_accepted=100, vel_accepted=300, allowed_countries=["Japan"])
+        self.fields = [
+            {"id": f"event_{i}", "index": "cloud", "ip": f"1.1.1.{i}", "agent": "agent", "timestamp": timestamp, "country": country, "lat": lat, "lon": lon}
+            for i, (timestamp, country, lat, lon) in enumerate(LOGINS)
+        ]
+
+    def get_travel_alerts(self, db_user):
+        return list(Alert.objects.filter(user=db_user, name=AlertDetectionType.IMP_TRAVEL).order_by("login_raw_data__timestamp"))
+
+    def test_redetect_same_alerts(self):
+        """Testing the re-detection in the db finds the same impossible travels of the detection"""
+        expected_user = User.objects.create(username="Lorena")
+        detection.check_fields(expected_user, self.fields)
+        expected_alerts = self.get_travel_alerts(expected_user)
+        self.assertEqual(["event_1", "event_2", "event_3", "event_4"], [alert.login_raw_data["id"] for alert in expected_alerts])
+        # the logins of the other user are saved with a velocity threshold that doesn't trigger any alert
+        self.config.vel_accepted = 100000
+        self.config.save()
+        db_user = User.objects.create(username="Lorena Goldoni")
+        detection.check_fields(db_user, self.fields)
+        self.assertEqual([], self.get_travel_alerts(db_user))
+        self.assertEqual(4, redetect_impossible_travels(vel_accepted=300, usernames=["Lorena Goldoni"], dry_run=True))
+        self.assertEqual(4, redetect_impossible_travels(vel_accepted=300, usernames=["Lorena Goldoni"]))
+        alerts = self.get_travel_alerts(db_user)
+        for expected_alert, alert in zip(expected_alerts, alerts):
+            expected_info, info = expected_alert.login_raw_data.pop("buffalogs"), alert.login_raw_data.pop("buffalogs")
+            self.assertDictEqual(expected_alert.login_raw_data, alert.login_raw_data)
+            self.assertEqual(expected_info["start_country"], info["start_country"])
+            self.assertEqual(expected_info["start_lat"], info["start_lat"])
+            # the impossible travels are checked with the geodesic distance, as in the detection
+            self.assertEqual(expected_info["avg_speed"], info["avg_speed"])
+            self.assertTrue(alert.description.startswith(f"Impossible Travel detected for User: Lorena Goldoni, at: {alert.login_raw_data['timestamp']}"))
+        self.assertEqual(len(Alert.objects.filter(user=db_user)), User.objects.get(id=db_user.id).alert_count)
+        # the alerts are not duplicated
+        self.assertEqual(0, redetect_impossible_travels(vel_accepted=300))
+
+    def test_redetect_filters(self):
+        """Testing the new alerts are filtered and their users risk_score is updated"""
+        self.config.vel_accepted = 100000
+        self.config.save()
+        db_user = User.objects.create(username="Lorena")
+        detection.check_fields(db_user, self.fields)
+        alerts_count = User.objects.get(id=db_user.id).alert_count
+        call_command("redetect_impossible_travels", "--vel-accepted", "10", "--start-date", "2023-05-04 00:00:00", stdout=StringIO())
+        alerts = self.get_travel_alerts(db_user)
+        self.assertEqual(["event_4"], [alert.login_raw_data["id"] for alert in alerts])
+        self.assertEqual([AlertFilterType.ALLOWED_COUNTRY_FILTER], alerts[0].filter_type)
+        db_user.refresh_from_db()
+        self.assertEqual(alerts_count + 1, db_user.alert_count)
+        self.assertEqual(UserRiskScoreType.get_risk_level(db_user.alert_count), db_user.risk_score)
+
+    def test_redetect_geodesic_check(self):
+        """Testing the travels near the thresholds are checked with the geodesic distance, as in the detection"""
+        # Italy -> France in 1 hour: 639.6 Km with the haversine distance, 640.7 Km with the geodesic one
+        self.config.vel_accepted = 640
+        self.config.save()
+        expected_user = User.objects.create(username="Lorena")
+        detection.check_fields(expected_user, self.fields)
+        self.assertEqual(["event_1", "event_3"], [alert.login_raw_data["id"] for alert in self.get_travel_alerts(expected_user)])
+        self.config.vel_accepted = 100000
+        self.config.save()
+        db_user = User.objects.create(username="Lorena Goldoni")
+        detection.check_fields(db_user, self.fields)
+        self.assertEqual(1, redetect_impossible_travels(vel_accepted=640, usernames=["Lorena Goldoni"], dry_run=True, mode=DistanceMode.HAVERSINE))
+        self.assertEqual(2, redetect_impossible_travels(vel_accepted=640, usernames=["Lorena Goldoni"], dry_run=True, mode=DistanceMode.GEODESIC))
+        self.assertEqual(2, redetect_impossible_travels(vel_accepted=640, usernames=["Lorena Goldoni"]))
+        alerts = self.get_travel_alerts(db_user)
+        self.assertEqual(["event_1", "event_3"], [alert.login_raw_data["id"] for alert in alerts])
+        self.assertEqual(640, alerts[0].login_raw_data["buffalogs"]["avg_speed"])
+        self.assertIn("distance covered at 640 Km/h", alerts[0].description)
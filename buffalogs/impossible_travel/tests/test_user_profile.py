@@ -0,0 +1,97 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from impossible_travel import tasks
+from impossible_travel.models import Config, Login, User, UserDetectionState, UsersIP
+from impossible_travel.modules import detection
+from impossible_travel.modules.user_profile import UserProfile
+
+
+class TestUserProfile(TestCase):
+    def setUp(self):
+        self.db_user = User.objects.create(username="Lorena")
+        base_login = {"index": "cloud", "agent": "agent", "organization": "ISP"}
+        self.fields = [
+            {**base_login, "id": "event_1", "ip": "1.1.1.1", "lat": 45.4642, "lon": 9.19, "country": "Italy", "timestamp": "2023-05-03T06:00:00.000Z"},
+            {**base_login, "id": "event_2", "ip": "2.2.2.2", "lat": 41.9028, "lon": 12.4964, "country": "Italy", "timestamp": "2023-05-03T09:00:00.000Z"},
+            {
+                **base_login,
+                "id": "event_3",
+                "ip": "3.3.3.3",
+                "lat": 48.8566,
+                "lon": 2.3522,
+                "country": "France",
+                "agent": "other agent",
+                "timestamp": "2023-05-03T20:00:00.000Z",
+            },
+        ]
+
+    def assertSameProfile(self, expected, profile):
+        self.assertEqual(expected.indexes, profile.indexes)
+        self.assertEqual(expected.agents, profile.agents)
+        self.assertEqual(expected.countries, profile.countries)
+        self.assertEqual(expected.ips, profile.ips)
+        self.assertEqual(expected.last_location, profile.last_location)
+        self.assertEqual(
+            {key: sorted(entry.pk for entry in entries) for key, entries in expected.logins.items()},
+            {key: sorted(entry.pk for entry in entries) for key, entries in profile.logins.items()},
+        )
+
+    def test_state_saved_by_detection(self):
+        """Testing the detection saves the state of the user and it is loaded with a single query, matching the Login and UsersIP rows"""
+        detection.check_fields(self.db_user, self.fields)
+        self.assertTrue(UserDetectionState.objects.filter(user=self.db_user).exists())
+        with CaptureQueriesContext(connection) as ctx:
+            profile = UserProfile.load(self.db_user)
+        self.assertEqual(1, len(ctx.captured_queries))
+        self.assertSameProfile(UserProfile.from_rows(self.db_user), profile)
+        self.assertEqual(("France", 48.8566, 2.3522), profile.last_location[:3])
+        self.assertTrue(profile.has_agent("other agent"))
+        self.assertTrue(profile.has_ip("2.2.2.2"))
+        self.assertEqual(datetime.datetime(2023, 5, 3, 9, 0, tzinfo=datetime.timezone.utc), profile.get_country_last_seen("Italy"))
+
+    def test_state_rebuilt_after_cleaning(self):
+        """Testing the cleaning of the old logins removes the state of the user, which is then rebuilt from the remaining rows"""
+        Config.objects.get_or_create(id=1)
+        detection.check_fields(self.db_user, self.fields)
+        old_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Login.objects.filter(user=self.db_user, country="France").update(updated=old_date)
+        UsersIP.objects.filter(user=self.db_user, ip="3.3.3.3").update(updated=old_date)
+        tasks.clean_models_periodically()
+        self.assertFalse(UserDetectionState.objects.filter(user=self.db_user).exists())
+        profile = UserProfile.load(self.db_user)
+        self.assertIsNone(profile.get_country_last_seen("France"))
+        self.assertFalse(profile.has_ip("3.3.3.3"))
+        self.assertEqual("Italy", profile.last_location[0])
+
+    def test_state_removed_by_clear_models(self):
+        """Testing the deletion of the Login rows out of the periodic cleaning removes the state, so the Login rows are recreated by the next batch"""
+        detection.check_fields(self.db_user, self.fields)
+        self.assertEqual(2, Login.objects.filter(user=self.db_user).count())
+        call_command("clear_models", "--model", "login", stdout=StringIO())
+        self.assertFalse(UserDetectionState.objects.filter(user=self.db_user).exists())
+        detection.check_fields(self.db_user, self.fields)
+        self.assertEqual(2, Login.objects.filter(user=self.db_user).count())
+        UsersIP.objects.filter(user=self.db_user, ip="3.3.3.3").get().delete()
+        self.assertFalse(UserDetectionState.objects.filter(user=self.db_user).exists())
+
+    def test_stale_state_rebuilt(self):
+        """Testing the state is rebuilt from the rows if its Login or UsersIP rows have been deleted without removing it"""
+        detection.check_fields(self.db_user, self.fields)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM "impossible_travel_login" WHERE "user_id" = %s AND "country" = %s', [self.db_user.id, "France"])
+        profile = UserProfile.load(self.db_user)
+        self.assertSameProfile(UserProfile.from_rows(self.db_user), profile)
+        self.assertIsNone(profile.get_country_last_seen("France"))
+        self.assertEqual(UserDetectionState.objects.get(user=self.db_user).pk, profile.state.pk)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM "impossible_travel_usersip" WHERE "user_id" = %s', [self.db_user.id])
+        self.assertFalse(UserProfile.load(self.db_user).has_ip("1.1.1.1"))
+        # the profile loaded from a consistent state keeps the state
+        detection.check_fields(self.db_user, self.fields)
+        self.assertSameProfile(UserProfile.from_rows(self.db_user), UserProfile.load(self.db_user))
+        self.assertEqual(2, Login.objects.filter(user=self.db_user).count())
@@ -43,7 +43,7 @@ class ValidatorsTest(TestCase):
 
     def test_validate_ips_or_network_valid(self):
         """Testing the function validate_ips_or_network with correct list"""
-        valid_values = ["192.0.2.0/24", "198.51.100.255", "203.0.113.0"]
+        valid_values = ["192.0.2.0/24", "198.51.100.255", "203.0.113.0", "2001:db8::1", "2001:db8::/32"]
         # no exception
         try:
             validate_ips_or_network(valid_values)
@@ -59,3 +59,7 @@ class ValidatorsTest(TestCase):
         """Testing the function validate_ips_or_network with incorrect values"""
         with self.assertRaises(ValidationError):
             validate_ips_or_network(["12.45.5"])
+        with self.assertRaises(ValidationError):
+            validate_ips_or_network(["2001:db8::/129"])
+        with self.assertRaises(ValidationError):
+            validate_ips_or_network(["192.0.2.1/24"])
@@ -233,3 +233,15 @@ class TestViews(APITestCase):
         response = self.client.get(f"{reverse('risk_score_api')}?start={start.strftime('%Y-%m-%dT%H:%M:%SZ')}&end={end.strftime('%Y-%m-%dT%H:%M:%SZ')}")
         self.assertEqual(response.status_code, 200)
         self.assertDictEqual(dict_expected_result, json.loads(response.content))
+
+    def test_get_users(self):
+        Alert.objects.create(user=User.objects.get(username="Lorygold"), name=AlertDetectionType.NEW_DEVICE, login_raw_data={}, description="Test_Description6")
+        response = self.client.get(reverse("get_users"))
+        self.assertEqual(response.status_code, 200)
+        users = {user["user"]: user for user in json.loads(json.loads(response.content))}
+        self.assertEqual(5, len(users))
+        self.assertEqual(4, users["Lorena Goldoni"]["logins_num"])
+        self.assertEqual("2023-06-20 10:08:33.358000+00:00", users["Lorena Goldoni"]["last_login"])
+        self.assertEqual(6, users["Lorena Goldoni"]["alerts_num"])
+        self.assertEqual(1, users["Lorygold"]["alerts_num"])
+        self.assertEqual(0, users["Lor"]["logins_num"])
@@ -1,5 +1,5 @@
 import re
-from ipaddress import AddressValueError, IPv4Address, IPv4Network
+from ipaddress import ip_address, ip_network
 
 from django.core.exceptions import ValidationError
 
@@ -20,14 +20,14 @@ def validate_string_or_regex(value):
 
 
 def validate_ips_or_network(value):
-    """Validator for models' fields list that must have IPs or networks"""
+    """Validator for models' fields list that must have IPs or networks, IPv4 or IPv6"""
     for item in value:
         if not isinstance(item, str):
             raise ValidationError(f"The IP address {item} must be a string")
         try:
-            IPv4Address(item)
-        except AddressValueError:
+            ip_address(item)
+        except ValueError:
             try:
-                IPv4Network(item)
-            except AddressValueError:
+                ip_network(item)
+            except ValueError:
                 raise ValidationError(f"The IP address {item} is not a valid IP")
@@ -11,9 +11,10 @@ from django.shortcuts import render
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.views.decorators.http import require_http_methods
-from elasticsearch_dsl import Search, connections
+from elasticsearch_dsl import Search
 from impossible_travel.dashboard.charts import alerts_line_chart, users_pie_chart, world_map_chart
 from impossible_travel.models import Alert, Login, User
+from impossible_travel.modules.elastic_client import get_elastic_client
 
 
 def _load_data(name):
@@ -122,7 +123,7 @@ def get_alerts(request, pk_user):
 def get_users(request):
     context = []
     users_list = User.objects.all().annotate(
-        login_count=Count("login", distinct=True), alert_count=Count("alert", distinct=True), last_login=Max("login__timestamp")
+        login_count=Count("login", distinct=True), alerts_num=Count("alert", distinct=True), last_login=Max("login__timestamp")
     )
     for user in users_list:
         tmp = {
@@ -132,7 +133,7 @@ def get_users(request):
             "risk_score": user.risk_score,
         }
         tmp["logins_num"] = user.login_count
-        tmp["alerts_num"] = user.alert_count
+        tmp["alerts_num"] = user.alerts_num
         context.append(tmp)
     return JsonResponse(json.dumps(context, default=str), safe=False)
 
@@ -140,7 +141,7 @@ def get_users(request):
 def get_all_logins(request, pk_user):
     context = []
     count = 0
-    connections.create_connection(hosts=[settings.CERTEGO_ELASTICSEARCH], timeout=90)
+    get_elastic_client()
     end_date = timezone.now()
     start_date = end_date + timedelta(days=-365)
     user_obj = User.objects.filter(id=pk_user)
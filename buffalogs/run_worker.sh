@@ -1,3 +1,3 @@
 #!/bin/bash
 
-celery -A buffalogs worker -c 1
\ No newline at end of file
+celery -A buffalogs worker -c ${BUFFALOGS_CELERY_CONCURRENCY:-1}
\ No newline at end of file